@@ -1,8 +1,10 @@
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 import os
+from typing import Tuple
 
 load_dotenv()
 
@@ -12,9 +14,52 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if DATABASE_URL and DATABASE_URL.startswith('postgresql://'):
     DATABASE_URL = DATABASE_URL.replace('postgresql://', 'postgresql+psycopg://')
 
-engine = create_engine(DATABASE_URL)
+# Connections one process may open across its three engines: size the database's
+# max_connections for DB_MAX_CONNECTIONS per API process and per worker
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "64"))
+# Share of DB_MAX_CONNECTIONS per engine, see pool_sizes()
+POOL_SHARES = {"sync": 0.45, "async": 0.45, "worker": 0.10}
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # Seconds to wait for a free connection
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # Seconds, -1 keeps connections forever
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))  # 0 disables
+# Ingestion and index builds run long statements, so the worker engine has its own timeout
+DB_WORKER_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_WORKER_STATEMENT_TIMEOUT_MS", "0"))
+
+
+def pool_sizes(pool: str) -> Tuple[int, int]:
+    """(pool_size, max_overflow) of an engine: a third of its share kept open, the rest under load"""
+    limit = max(2, int(DB_MAX_CONNECTIONS * POOL_SHARES[pool]))
+    pool_size = max(1, limit // 3)
+    return pool_size, limit - pool_size
+
+
+def engine_options(pool: str, statement_timeout_ms: int = DB_STATEMENT_TIMEOUT_MS) -> dict:
+    pool_size, max_overflow = pool_sizes(pool)
+    options = {
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+    if statement_timeout_ms:
+        options["connect_args"] = {"options": f"-c statement_timeout={statement_timeout_ms}"}
+    return options
+
+
+# Sync engine: sync routes, and background threads of the API process (caches, chat retrieval)
+engine = create_engine(DATABASE_URL, **engine_options("sync"))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Async engine: async routes await the database instead of holding a threadpool slot
+async_engine = create_async_engine(DATABASE_URL, **engine_options("async"))
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# Worker engine: python -m app.worker and maintenance jobs (index builds, migrations)
+worker_engine = create_engine(DATABASE_URL, **engine_options("worker", DB_WORKER_STATEMENT_TIMEOUT_MS))
+WorkerSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=worker_engine)
+
 Base = declarative_base()
 
 # Dependency
@@ -23,4 +68,8 @@ def get_db():
     try:
         yield db
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
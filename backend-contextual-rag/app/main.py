@@ -2,7 +2,7 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from .database import engine
 from .models import models
-from .routers import users, documents
+from .routers import users, documents, metrics, search, answers, chat
 
 # Create database tables
 models.Base.metadata.create_all(bind=engine)
@@ -16,11 +16,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],  # Keyset pagination cursor, see services/pagination.py
 )
 
 # Include routers
 app.include_router(users.router, prefix="/api/users", tags=["users"])
 app.include_router(documents.router, prefix="/api/documents", tags=["documents"])
+app.include_router(metrics.router, prefix="/api/metrics", tags=["metrics"])
+app.include_router(search.router, prefix="/api/search", tags=["search"])
+app.include_router(answers.router, prefix="/api/answers", tags=["answers"])
+app.include_router(chat.router, prefix="/api/chat", tags=["chat"])
 
 @app.get("/")
 async def root():
@@ -1,9 +1,16 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, JSON, Text
-from sqlalchemy.orm import relationship
+import os
+from sqlalchemy import Column, Computed, Integer, String, ForeignKey, DateTime, JSON, Text, Index, event, text
+from sqlalchemy.dialects.postgresql import ARRAY, BIT, TSVECTOR
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.sql import func
 from ..database import Base
 from pgvector.sqlalchemy import Vector
 
+# document_chunks partitioned by tenant (user_id), see services/partitions.py. list gives each
+# tenant its own partition and HNSW graph; hash only splits the shared graph CHUNK_PARTITIONS ways
+CHUNK_PARTITIONING = os.getenv("CHUNK_PARTITIONING", "list")  # list, hash or none
+CHUNK_PARTITIONS = int(os.getenv("CHUNK_PARTITIONS", "16"))  # Hash partitions
+
 class User(Base):
     __tablename__ = "users"
 
@@ -18,6 +25,9 @@ class User(Base):
     # Relationships
     documents = relationship("Document", back_populates="user")
 
+    # Keyset pagination of GET /api/users/, see services/pagination.py
+    __table_args__ = (Index("idx_users_created_at", "created_at", "id"),)
+
 class Document(Base):
     __tablename__ = "documents"
 
@@ -25,8 +35,9 @@ class Document(Base):
     user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'))
     file_name = Column(String(255), nullable=False)
     s3_url = Column(String(2083), nullable=False)
+    file_hash = Column(String(64), index=True)  # sha256 of the uploaded bytes
     status = Column(String(255), nullable=False)
-    metadata = Column(JSON, default={})
+    meta_data = Column("metadata", JSON, default={})  # "metadata" is reserved by declarative
     visibility = Column(String(20), default='private')
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -35,15 +46,160 @@ class Document(Base):
     user = relationship("User", back_populates="documents")
     chunks = relationship("DocumentChunk", back_populates="document")
 
+    # Keyset pagination of GET /api/documents/, per user and overall
+    __table_args__ = (
+        Index("idx_documents_user_id_created_at", "user_id", "created_at", "document_id"),
+        Index("idx_documents_created_at", "created_at", "document_id"),
+    )
+
 class DocumentChunk(Base):
     __tablename__ = "document_chunks"
 
-    chunk_id = Column(Integer, primary_key=True, index=True)
+    chunk_id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     document_id = Column(Integer, ForeignKey('documents.document_id', ondelete='CASCADE'))
+    # Copied from the document so searches scoped to a user prune to their partition; 0 when unowned.
+    # A partitioned table's primary key has to include the partition key.
+    user_id = Column(Integer, primary_key=CHUNK_PARTITIONING != "none", nullable=False, server_default="0")
+    visibility = Column(String(20), nullable=False, server_default="private")
     chunk_content = Column(Text, nullable=False)
-    vector = Column(Vector(1536))  # For OpenAI's text-embedding-3-small model
-    metadata = Column(JSON, default={})
+    # Deferred, like the other large columns below: entity loads skip them unless asked with undefer().
+    # Searches and exports select the columns they need explicitly.
+    vector = deferred(Column(Vector(1536)))  # For OpenAI's text-embedding-3-small model
+    # Compact copies for two-stage search, derived by services/chunk_writer.py; see services/compact_vectors.py
+    vector_short = deferred(Column(Vector(256)))  # Leading 256 dimensions, renormalized
+    vector_bits = deferred(Column(BIT(1536)))  # Sign bits, compared by Hamming distance
+    meta_data = deferred(Column("metadata", JSON, default={}))  # "metadata" is reserved by declarative
+    content_hash = Column(String(64))  # sha256 of normalized chunk_content, matches embedding_cache
+    chunk_index = Column(Integer)  # Position within the document
+    # Maintained by Postgres for lexical search; deferred so ORM loads never fetch it
+    content_tsv = deferred(Column(TSVECTOR, Computed("to_tsvector('english', chunk_content)", persisted=True)))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     # Relationships
-    document = relationship("Document", back_populates="chunks") 
\ No newline at end of file
+    document = relationship("Document", back_populates="chunks")
+
+    __mapper_args__ = {"primary_key": [chunk_id]}  # chunk_id alone is unique, from its sequence
+
+    # Indexes declared here are created on every partition
+    __table_args__ = (
+        # Also serves keyset pagination of a document's chunks; chunk_index is nullable, so the key
+        # puts chunks without one first instead of comparing NULLs
+        Index("idx_document_chunks_document_order", "document_id", text("coalesce(chunk_index, -1)"), "chunk_id"),
+        Index("idx_document_chunks_content_tsv", "content_tsv", postgresql_using="gin"),
+        # Cosine ANN index for search, rebuilt/retuned through services/vector_index.py
+        Index(
+            "idx_document_chunks_vector", "vector",
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"vector": "vector_cosine_ops"},
+        ),
+        Index(
+            "idx_document_chunks_vector_short", "vector_short",
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"vector_short": "vector_cosine_ops"},
+        ),
+        {"postgresql_partition_by": f"{CHUNK_PARTITIONING.upper()} (user_id)"} if CHUNK_PARTITIONING != "none" else {},
+    )
+
+@event.listens_for(DocumentChunk.__table__, "after_create")
+def _create_chunk_partitions(target, connection, **kw):
+    if CHUNK_PARTITIONING == "hash":
+        for remainder in range(CHUNK_PARTITIONS):
+            connection.execute(text(
+                f"CREATE TABLE document_chunks_p{remainder} PARTITION OF document_chunks "
+                f"FOR VALUES WITH (MODULUS {CHUNK_PARTITIONS}, REMAINDER {remainder})"
+            ))
+    elif CHUNK_PARTITIONING == "list":
+        # Tenants get their own partition on first write; unowned chunks land here
+        connection.execute(text("CREATE TABLE document_chunks_default PARTITION OF document_chunks DEFAULT"))
+
+class IndexBuild(Base):
+    __tablename__ = "index_builds"
+
+    build_id = Column(Integer, primary_key=True, index=True)
+    status = Column(String(20), nullable=False, default='queued')  # queued, running, succeeded, failed
+    method = Column(String(20), nullable=False)
+    params = Column(JSON, default={})  # lists, m, ef_construction as requested
+    result = Column(JSON)  # build_index()'s return value
+    error = Column(Text)
+    pid = Column(Integer)  # Backend holding the build lock while running, see services/index_builds.py
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
+
+class EmbeddingCacheEntry(Base):
+    __tablename__ = "embedding_cache"
+
+    # sha256 of the normalized chunk text, see services/embedding_cache.py
+    content_hash = Column(String(64), primary_key=True)
+    model = Column(String(100), primary_key=True)
+    dimension = Column(Integer, primary_key=True)
+    vector = Column(Vector(), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class QueryEmbeddingEntry(Base):
+    __tablename__ = "query_embedding_cache"
+
+    # sha256 of the normalized query, see services/query_cache.py
+    query_hash = Column(String(64), primary_key=True)
+    model = Column(String(100), primary_key=True)
+    dimension = Column(Integer, primary_key=True)
+    vector = Column(Vector(), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)  # TTL starts here
+
+class AnswerCacheEntry(Base):
+    __tablename__ = "answer_cache"
+
+    entry_id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), index=True)
+    # public only when every cited document is public, then any user may be served the answer
+    visibility = Column(String(20), nullable=False, default='private')
+    model = Column(String(100), nullable=False)  # Model that generated the answer
+    query_text = Column(Text, nullable=False)
+    vector = Column(Vector(1536), nullable=False)  # Query embedding, matched by cosine similarity
+    chunk_ids = Column(ARRAY(Integer), nullable=False)  # Chunks the answer was generated from
+    document_ids = Column(ARRAY(Integer), nullable=False)
+    # Latest updated_at of those documents when the answer was cached; any change moves it
+    sources_updated_at = Column(DateTime(timezone=True))
+    answer = Column(Text, nullable=False)
+    hits = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_hit_at = Column(DateTime(timezone=True))
+
+    __table_args__ = (
+        Index("idx_answer_cache_document_ids", "document_ids", postgresql_using="gin"),
+        Index(
+            "idx_answer_cache_vector", "vector",
+            postgresql_using="hnsw",
+            postgresql_ops={"vector": "vector_cosine_ops"},
+        ),
+    )
+
+class IngestionJob(Base):
+    __tablename__ = "ingestion_jobs"
+
+    job_id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(Integer, ForeignKey('documents.document_id', ondelete='CASCADE'), nullable=False)
+    status = Column(String(20), nullable=False, default='queued')  # queued, running, succeeded, failed
+    mode = Column(String(20), nullable=False, default='create')  # create, update (diff a new version) or rechunk (from cached conversions)
+    profile = Column(String(20), nullable=False, default='auto')  # auto, fast, balanced, full
+    chunk_max_tokens = Column(Integer)  # Chunker limit for this job; null takes the worker's CHUNK_MAX_TOKENS
+    file_name = Column(String(255), nullable=False)
+    file_url = Column(String(2083), nullable=False)  # Stored upload for this version, see services/storage.py
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    run_after = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    locked_by = Column(String(255))
+    locked_until = Column(DateTime(timezone=True))  # Visibility timeout, extended by heartbeats
+    last_error = Column(Text)
+    stages = Column(JSON, default={})  # stage name -> ISO timestamp
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
+
+    document = relationship("Document")
+
+    __table_args__ = (
+        Index("idx_ingestion_jobs_claim", "status", "run_after"),
+    )
@@ -0,0 +1,39 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+import asyncio
+from ..database import get_db
+from ..schemas import schemas
+from ..services.answer_cache import answer_cache
+from ..services.embeddings import BatchEmbedder
+from ..services.query_cache import query_cache
+
+router = APIRouter()
+
+query_embedder = BatchEmbedder()
+
+@router.post("/lookup", response_model=schemas.AnswerCacheResult)
+async def lookup_answer(request: schemas.AnswerCacheLookup, db: Session = Depends(get_db)):
+    """Cached answer to a near-identical earlier question, if its sources are unchanged"""
+    vectors, _ = await query_cache.embed([request.query], query_embedder)
+    found = await asyncio.to_thread(
+        answer_cache.lookup, db, vectors[0], request.user_id, request.model, request.threshold
+    )
+    if found is None:
+        return {"hit": False}
+    return {"hit": True, "similarity": found["similarity"], "entry": found["entry"]}
+
+@router.post("/", response_model=schemas.AnswerCacheEntry)
+async def store_answer(request: schemas.AnswerCacheStore, db: Session = Depends(get_db)):
+    """Cache a generated answer with the chunks it was generated from"""
+    vectors, _ = await query_cache.embed([request.query], query_embedder)
+    try:
+        return await asyncio.to_thread(
+            answer_cache.store, db, request.query, vectors[0], request.user_id, request.model,
+            request.chunk_ids, request.answer,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.delete("/")
+def clear_answers(user_id: int = None, db: Session = Depends(get_db)):
+    return {"deleted": answer_cache.clear(db, user_id)}
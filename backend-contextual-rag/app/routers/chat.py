@@ -0,0 +1,38 @@
+from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
+import json
+import logging
+from ..schemas import schemas
+from ..services import chat
+from ..services.embeddings import BatchEmbedder
+from ..services.llm import get_llm
+
+router = APIRouter()
+logger = logging.getLogger(__name__)
+
+query_embedder = BatchEmbedder()
+llm = get_llm()
+
+def _sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.post("/")
+async def chat_stream(request: schemas.ChatRequest):
+    """Answer from the user's documents as server-sent events: citations, token..., done"""
+    async def events():
+        try:
+            async for event, data in chat.answer_events(
+                request.query, llm, query_embedder, user_id=request.user_id, document_ids=request.document_ids,
+                k=request.k or chat.CHAT_CONTEXT_CHUNKS, mode=request.mode or chat.CHAT_RETRIEVAL_MODE,
+                history=[turn.model_dump() for turn in request.history], use_cache=request.use_cache,
+            ):
+                yield _sse(event, data)
+        except Exception as e:
+            # Headers are already sent, so failures are reported in-stream
+            logger.exception("Chat stream failed")
+            yield _sse("error", {"detail": f"{type(e).__name__}: {e}"})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",  # Stop nginx from buffering the stream
+    })
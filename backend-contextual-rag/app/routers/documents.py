@@ -1,106 +1,256 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, BackgroundTasks
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status, UploadFile, File
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, undefer
+from typing import List, Literal, Optional
 import asyncio
-from ..database import get_db
+from ..database import AsyncSessionLocal, get_async_db, get_db
 from ..models import models
 from ..schemas import schemas
-from ..services.document_processor import DocumentProcessor
+from ..services import pagination, partitions, vector_export
+from ..services.chunk_writer import copy_document_chunks
+from ..services.jobs import enqueue_job, has_active_job
+from ..services.storage import save_upload
 import json
 
 router = APIRouter()
-document_processor = DocumentProcessor()
 
-async def process_document(db: Session, document_id: int, file_content: bytes, filename: str):
-    """Process document and create chunks with embeddings"""
-    try:
-        # Get the document
-        document = db.query(models.Document).filter(models.Document.document_id == document_id).first()
-        if not document:
-            return
-
-        # Process document and get chunks with embeddings
-        processed_chunks = await document_processor.process_document(file_content, filename)
-        
-        # Save chunks to database
-        for chunk_data in processed_chunks:
-            chunk = models.DocumentChunk(
-                document_id=document_id,
-                chunk_content=chunk_data["content"],
-                metadata=chunk_data["metadata"],
-                vector=chunk_data["embedding"]
-            )
-            db.add(chunk)
-        
-        # Update document status
-        document.status = "processed"
-        db.commit()
+def _create_document(db: Session, stored, filename: str, user_id: Optional[int], profile: str) -> models.Document:
+    # The same user uploading the same bytes again gets the existing document back
+    existing = db.query(models.Document).filter(
+        models.Document.user_id == user_id,
+        models.Document.file_hash == stored.sha256,
+        models.Document.status != "failed"
+    ).first()
+    if existing:
+        return existing
 
-    except Exception as e:
-        document.status = "failed"
-        document.metadata = {"error": str(e)}
-        db.commit()
-        raise
+    # Identical bytes already processed for someone else: reuse their chunks, skip conversion
+    source = db.query(models.Document).filter(
+        models.Document.file_hash == stored.sha256,
+        models.Document.status == "processed"
+    ).first()
+    if source:
+        # Before the insert below: creating the partition share-locks documents
+        partitions.ensure_tenant(db, user_id or 0)
 
-@router.post("/", response_model=schemas.Document)
-async def create_document(
-    background_tasks: BackgroundTasks,
-    file: UploadFile = File(...),
-    user_id: int = None,
-    db: Session = Depends(get_db)
-):
-    # Read file content
-    content = await file.read()
-    
     document = models.Document(
         user_id=user_id,
-        file_name=file.filename,
-        s3_url="local://" + file.filename,  # In production, use actual S3
+        file_name=filename,
+        s3_url=stored.url,
+        file_hash=stored.sha256,
         status="processing",
-        metadata={
-            "original_name": file.filename,
-            "content_length": len(content)
+        meta_data={
+            "original_name": filename,
+            "content_length": stored.size
         }
     )
-    
     db.add(document)
+    db.flush()
+
+    if source:
+        copied = copy_document_chunks(db, source.document_id, document.document_id)
+        document.status = "processed"
+        document.meta_data = {**document.meta_data, "duplicate_of": source.document_id, "progress": {"chunks_saved": copied}}
+    else:
+        # Queue processing in the same transaction, a worker (python -m app.worker) picks it up
+        enqueue_job(db, document.document_id, filename, stored.url, profile=profile)
     db.commit()
     db.refresh(document)
-    
-    # Add document processing to background tasks
-    background_tasks.add_task(
-        process_document,
-        db,
-        document.document_id,
-        content,
-        file.filename
-    )
-    
     return document
 
-@router.get("/", response_model=List[schemas.Document])
-def read_documents(
-    skip: int = 0,
-    limit: int = 100,
+# Uploads are awaited on the loop; the session work, which for a duplicate copies every chunk
+# and vector of the source document, runs in a thread so other requests keep being served
+@router.post("/", response_model=schemas.Document)
+async def create_document(
+    file: UploadFile = File(...),
     user_id: int = None,
+    profile: schemas.IngestProfile = "auto",
     db: Session = Depends(get_db)
 ):
-    query = db.query(models.Document)
-    if user_id:
+    # Stream the upload to storage, hashing it on the way
+    stored = await save_upload(file)
+    return await asyncio.to_thread(_create_document, db, stored, file.filename, user_id, profile)
+
+def _get_updatable(db: Session, document_id: int) -> models.Document:
+    document = db.query(models.Document).filter(models.Document.document_id == document_id).first()
+    if document is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    if has_active_job(db, document_id):
+        raise HTTPException(status_code=409, detail="Document is still being processed")
+    return document
+
+def _update_document(db: Session, document: models.Document, stored, filename: str, profile: str) -> models.Document:
+    if stored.sha256 == document.file_hash and document.status == "processed":
+        return document  # Byte-identical to the current version
+
+    document.file_name = filename
+    document.s3_url = stored.url
+    document.file_hash = stored.sha256
+    document.status = "processing"
+    document.meta_data = {
+        **(document.meta_data or {}),
+        "original_name": filename,
+        "content_length": stored.size,
+        "version": (document.meta_data or {}).get("version", 1) + 1
+    }
+    enqueue_job(db, document.document_id, filename, stored.url, mode="update", profile=profile)
+    db.commit()
+    db.refresh(document)
+    return document
+
+@router.put("/{document_id}", response_model=schemas.Document)
+async def update_document(
+    document_id: int,
+    file: UploadFile = File(...),
+    profile: schemas.IngestProfile = "auto",
+    db: Session = Depends(get_db)
+):
+    """Upload a new version; only changed chunks are re-embedded"""
+    document = await asyncio.to_thread(_get_updatable, db, document_id)
+    stored = await save_upload(file)
+    return await asyncio.to_thread(_update_document, db, document, stored, file.filename, profile)
+
+def _enqueue_rechunk(db: Session, document: models.Document, max_tokens: Optional[int]) -> models.IngestionJob:
+    # The profile it was converted with, so the cached artifacts match
+    profile = (document.meta_data or {}).get("profile", "auto")
+    document.status = "processing"
+    return enqueue_job(db, document.document_id, document.file_name, document.s3_url, mode="rechunk", profile=profile,
+                       chunk_max_tokens=max_tokens)
+
+@router.post("/rechunk")
+def rechunk_documents(user_id: int = None, max_tokens: Optional[int] = Query(None, ge=16),
+                      db: Session = Depends(get_db)):
+    """Rebuild chunks of every processed document from cached conversions with max_tokens per chunk
+    (the workers' CHUNK_MAX_TOKENS when not given)"""
+    query = db.query(models.Document).filter(
+        models.Document.status == "processed",
+        models.Document.s3_url.isnot(None)
+    )
+    if user_id is not None:
         query = query.filter(models.Document.user_id == user_id)
-    documents = query.offset(skip).limit(limit).all()
+    queued = 0
+    for document in query.all():
+        if not has_active_job(db, document.document_id):
+            _enqueue_rechunk(db, document, max_tokens)
+            queued += 1
+    db.commit()
+    return {"queued": queued}
+
+@router.post("/{document_id}/rechunk", response_model=schemas.IngestionJob)
+def rechunk_document(document_id: int, max_tokens: Optional[int] = Query(None, ge=16),
+                     db: Session = Depends(get_db)):
+    document = db.query(models.Document).filter(models.Document.document_id == document_id).first()
+    if document is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    if has_active_job(db, document_id):
+        raise HTTPException(status_code=409, detail="Document is still being processed")
+    if document.s3_url is None:
+        raise HTTPException(status_code=400, detail="Document has no stored file")
+    job = _enqueue_rechunk(db, document, max_tokens)
+    db.commit()
+    db.refresh(job)
+    return job
+
+# Read routes await the async engine instead of holding a threadpool slot per request
+@router.get("/", response_model=List[schemas.Document])
+async def read_documents(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=pagination.MAX_PAGE_SIZE),
+    user_id: int = None,
+    skip: int = Query(0, ge=0, deprecated=True),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Newest first; pass the X-Next-Cursor response header as cursor for the next page"""
+    query = select(models.Document)
+    if user_id:
+        query = query.where(models.Document.user_id == user_id)
+    key = (models.Document.created_at, models.Document.document_id)
+    try:
+        query = pagination.keyset(query, key, cursor, limit, descending=True)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if skip and not cursor:
+        query = query.offset(skip)
+    documents, next_cursor = pagination.page(
+        (await db.scalars(query)).all(), limit, lambda document: (document.created_at, document.document_id)
+    )
+    if next_cursor:
+        response.headers[pagination.NEXT_CURSOR_HEADER] = next_cursor
     return documents
 
+@router.get("/vectors")
+async def export_vectors(user_id: int, dtype: Literal["float16", "float32"] = "float32"):
+    """A tenant's chunk ids and vectors as one .npy structured array, see services/vector_export.py"""
+    return _npy_response(vector_export.export_npy(user_id=user_id, dtype=dtype), f"user-{user_id}-vectors.npy")
+
+@router.get("/{document_id}/vectors")
+async def export_document_vectors(
+    document_id: int,
+    dtype: Literal["float16", "float32"] = "float32",
+    db: AsyncSession = Depends(get_async_db)
+):
+    """A document's chunk ids and vectors as one .npy structured array"""
+    if await db.get(models.Document, document_id) is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return _npy_response(vector_export.export_npy(document_id=document_id, dtype=dtype),
+                         f"document-{document_id}-vectors.npy")
+
+def _npy_response(body, filename: str) -> StreamingResponse:
+    return StreamingResponse(body, media_type="application/octet-stream", headers={
+        "Content-Disposition": f'attachment; filename="{filename}"',
+    })
+
 @router.get("/{document_id}", response_model=schemas.Document)
-def read_document(document_id: int, db: Session = Depends(get_db)):
-    document = db.query(models.Document).filter(models.Document.document_id == document_id).first()
+async def read_document(document_id: int, db: AsyncSession = Depends(get_async_db)):
+    document = await db.get(models.Document, document_id)
     if document is None:
         raise HTTPException(status_code=404, detail="Document not found")
     return document
 
 @router.get("/{document_id}/chunks", response_model=List[schemas.DocumentChunk])
-def read_document_chunks(document_id: int, db: Session = Depends(get_db)):
-    chunks = db.query(models.DocumentChunk).filter(
+async def read_document_chunks(
+    document_id: int,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=pagination.MAX_PAGE_SIZE),
+    format: Literal["json", "ndjson"] = "json",
+    db: AsyncSession = Depends(get_async_db)
+):
+    """In document order, a page at a time; format=ndjson streams every chunk after the cursor instead"""
+    # chunk_index may be NULL, which a row comparison never passes: the key orders those first as -1
+    key = (func.coalesce(models.DocumentChunk.chunk_index, -1), models.DocumentChunk.chunk_id)
+    # Only the columns of schemas.DocumentChunk: vector stays deferred, metadata is returned
+    query = select(models.DocumentChunk).options(undefer(models.DocumentChunk.meta_data)).where(
         models.DocumentChunk.document_id == document_id
-    ).all()
-    return chunks 
\ No newline at end of file
+    )
+    try:
+        query = pagination.keyset(query, key, cursor, None if format == "ndjson" else limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if format == "ndjson":
+        return StreamingResponse(_stream_chunks(query), media_type="application/x-ndjson")
+    chunks, next_cursor = pagination.page(
+        (await db.scalars(query)).all(), limit,
+        lambda chunk: (-1 if chunk.chunk_index is None else chunk.chunk_index, chunk.chunk_id)
+    )
+    if next_cursor:
+        response.headers[pagination.NEXT_CURSOR_HEADER] = next_cursor
+    return chunks
+
+async def _stream_chunks(query):
+    # Own session: the request's is closed before the body is sent. A server-side cursor
+    # fetches yield_per rows at a time, so memory does not grow with the document.
+    async with AsyncSessionLocal() as db:
+        rows = await db.stream_scalars(query.execution_options(yield_per=500))
+        async for chunk in rows:
+            yield schemas.DocumentChunk.model_validate(chunk).model_dump_json() + "\n"
+
+@router.get("/{document_id}/jobs", response_model=List[schemas.IngestionJob])
+async def read_document_jobs(document_id: int, db: AsyncSession = Depends(get_async_db)):
+    jobs = (await db.scalars(select(models.IngestionJob).where(
+        models.IngestionJob.document_id == document_id
+    ).order_by(models.IngestionJob.job_id))).all()
+    return jobs
@@ -0,0 +1,24 @@
+from fastapi import APIRouter
+from ..services.answer_cache import answer_cache
+from ..services.chat import chat_metrics
+from ..services.embedding_cache import embedding_cache
+from ..services.query_cache import query_cache
+
+router = APIRouter()
+
+@router.get("/embedding-cache")
+def read_embedding_cache_stats():
+    return embedding_cache.stats()
+
+@router.get("/query-cache")
+def read_query_cache_stats():
+    return query_cache.stats()
+
+@router.get("/answer-cache")
+def read_answer_cache_stats():
+    return answer_cache.stats()
+
+@router.get("/chat")
+def read_chat_stats():
+    """p50/p95 of retrieval, first-token, generation and total latency of recent responses"""
+    return chat_metrics.stats()
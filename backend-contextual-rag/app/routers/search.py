@@ -0,0 +1,119 @@
+from fastapi import APIRouter, Depends, HTTPException, Response
+from sqlalchemy.orm import Session
+from typing import Optional
+import asyncio
+import time
+from ..database import get_db
+from ..schemas import schemas
+from ..services import hybrid_search, index_builds, local_index, partitions, rerank, vector_index
+from ..services.embeddings import BatchEmbedder
+from ..services.query_cache import query_cache
+
+router = APIRouter()
+
+query_embedder = BatchEmbedder()
+
+@router.post("/", response_model=schemas.SearchResponse)
+async def search(request: schemas.SearchRequest, db: Session = Depends(get_db)):
+    """Top-k chunks for the query by vector similarity, full-text rank or both"""
+    if request.engine == "local" and (request.mode != "vector" or request.user_id is None):
+        raise HTTPException(status_code=400, detail="The local engine serves vector searches scoped to a user_id")
+    start = time.perf_counter()
+    filters = {"user_id": request.user_id, "document_ids": request.document_ids}
+    # With reranking the first stage fetches a larger pool and the cross-encoder picks the top k
+    k = max(request.k, request.rerank_candidates or rerank.RERANK_CANDIDATES) if request.rerank else request.k
+    if request.mode == "lexical":
+        results = await asyncio.to_thread(
+            hybrid_search.lexical_search, db, request.query, k, **filters, match_all=request.match_all
+        )
+    else:
+        vectors, _ = await query_cache.embed([request.query], query_embedder)
+        if request.mode == "hybrid":
+            results = await asyncio.to_thread(
+                hybrid_search.hybrid_search, db, request.query, vectors[0], k, **filters,
+                vector_weight=request.vector_weight, lexical_weight=request.lexical_weight,
+                rrf_k=request.rrf_k, candidates=request.candidates or hybrid_search.HYBRID_CANDIDATES,
+                ef_search=request.ef_search, probes=request.probes, match_all=request.match_all,
+            )
+        elif request.engine == "local":
+            results = await asyncio.to_thread(
+                local_index.search, db, request.user_id, vectors[0], k, document_ids=request.document_ids
+            )
+        elif request.coarse:
+            results = await asyncio.to_thread(
+                vector_index.two_stage_search, db, vectors[0], k, coarse=request.coarse,
+                candidates=request.candidates, **filters, ef_search=request.ef_search,
+            )
+        else:
+            results = await asyncio.to_thread(
+                vector_index.search, db, vectors[0], k, **filters,
+                ef_search=request.ef_search, probes=request.probes, exact=request.exact,
+            )
+    rerank_stats = None
+    if request.rerank:
+        results, rerank_stats = await asyncio.to_thread(
+            rerank.reranker.rerank, request.query, results, request.k,
+            request.rerank_budget_ms or rerank.RERANK_BUDGET_MS,
+        )
+    return {"results": results, "took_ms": round((time.perf_counter() - start) * 1000, 2), "rerank": rerank_stats}
+
+@router.get("/index")
+def read_index(db: Session = Depends(get_db)):
+    return vector_index.index_info(db)
+
+@router.post("/index", response_model=schemas.IndexBuild, status_code=202)
+def build_index(request: schemas.VectorIndexBuild, response: Response, db: Session = Depends(get_db)):
+    """Start building or rebuilding the vector index; poll the Location for its status"""
+    try:
+        build = index_builds.start_build(
+            db, request.method, lists=request.lists, m=request.m, ef_construction=request.ef_construction
+        )
+    except index_builds.BuildRunning as e:
+        raise HTTPException(status_code=409, detail=str(e), headers={
+            "Location": f"/api/search/index/builds/{e.build.build_id}"
+        })
+    response.headers["Location"] = f"/api/search/index/builds/{build.build_id}"
+    return index_builds.build_status(db, build.build_id)
+
+@router.get("/index/builds/{build_id}", response_model=schemas.IndexBuild)
+def read_index_build(build_id: int, db: Session = Depends(get_db)):
+    """queued, running (with pg_stat_progress_create_index), succeeded with the result, or failed"""
+    status = index_builds.build_status(db, build_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Index build not found")
+    return status
+
+@router.get("/index/recall")
+def read_index_recall(
+    k: int = 10,
+    sample: int = 50,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    """recall@k and latency of the index against exact search, on stored vectors as queries"""
+    return vector_index.recall(db, k=k, sample=sample, ef_search=ef_search, probes=probes)
+
+@router.get("/storage")
+def read_storage(db: Session = Depends(get_db)):
+    """Bytes held by the full, 256-d and binary vectors and their indexes"""
+    return vector_index.storage(db)
+
+@router.post("/storage/backfill")
+def backfill_compact(db: Session = Depends(get_db)):
+    """Derive the compact vector copies for chunks stored before they existed"""
+    return {"updated": vector_index.backfill_compact(db)}
+
+@router.get("/partitions")
+def read_partitions(db: Session = Depends(get_db)):
+    """Rows, tenants and bytes of each document_chunks partition"""
+    return {"partitioning": partitions.CHUNK_PARTITIONING, "partitions": partitions.partitions(db)}
+
+@router.get("/local/{user_id}")
+def read_local_index(user_id: int):
+    return local_index.read_meta(local_index.user_dir(user_id)) or {"user_id": user_id, "exists": False}
+
+@router.post("/local/{user_id}/sync")
+def sync_local_index(user_id: int, db: Session = Depends(get_db)):
+    """Export new chunks and tombstone deleted ones in the user's local index"""
+    return local_index.sync_user(db, user_id)
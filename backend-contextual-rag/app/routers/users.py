@@ -1,9 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from ..database import get_db
 from ..models import models
 from ..schemas import schemas
+from ..services import pagination
 from passlib.context import CryptContext
 
 router = APIRouter()
@@ -27,8 +29,24 @@ def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
     return db_user
 
 @router.get("/", response_model=List[schemas.User])
-def read_users(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    users = db.query(models.User).offset(skip).limit(limit).all()
+def read_users(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=pagination.MAX_PAGE_SIZE),
+    skip: int = Query(0, ge=0, deprecated=True),
+    db: Session = Depends(get_db)
+):
+    """Newest first; pass the X-Next-Cursor response header as cursor for the next page"""
+    try:
+        query = pagination.keyset(select(models.User), (models.User.created_at, models.User.id), cursor, limit,
+                                  descending=True)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if skip and not cursor:
+        query = query.offset(skip)
+    users, next_cursor = pagination.page(db.scalars(query).all(), limit, lambda user: (user.created_at, user.id))
+    if next_cursor:
+        response.headers[pagination.NEXT_CURSOR_HEADER] = next_cursor
     return users
 
 @router.get("/{user_id}", response_model=schemas.User)
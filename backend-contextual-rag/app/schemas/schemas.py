@@ -1,7 +1,10 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, Dict, List
+from pydantic import BaseModel, EmailStr, Field, AliasChoices
+from typing import Optional, Dict, List, Literal
 from datetime import datetime
 
+# Docling pipeline per upload, see services/conversion.py
+IngestProfile = Literal["auto", "fast", "balanced", "full"]
+
 # User schemas
 class UserBase(BaseModel):
     email: EmailStr
@@ -23,7 +26,8 @@ class User(UserBase):
 class DocumentBase(BaseModel):
     file_name: str
     visibility: str = 'private'
-    metadata: Dict = {}
+    # ORM objects expose the column as meta_data, see models.py
+    metadata: Dict = Field(default={}, validation_alias=AliasChoices("meta_data", "metadata"))
 
 class DocumentCreate(DocumentBase):
     pass
@@ -42,7 +46,8 @@ class Document(DocumentBase):
 # Document Chunk schemas
 class DocumentChunkBase(BaseModel):
     chunk_content: str
-    metadata: Dict = {}
+    # ORM objects expose the column as meta_data, see models.py
+    metadata: Dict = Field(default={}, validation_alias=AliasChoices("meta_data", "metadata"))
 
 class DocumentChunkCreate(DocumentChunkBase):
     document_id: int
@@ -53,4 +58,137 @@ class DocumentChunk(DocumentChunkBase):
     created_at: datetime
 
     class Config:
-        from_attributes = True 
\ No newline at end of file
+        from_attributes = True
+
+# Ingestion job schemas
+class IngestionJob(BaseModel):
+    job_id: int
+    document_id: int
+    status: str
+    mode: str
+    profile: str
+    chunk_max_tokens: Optional[int] = None
+    attempts: int
+    max_attempts: int
+    run_after: datetime
+    locked_by: Optional[str] = None
+    last_error: Optional[str] = None
+    stages: Dict = {}
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+# Search schemas
+class SearchRequest(BaseModel):
+    query: str
+    k: int = Field(default=10, ge=1, le=200)
+    user_id: Optional[int] = None
+    document_ids: Optional[List[int]] = None
+    # Per-query index tuning, see services/vector_index.py
+    ef_search: Optional[int] = Field(default=None, ge=1, le=1000)
+    probes: Optional[int] = Field(default=None, ge=1)
+    exact: bool = False
+    # vector, lexical (full-text) or hybrid (both, fused with reciprocal rank fusion)
+    mode: Literal["vector", "lexical", "hybrid"] = "vector"
+    vector_weight: float = Field(default=1.0, ge=0)
+    lexical_weight: float = Field(default=1.0, ge=0)
+    rrf_k: int = Field(default=60, ge=1)
+    candidates: Optional[int] = Field(default=None, ge=1, le=1000)  # hybrid: per leg, two-stage: shortlist
+    match_all: bool = False  # lexical: require every query term instead of any
+    # pgvector, or local: the user's memory-mapped index in this process (vector mode, needs user_id)
+    engine: Literal["pgvector", "local"] = "pgvector"
+    # vector mode on pgvector: shortlist on the 256-d or binary copy, then rescore with the full vector
+    coarse: Optional[Literal["short", "binary"]] = None
+    # Rerank the top rerank_candidates with a cross-encoder, see services/rerank.py
+    rerank: bool = False
+    rerank_candidates: Optional[int] = Field(default=None, ge=1, le=200)
+    rerank_budget_ms: Optional[float] = Field(default=None, gt=0)
+
+class SearchResult(BaseModel):
+    chunk_id: int
+    document_id: int
+    chunk_index: Optional[int] = None
+    chunk_content: str
+    metadata: Dict = {}
+    distance: Optional[float] = None
+    score: float
+    vector_rank: Optional[int] = None
+    lexical_rank: Optional[int] = None
+    rerank_score: Optional[float] = None
+
+class SearchResponse(BaseModel):
+    results: List[SearchResult]
+    took_ms: float
+    rerank: Optional[Dict] = None  # model, candidates, scored, timed_out, ms
+
+class VectorIndexBuild(BaseModel):
+    method: Literal["hnsw", "ivfflat"] = "hnsw"
+    lists: Optional[int] = Field(default=None, ge=1)
+    m: int = Field(default=16, ge=2, le=100)
+    ef_construction: int = Field(default=64, ge=4, le=1000)
+
+class IndexBuild(BaseModel):
+    build_id: int
+    status: str
+    method: str
+    params: Dict = {}
+    result: Optional[Dict] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    progress: List[Dict] = []  # pg_stat_progress_create_index while running
+
+    class Config:
+        from_attributes = True
+
+# Semantic answer cache, see services/answer_cache.py
+class AnswerCacheLookup(BaseModel):
+    query: str
+    user_id: int
+    model: str  # Model the answer would be generated with
+    threshold: Optional[float] = Field(default=None, ge=0, le=1)  # cosine similarity
+
+class AnswerCacheStore(BaseModel):
+    query: str
+    user_id: int
+    model: str
+    chunk_ids: List[int] = Field(min_length=1)  # Chunks the answer was generated from
+    answer: str
+
+class AnswerCacheEntry(BaseModel):
+    entry_id: int
+    user_id: Optional[int] = None
+    visibility: str
+    model: str
+    query_text: str
+    chunk_ids: List[int]
+    document_ids: List[int]
+    answer: str
+    hits: int
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class AnswerCacheResult(BaseModel):
+    hit: bool
+    similarity: Optional[float] = None
+    entry: Optional[AnswerCacheEntry] = None
+
+# Chat, see services/chat.py
+class ChatTurn(BaseModel):
+    role: Literal["user", "assistant"]
+    content: str
+
+class ChatRequest(BaseModel):
+    query: str
+    user_id: Optional[int] = None
+    document_ids: Optional[List[int]] = None
+    k: Optional[int] = Field(default=None, ge=1, le=20)  # Context chunks, CHAT_CONTEXT_CHUNKS by default
+    mode: Optional[Literal["vector", "lexical", "hybrid"]] = None
+    history: List[ChatTurn] = []  # Earlier turns of the conversation, oldest first
+    use_cache: bool = True  # Semantic answer cache, standalone questions only
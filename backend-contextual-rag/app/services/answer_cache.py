@@ -0,0 +1,151 @@
+"""Semantic cache of generated answers.
+
+An entry stores the query embedding, the chunks the answer was generated from
+and the answer. A new query gets the cached answer when its embedding is
+within ANSWER_CACHE_THRESHOLD cosine similarity of an entry the user may see:
+their own entries, or public ones (every cited document public). An entry is
+only served while all its chunks exist and their documents' updated_at is the
+one recorded with it; ingestion also drops the entries of a document up front.
+"""
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+
+from ..models import models
+
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))  # cosine similarity
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", str(7 * 86400)))  # seconds
+ANSWER_CACHE_CANDIDATES = 5  # Nearest entries checked before giving up
+
+
+class SemanticAnswerCache:
+    def __init__(self, threshold: float = ANSWER_CACHE_THRESHOLD, ttl: int = ANSWER_CACHE_TTL):
+        self.threshold = threshold
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0  # Entries dropped at lookup because their sources changed
+
+    def _count(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    @staticmethod
+    def _visible(user_id: int):
+        Chunk = models.DocumentChunk
+        return or_(Chunk.user_id == user_id, Chunk.visibility == "public")
+
+    @staticmethod
+    def owners(db: Session, entry: models.AnswerCacheEntry) -> List[int]:
+        """Tenants whose partitions hold the entry's chunks, to prune lookups by chunk_id"""
+        return [owner for (owner,) in db.query(func.coalesce(models.Document.user_id, 0)).filter(
+            models.Document.document_id.in_(entry.document_ids)
+        ).distinct()]
+
+    def _valid(self, db: Session, entry: models.AnswerCacheEntry, user_id: int) -> bool:
+        """Every cited chunk still exists, is visible to the user and its document is unchanged"""
+        Chunk = models.DocumentChunk
+        # Compared for equality: now() is the transaction start, so ordering against created_at can lie
+        count, updated_at = db.query(func.count(Chunk.chunk_id), func.max(models.Document.updated_at)).join(
+            models.Document, models.Document.document_id == Chunk.document_id
+        ).filter(
+            Chunk.user_id.in_(self.owners(db, entry)), Chunk.chunk_id.in_(entry.chunk_ids), self._visible(user_id)
+        ).one()
+        return count == len(entry.chunk_ids) and updated_at == entry.sources_updated_at
+
+    def lookup(self, db: Session, query_vector: Sequence[float], user_id: int, model: str,
+               threshold: Optional[float] = None) -> Optional[Dict]:
+        Entry = models.AnswerCacheEntry
+        threshold = self.threshold if threshold is None else threshold
+        distance = Entry.vector.cosine_distance(np.asarray(query_vector, dtype=np.float32)).label("distance")
+        candidates = db.query(Entry, distance).filter(
+            Entry.model == model,
+            or_(Entry.user_id == user_id, Entry.visibility == "public"),
+            Entry.created_at > datetime.now(timezone.utc) - timedelta(seconds=self.ttl),
+        ).order_by(distance).limit(ANSWER_CACHE_CANDIDATES).all()
+
+        stale = 0
+        for entry, entry_distance in candidates:
+            similarity = 1.0 - float(entry_distance)
+            if similarity < threshold:
+                break
+            if not self._valid(db, entry, user_id):
+                db.delete(entry)
+                stale += 1
+                continue
+            entry.hits += 1
+            entry.last_hit_at = datetime.now(timezone.utc)
+            db.commit()
+            self._count(hits=1, stale=stale)
+            return {"entry": entry, "similarity": similarity}
+        db.commit()
+        self._count(misses=1, stale=stale)
+        return None
+
+    def store(self, db: Session, query: str, query_vector: Sequence[float], user_id: int, model: str,
+              chunk_ids: List[int], answer: str) -> models.AnswerCacheEntry:
+        """Cache an answer; raises ValueError if a chunk is gone or not visible to the user"""
+        Chunk = models.DocumentChunk
+        chunk_ids = list(dict.fromkeys(chunk_ids))
+        cited = db.query(
+            Chunk.chunk_id, models.Document.document_id, models.Document.visibility, models.Document.updated_at
+        ).join(models.Document, models.Document.document_id == Chunk.document_id)
+        # The user's own chunks come from their partition; only the rest are looked for among public ones
+        sources = cited.filter(Chunk.user_id == user_id, Chunk.chunk_id.in_(chunk_ids)).all()
+        others = set(chunk_ids) - {row.chunk_id for row in sources}
+        if others:
+            sources += cited.filter(Chunk.visibility == "public", Chunk.chunk_id.in_(others)).all()
+        if len(sources) != len(chunk_ids):
+            missing = set(chunk_ids) - {row.chunk_id for row in sources}
+            raise ValueError(f"Unknown chunks: {sorted(missing)}")
+        entry = models.AnswerCacheEntry(
+            user_id=user_id,
+            visibility="public" if sources and all(row.visibility == "public" for row in sources) else "private",
+            model=model,
+            query_text=query,
+            vector=np.asarray(query_vector, dtype=np.float32),
+            chunk_ids=chunk_ids,
+            document_ids=sorted({row.document_id for row in sources}),
+            sources_updated_at=max(row.updated_at for row in sources),
+            answer=answer,
+        )
+        db.add(entry)
+        db.commit()
+        db.refresh(entry)
+        return entry
+
+    def invalidate_documents(self, db: Session, document_ids: List[int]) -> int:
+        """Delete entries citing any of the documents; the caller commits"""
+        Entry = models.AnswerCacheEntry
+        return db.query(Entry).filter(Entry.document_ids.overlap(list(document_ids))).delete(
+            synchronize_session=False
+        )
+
+    def clear(self, db: Session, user_id: Optional[int] = None) -> int:
+        query = db.query(models.AnswerCacheEntry)
+        if user_id is not None:
+            query = query.filter(models.AnswerCacheEntry.user_id == user_id)
+        deleted = query.delete(synchronize_session=False)
+        db.commit()
+        return deleted
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "threshold": self.threshold,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+answer_cache = SemanticAnswerCache()
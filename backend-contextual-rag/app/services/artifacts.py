@@ -0,0 +1,112 @@
+"""Cache of converted DoclingDocuments, so chunking can be redone without parsing the PDF again.
+
+Artifacts are gzipped DoclingDocument JSON stored under
+<ARTIFACT_DIR>/<converter version>/<profile>/<sha[:2]>/<sha>/<page range>.json.gz.
+The converter version includes the docling packages, so an upgrade starts a
+fresh cache. A manifest.json is written next to them once every page range of a
+file has been converted; re-chunk jobs plan from it and never open the PDF.
+Like conversion.py this module doesn't import the database.
+"""
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import zlib
+from functools import lru_cache
+from importlib import metadata
+from typing import List, Optional, Tuple
+
+from docling_core.types.doc import DoclingDocument
+
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", os.path.join(os.getenv("UPLOAD_DIR", "uploads"), "artifacts"))
+CONVERSION_ARTIFACTS = os.getenv("CONVERSION_ARTIFACTS", "true").lower() == "true"
+# Bump to invalidate artifacts when pipeline options change without a package upgrade
+ARTIFACT_FORMAT = os.getenv("ARTIFACT_FORMAT", "1")
+
+PageRange = Tuple[int, int]
+
+
+@lru_cache(maxsize=None)
+def converter_version() -> str:
+    versions = []
+    for package in ("docling", "docling-core", "docling-ibm-models"):
+        try:
+            versions.append(f"{package}-{metadata.version(package)}")
+        except metadata.PackageNotFoundError:
+            continue
+    return "_".join(versions + [f"v{ARTIFACT_FORMAT}"])
+
+
+def file_sha256(path: str, chunk_size: int = 1024 * 1024) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while data := f.read(chunk_size):
+            hasher.update(data)
+    return hasher.hexdigest()
+
+
+def artifact_dir(file_hash: str, profile: str) -> str:
+    return os.path.join(ARTIFACT_DIR, converter_version(), profile, file_hash[:2], file_hash)
+
+
+def artifact_path(file_hash: str, profile: str, page_range: Optional[PageRange] = None) -> str:
+    name = "all" if page_range is None else f"p{page_range[0]:05d}-{page_range[1]:05d}"
+    return os.path.join(artifact_dir(file_hash, profile), f"{name}.json.gz")
+
+
+def _write_atomic(path: str, data: bytes):
+    # Several workers may convert the same file, readers must never see half an artifact
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, "wb") as out:
+            out.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def save(document: DoclingDocument, path: str):
+    _write_atomic(path, gzip.compress(document.model_dump_json().encode("utf-8")))
+
+
+def load(path: str, discard_corrupt: bool = True) -> Optional[DoclingDocument]:
+    """The cached document, or None if there is no usable artifact at path.
+
+    A truncated or corrupt artifact is deleted so the caller converts again and
+    rewrites it; with discard_corrupt=False (no source to convert from) the
+    error propagates instead.
+    """
+    try:
+        with gzip.open(path, "rb") as f:
+            return DoclingDocument.model_validate_json(f.read())
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, ValueError, zlib.error):
+        if not discard_corrupt:
+            raise
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass  # Another worker discarded it first
+        return None
+
+
+def write_manifest(file_hash: str, profile: str, ranges: List[Optional[PageRange]]):
+    manifest = {"ranges": [list(page_range) if page_range else None for page_range in ranges]}
+    _write_atomic(os.path.join(artifact_dir(file_hash, profile), "manifest.json"), json.dumps(manifest).encode())
+
+
+def read_manifest(file_hash: str, profile: str) -> Optional[List[Optional[PageRange]]]:
+    """Page ranges of a fully converted file, or None if it hasn't been converted with this version"""
+    try:
+        with open(os.path.join(artifact_dir(file_hash, profile), "manifest.json")) as f:
+            ranges = [tuple(page_range) if page_range else None for page_range in json.load(f)["ranges"]]
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+    if not all(os.path.exists(artifact_path(file_hash, profile, page_range)) for page_range in ranges):
+        return None
+    return ranges
@@ -0,0 +1,187 @@
+"""Retrieval-augmented chat as a stream of events.
+
+answer_events() yields (event, data) pairs for the SSE endpoint: "citations"
+as soon as retrieval is done, a "token" per generated piece of text, then
+"done" with the timings of the response. Near-duplicate questions are answered
+from the semantic answer cache when the user is known.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from ..database import SessionLocal
+from ..models import models
+from . import hybrid_search, vector_index
+from .answer_cache import answer_cache
+from .embeddings import BatchEmbedder
+from .query_cache import query_cache
+
+CHAT_CONTEXT_CHUNKS = int(os.getenv("CHAT_CONTEXT_CHUNKS", "5"))
+CHAT_RETRIEVAL_MODE = os.getenv("CHAT_RETRIEVAL_MODE", "hybrid")  # vector, lexical or hybrid
+CHAT_ANSWER_CACHE = os.getenv("CHAT_ANSWER_CACHE", "true").lower() == "true"
+
+SYSTEM_PROMPT = (
+    "You answer questions about the user's documents. Use only the numbered context passages, "
+    "cite the passages you use as [n], and say so when the context does not contain the answer."
+)
+
+
+def retrieve(query: str, query_vector: Sequence[float], k: int, mode: str, user_id: Optional[int],
+             document_ids: Optional[List[int]]) -> List[Dict]:
+    filters = {"user_id": user_id, "document_ids": document_ids}
+    with SessionLocal() as db:
+        if mode == "lexical":
+            results = hybrid_search.lexical_search(db, query, k, **filters)
+        elif mode == "hybrid":
+            results = hybrid_search.hybrid_search(db, query, query_vector, k, **filters)
+        else:
+            results = vector_index.search(db, query_vector, k, **filters)
+        return _with_file_names(db, results)
+
+
+def _with_file_names(db, results: List[Dict]) -> List[Dict]:
+    names = dict(db.query(models.Document.document_id, models.Document.file_name).filter(
+        models.Document.document_id.in_({row["document_id"] for row in results})
+    ).all()) if results else {}
+    return [{**row, "file_name": names.get(row["document_id"])} for row in results]
+
+
+def citations(results: List[Dict]) -> List[Dict]:
+    cited = []
+    for i, row in enumerate(results, 1):
+        pages = (row.get("metadata") or {}).get("pages") or []  # Written by conversion.convert_and_chunk
+        cited.append({
+            "index": i,
+            "chunk_id": row["chunk_id"],
+            "document_id": row["document_id"],
+            "file_name": row.get("file_name"),
+            "chunk_index": row.get("chunk_index"),
+            "page": pages[0] if pages else None,
+            "pages": pages,
+            "score": row.get("score"),
+            "snippet": row["chunk_content"][:300],
+        })
+    return cited
+
+
+def build_messages(query: str, results: List[Dict], history: Sequence[Dict] = ()) -> List[Dict]:
+    context = "\n\n".join(
+        f"[{i}] {row.get('file_name') or 'document'}, chunk {row.get('chunk_index')}\n{row['chunk_content']}"
+        for i, row in enumerate(results, 1)
+    )
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        *history,
+        {"role": "user", "content": f"Question: {query}\n\nContext:\n{context}"},
+    ]
+
+
+def _cached_answer(query_vector, user_id: int, model: str) -> Optional[Dict]:
+    """Cached answer with its cited chunks, as plain data before the session closes"""
+    with SessionLocal() as db:
+        found = answer_cache.lookup(db, query_vector, user_id, model)
+        if found is None:
+            return None
+        entry = found["entry"]
+        Chunk = models.DocumentChunk
+        chunks = {
+            row.chunk_id: row for row in db.query(
+                Chunk.chunk_id, Chunk.document_id, Chunk.chunk_index, Chunk.chunk_content, Chunk.meta_data
+            ).filter(Chunk.user_id.in_(answer_cache.owners(db, entry)), Chunk.chunk_id.in_(entry.chunk_ids))
+        }
+        results = [
+            {"chunk_id": chunk.chunk_id, "document_id": chunk.document_id, "chunk_index": chunk.chunk_index,
+             "chunk_content": chunk.chunk_content, "metadata": chunk.meta_data or {}, "score": None}
+            for chunk in (chunks[chunk_id] for chunk_id in entry.chunk_ids)
+        ]
+        return {"answer": entry.answer, "similarity": found["similarity"], "results": _with_file_names(db, results)}
+
+
+def _store_answer(query: str, query_vector, user_id: int, model: str, results: List[Dict], answer: str):
+    with SessionLocal() as db:
+        answer_cache.store(db, query, query_vector, user_id, model, [row["chunk_id"] for row in results], answer)
+
+
+class ChatMetrics:
+    """Latency of recent chat responses"""
+
+    FIELDS = ("retrieval_ms", "first_token_ms", "generation_ms", "total_ms")
+
+    def __init__(self, window: int = 1000):
+        self.samples = deque(maxlen=window)
+        self.responses = 0
+        self.cached = 0
+
+    def record(self, timings: Dict, cached: bool):
+        self.samples.append(timings)
+        self.responses += 1
+        self.cached += cached
+
+    def stats(self) -> Dict:
+        stats = {"responses": self.responses, "cached": self.cached, "window": len(self.samples)}
+        for field in self.FIELDS:
+            values = [sample[field] for sample in self.samples if sample.get(field) is not None]
+            if values:
+                stats[field] = {
+                    "p50": round(float(np.percentile(values, 50)), 2),
+                    "p95": round(float(np.percentile(values, 95)), 2),
+                }
+        return stats
+
+
+chat_metrics = ChatMetrics()
+
+
+def _ms(since: float) -> float:
+    return round((time.perf_counter() - since) * 1000, 2)
+
+
+async def answer_events(query: str, llm, embedder: BatchEmbedder, user_id: Optional[int] = None,
+                        document_ids: Optional[List[int]] = None, k: int = CHAT_CONTEXT_CHUNKS,
+                        mode: str = CHAT_RETRIEVAL_MODE, history: Sequence[Dict] = (),
+                        use_cache: bool = CHAT_ANSWER_CACHE) -> AsyncIterator[Tuple[str, Dict]]:
+    start = time.perf_counter()
+    timings: Dict = {}
+    vectors, _ = await query_cache.embed([query], embedder)
+    timings["embedding_ms"] = _ms(start)
+
+    # Follow-up questions depend on the conversation, so only standalone ones use the cache
+    use_cache = use_cache and user_id is not None and not history and not document_ids
+    cached = await asyncio.to_thread(_cached_answer, vectors[0], user_id, llm.model) if use_cache else None
+    if cached is not None:
+        timings["retrieval_ms"] = _ms(start)
+        yield "citations", {"citations": citations(cached["results"]), "cached": True}
+        timings["first_token_ms"] = _ms(start)
+        yield "token", {"text": cached["answer"]}
+        timings["generation_ms"] = 0.0
+        timings["total_ms"] = _ms(start)
+        chat_metrics.record(timings, cached=True)
+        yield "done", {"timings": timings, "cached": True, "similarity": cached["similarity"], "model": llm.model}
+        return
+
+    results = await asyncio.to_thread(retrieve, query, vectors[0], k, mode, user_id, document_ids)
+    timings["retrieval_ms"] = _ms(start)
+    yield "citations", {"citations": citations(results), "cached": False}
+
+    generation_start = time.perf_counter()
+    parts = []
+    async for text in llm.stream(build_messages(query, results, history)):
+        if not parts:
+            timings["first_token_ms"] = _ms(start)
+        parts.append(text)
+        yield "token", {"text": text}
+    timings["generation_ms"] = _ms(generation_start)
+    timings["total_ms"] = _ms(start)
+    chat_metrics.record(timings, cached=False)
+    done = {"timings": timings, "cached": False, "model": llm.model}
+    if use_cache and results and parts:
+        try:
+            await asyncio.to_thread(_store_answer, query, vectors[0], user_id, llm.model, results, "".join(parts))
+        except ValueError as e:
+            # A cited chunk went away while generating; the answer itself was sent, so it still completes
+            done["not_cached"] = str(e)
+    yield "done", done
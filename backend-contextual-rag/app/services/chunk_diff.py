@@ -0,0 +1,57 @@
+from collections import defaultdict, deque
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy.orm import Session
+
+from ..models import models
+from .embedding_cache import content_hash
+
+
+class ChunkDiff:
+    """Matches a new version's chunks to the stored ones by content hash, in position order.
+
+    Each stored chunk can be reused once; repeated text is paired up by chunk_index.
+    Whatever is left unmatched at the end was removed from the document.
+    """
+
+    def __init__(self, stored: Iterable):
+        self._by_hash: Dict[str, deque] = defaultdict(deque)
+        self._stored: Dict[int, object] = {}
+        for row in sorted(stored, key=lambda row: (row.chunk_index is None, row.chunk_index, row.chunk_id)):
+            self._stored[row.chunk_id] = row
+            # Rows written before content_hash existed are hashed on the fly
+            self._by_hash[row.content_hash or content_hash(row.chunk_content)].append(row.chunk_id)
+        self.kept = 0
+        self.added = 0
+        self.updated = 0
+
+    @classmethod
+    def load(cls, db: Session, document_id: int) -> "ChunkDiff":
+        Chunk = models.DocumentChunk
+        rows = db.query(
+            Chunk.chunk_id, Chunk.chunk_index, Chunk.content_hash, Chunk.chunk_content, Chunk.meta_data
+        ).filter(Chunk.document_id == document_id).all()
+        return cls(rows)
+
+    def match(self, chunk: Dict) -> Optional[int]:
+        """Stored chunk_id to keep for this chunk, or None if it must be embedded and inserted"""
+        candidates = self._by_hash.get(chunk["content_hash"])
+        if not candidates:
+            self.added += 1
+            return None
+        self.kept += 1
+        return candidates.popleft()
+
+    def needs_update(self, chunk: Dict) -> bool:
+        stored = self._stored[chunk["chunk_id"]]
+        changed = stored.chunk_index != chunk["chunk_index"] or stored.meta_data != chunk["metadata"] \
+            or stored.content_hash != chunk["content_hash"]
+        if changed:
+            self.updated += 1
+        return changed
+
+    def removed_ids(self) -> List[int]:
+        return [chunk_id for candidates in self._by_hash.values() for chunk_id in candidates]
+
+    def summary(self) -> Dict:
+        return {"kept": self.kept, "added": self.added, "updated": self.updated, "removed": len(self.removed_ids())}
@@ -0,0 +1,176 @@
+"""Bulk writes into document_chunks.
+
+Rows are dicts keyed by column name. COPY ... (FORMAT BINARY) sends vectors in
+pgvector's binary form (int16 dim, int16 unused, float32 values) instead of
+'[0.1,0.2,...]' text literals. The compact vector_short/vector_bits copies
+are derived from the vector here unless a row carries them, and so are the
+user_id/visibility the table is partitioned by, from the row's document. Runs on the Session's connection, so the rows
+commit or roll back together with whatever else the caller does in the transaction.
+"""
+import struct
+import weakref
+from typing import Any, Dict, Iterable, List, Sequence
+
+import numpy as np
+from pgvector.psycopg import register_vector
+from psycopg import postgres
+from psycopg.adapt import Dumper
+from psycopg.pq import Format
+from psycopg.types.json import Json
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from . import partitions
+from .compact_vectors import Bits, compact_columns
+
+# Postgres type per column, used for binary COPY
+CHUNK_COLUMN_TYPES = {
+    "document_id": "int4",
+    "user_id": "int4",
+    "visibility": "text",
+    "chunk_content": "text",
+    "vector": "vector",
+    "vector_short": "vector",
+    "vector_bits": "bit",
+    "metadata": "json",
+    "content_hash": "text",
+    "chunk_index": "int4",
+}
+DEFAULT_COLUMNS = ("document_id", "user_id", "visibility", "chunk_content", "vector", "vector_short", "vector_bits",
+                   "metadata", "content_hash", "chunk_index")
+COMPACT_COLUMNS = ("vector_short", "vector_bits")
+TENANT_COLUMNS = ("user_id", "visibility")
+
+_registered = weakref.WeakSet()
+
+
+class BitsBinaryDumper(Dumper):
+    """bit(n) in binary form: int32 bit count, then the bits packed most significant first"""
+
+    format = Format.BINARY
+    oid = postgres.types["bit"].oid
+
+    def dump(self, obj: Bits) -> bytes:
+        return struct.pack("!i", len(obj.bits)) + np.packbits(obj.bits).tobytes()
+
+
+def driver_connection(db: Session):
+    """The psycopg connection behind the Session, with pgvector types registered once"""
+    conn = db.connection().connection.driver_connection
+    if conn not in _registered:
+        register_vector(conn)
+        conn.adapters.register_dumper(Bits, BitsBinaryDumper)
+        _registered.add(conn)
+    return conn
+
+
+def _adapt(column: str, value: Any) -> Any:
+    if value is None:
+        return None
+    kind = CHUNK_COLUMN_TYPES[column]
+    if kind == "vector":
+        return np.asarray(value, dtype=np.float32)
+    if kind in ("json", "jsonb"):
+        return Json(value)
+    return value
+
+
+def _values(row: Dict[str, Any], columns: Sequence[str]) -> list:
+    if "vector_short" not in row and any(column in COMPACT_COLUMNS for column in columns):
+        row = {**row, **compact_columns(row.get("vector"))}
+    return [_adapt(column, row.get(column)) for column in columns]
+
+
+def _with_tenants(db: Session, rows: Iterable[Dict[str, Any]], columns: Sequence[str]) -> List[Dict[str, Any]]:
+    """Rows with their document's owner and visibility, and the tenant partitions they go to created"""
+    rows = list(rows)  # Looked up before COPY starts, the connection can't run queries during it
+    if not any(column in TENANT_COLUMNS for column in columns):
+        return rows
+    missing = {row["document_id"] for row in rows if not all(column in row for column in TENANT_COLUMNS)}
+    tenants = {
+        document_id: {"user_id": user_id or 0, "visibility": visibility or "private"}
+        for document_id, user_id, visibility in db.execute(
+            text("SELECT document_id, user_id, visibility FROM documents WHERE document_id = ANY(:ids)"),
+            {"ids": list(missing)},
+        )
+    } if missing else {}
+    unknown = missing - tenants.keys()
+    if unknown:
+        raise ValueError(f"Chunks for unknown documents: {sorted(unknown)}")
+    rows = [{**tenants[row["document_id"]], **row} if row["document_id"] in tenants else row for row in rows]
+    for user_id in {row["user_id"] for row in rows}:
+        partitions.ensure_tenant(db, user_id)
+    return rows
+
+
+def copy_chunks(db: Session, rows: Iterable[Dict[str, Any]], columns: Sequence[str] = DEFAULT_COLUMNS) -> int:
+    """Stream rows with binary COPY; the fastest path for large batches"""
+    rows = _with_tenants(db, rows, columns)
+    conn = driver_connection(db)
+    count = 0
+    with conn.cursor() as cur:
+        with cur.copy(f"COPY document_chunks ({', '.join(columns)}) FROM STDIN WITH (FORMAT BINARY)") as copy:
+            copy.set_types([CHUNK_COLUMN_TYPES[column] for column in columns])
+            for row in rows:
+                copy.write_row(_values(row, columns))
+                count += 1
+    return count
+
+
+def insert_chunks(db: Session, rows: Iterable[Dict[str, Any]], columns: Sequence[str] = DEFAULT_COLUMNS) -> int:
+    """Multi-row executemany (pipelined by psycopg); works where COPY isn't allowed"""
+    conn = driver_connection(db)
+    params = [_values(row, columns) for row in _with_tenants(db, rows, columns)]
+    if not params:
+        return 0
+    placeholders = ", ".join(["%s"] * len(columns))
+    with conn.cursor() as cur:
+        cur.executemany(f"INSERT INTO document_chunks ({', '.join(columns)}) VALUES ({placeholders})", params)
+    return len(params)
+
+
+def write_chunks(db: Session, rows: Iterable[Dict[str, Any]], columns: Sequence[str] = DEFAULT_COLUMNS,
+                 method: str = "copy") -> int:
+    if method == "copy":
+        return copy_chunks(db, rows, columns)
+    if method == "executemany":
+        return insert_chunks(db, rows, columns)
+    raise ValueError(f"Unknown chunk write method: {method}")
+
+
+def update_chunk_positions(db: Session, rows: Iterable[Dict[str, Any]], user_id: int) -> int:
+    """Refresh chunk_index/metadata/content_hash of one tenant's kept chunks without touching their vectors"""
+    params = [
+        [row["chunk_index"], Json(row["metadata"]), row["content_hash"], row["chunk_id"], user_id]
+        for row in rows
+    ]
+    if not params:
+        return 0
+    with driver_connection(db).cursor() as cur:
+        # user_id prunes each update to the tenant's partition
+        cur.executemany(
+            "UPDATE document_chunks SET chunk_index = %s, metadata = %s, content_hash = %s "
+            "WHERE chunk_id = %s AND user_id = %s",
+            params,
+        )
+    return len(params)
+
+
+def copy_document_chunks(db: Session, source_document_id: int, target_document_id: int) -> int:
+    """Duplicate another document's chunks and vectors server-side, for byte-identical uploads"""
+    copied = [column for column in DEFAULT_COLUMNS if column != "document_id" and column not in TENANT_COLUMNS]
+    # The copies belong to the target document's owner, and so to their partition
+    user_id, = db.execute(
+        text("SELECT coalesce(user_id, 0) FROM documents WHERE document_id = :target"), {"target": target_document_id}
+    ).one()
+    partitions.ensure_tenant(db, user_id)
+    result = db.execute(
+        text(
+            f"INSERT INTO document_chunks (document_id, user_id, visibility, {', '.join(copied)}) "
+            f"SELECT d.document_id, :user_id, coalesce(d.visibility, 'private'), {', '.join('c.' + column for column in copied)} "
+            "FROM document_chunks c JOIN documents d ON d.document_id = :target "
+            "WHERE c.document_id = :source ORDER BY c.chunk_index"
+        ),
+        {"source": source_document_id, "target": target_document_id, "user_id": user_id},
+    )
+    return result.rowcount
@@ -0,0 +1,46 @@
+"""Compact copies of the chunk vectors, derived whenever a full vector is written.
+
+text-embedding-3 models are trained Matryoshka-style: the leading dimensions
+carry most of the signal, so the first SHORT_DIMENSION values, renormalized,
+are an embedding of their own (vector_short, 1 KiB against 6 KiB). vector_bits
+keeps one sign bit per dimension (192 bytes) and is compared by Hamming
+distance. Both only shortlist candidates; the full vector has the final say,
+see vector_index.two_stage_search.
+"""
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+
+SHORT_DIMENSION = 256  # Must match DocumentChunk.vector_short
+
+
+class Bits:
+    """A value for a bit(n) column; chunk_writer registers its binary dumper"""
+
+    __slots__ = ("bits",)
+
+    def __init__(self, bits: np.ndarray):
+        self.bits = np.asarray(bits, dtype=bool)
+
+    def __len__(self) -> int:
+        return len(self.bits)
+
+    def __str__(self) -> str:
+        return "".join("1" if bit else "0" for bit in self.bits)
+
+
+def shorten(vector: Sequence[float], dimension: int = SHORT_DIMENSION) -> np.ndarray:
+    """Leading dimensions, renormalized so cosine and inner product agree again"""
+    short = np.asarray(vector, dtype=np.float32)[:dimension]
+    norm = np.linalg.norm(short)
+    return short / norm if norm else short
+
+
+def binarize(vector: Sequence[float]) -> Bits:
+    return Bits(np.asarray(vector, dtype=np.float32) > 0)
+
+
+def compact_columns(vector: Optional[Sequence[float]]) -> Dict:
+    if vector is None:
+        return {"vector_short": None, "vector_bits": None}
+    return {"vector_short": shorten(vector), "vector_bits": binarize(vector)}
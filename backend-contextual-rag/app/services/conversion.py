@@ -0,0 +1,290 @@
+"""Docling conversion in a pool of worker processes.
+
+Each worker process builds its own DocumentConverter (one per ingestion
+profile) and HybridChunker (one per max_tokens) once and reuses them for
+every task. Large PDFs are split into page ranges that are converted and
+chunked in parallel, then stitched back together in page order. This module deliberately doesn't
+import the database so spawned workers stay light.
+"""
+import asyncio
+import multiprocessing
+import os
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
+
+import pypdfium2
+from docling.chunking import HybridChunker
+from docling.datamodel.base_models import InputFormat
+from docling.datamodel.pipeline_options import PdfPipelineOptions, TableFormerMode
+from docling.document_converter import DocumentConverter, PdfFormatOption
+
+from . import artifacts
+
+CONVERSION_WORKERS = int(os.getenv("CONVERSION_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+CONVERSION_PAGES_PER_TASK = int(os.getenv("CONVERSION_PAGES_PER_TASK", "20"))
+CONVERSION_THREADS_PER_WORKER = int(os.getenv("CONVERSION_THREADS_PER_WORKER", "2"))
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "500"))  # Default, jobs may chunk with their own
+INGEST_PROFILE = os.getenv("INGEST_PROFILE", "auto")
+# Profiles whose models are loaded when a worker starts, others load on first use
+CONVERSION_WARM_PROFILES = [p for p in os.getenv("CONVERSION_WARM_PROFILES", "balanced,full").split(",") if p]
+
+PROFILES = ("fast", "balanced", "full")
+PageRange = Tuple[int, int]  # 1-based, inclusive
+
+# Per-process state, built by _init_worker, _get_converter and _get_chunker
+_converters: Dict[str, DocumentConverter] = {}
+_chunkers: Dict[int, HybridChunker] = {}
+_initialized = False
+
+
+def pipeline_options(profile: str) -> PdfPipelineOptions:
+    """fast: text layer only. balanced: plus fast table structure. full: plus OCR and accurate tables."""
+    if profile == "fast":
+        return PdfPipelineOptions(do_ocr=False, do_table_structure=False)
+    if profile == "balanced":
+        options = PdfPipelineOptions(do_ocr=False, do_table_structure=True)
+        options.table_structure_options.mode = TableFormerMode.FAST
+        return options
+    if profile == "full":
+        options = PdfPipelineOptions(do_ocr=True, do_table_structure=True)
+        options.table_structure_options.mode = TableFormerMode.ACCURATE
+        return options
+    raise ValueError(f"Unknown ingestion profile: {profile}")
+
+
+def has_text_layer(path: str, sample_pages: int = 5, min_chars: int = 50) -> bool:
+    """True if every sampled page has embedded text, i.e. the PDF is born-digital"""
+    pdf = pypdfium2.PdfDocument(path)
+    try:
+        step = max(1, len(pdf) // sample_pages)
+        for index in range(0, len(pdf), step)[:sample_pages]:
+            page = pdf[index]
+            textpage = page.get_textpage()
+            chars = textpage.count_chars()
+            textpage.close()
+            page.close()
+            if chars < min_chars:
+                return False
+        return True
+    finally:
+        pdf.close()
+
+
+def resolve_profile(path: str, profile: str = INGEST_PROFILE) -> str:
+    """Pick a concrete profile; auto skips OCR for PDFs that already have a text layer.
+
+    TableFormer only runs on regions the layout model labels as tables, so
+    table-free documents already skip most of the table structure cost.
+    """
+    if profile != "auto":
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown ingestion profile: {profile}")
+        return profile
+    if Path(path).suffix.lower() != ".pdf":
+        return "balanced"
+    return "balanced" if has_text_layer(path) else "full"
+
+
+def _get_converter(profile: str) -> DocumentConverter:
+    converter = _converters.get(profile)
+    if converter is None:
+        converter = DocumentConverter(format_options={
+            InputFormat.PDF: PdfFormatOption(pipeline_options=pipeline_options(profile))
+        })
+        _converters[profile] = converter
+    return converter
+
+
+def _get_chunker(max_tokens: int) -> HybridChunker:
+    chunker = _chunkers.get(max_tokens)
+    if chunker is None:
+        chunker = HybridChunker(max_tokens=max_tokens)
+        _chunkers[max_tokens] = chunker
+    return chunker
+
+
+def _init_worker(threads: int = CONVERSION_THREADS_PER_WORKER, warm_profiles: Optional[List[str]] = None):
+    global _initialized
+    _initialized = True
+    if threads:
+        # Keep N workers x torch threads from oversubscribing the cores
+        import torch
+        torch.set_num_threads(threads)
+    _get_chunker(CHUNK_MAX_TOKENS)
+    for profile in CONVERSION_WARM_PROFILES if warm_profiles is None else warm_profiles:
+        # Loads the layout/table/OCR models now rather than on the first document
+        _get_converter(profile).initialize_pipeline(InputFormat.PDF)
+
+
+def _warm_up_task(_: int) -> int:
+    time.sleep(0.5)
+    return os.getpid()
+
+
+def _chunk_pages(chunk) -> List[int]:
+    return sorted({prov.page_no for item in chunk.meta.doc_items for prov in item.prov})
+
+
+def convert_and_chunk(path: Optional[str], page_range: Optional[PageRange] = None, profile: str = "balanced",
+                      file_hash: Optional[str] = None, max_tokens: int = CHUNK_MAX_TOKENS) -> List[Dict]:
+    """Convert one file (or one page range of it) and return its chunks in document order.
+
+    With a file_hash the converted document is read from / written to the
+    artifact cache, so only chunking runs when the file was converted before.
+    """
+    if not _initialized:
+        _init_worker(threads=0, warm_profiles=[])
+    document = None
+    if file_hash:
+        cached_path = artifacts.artifact_path(file_hash, profile, page_range)
+        document = artifacts.load(cached_path, discard_corrupt=path is not None)
+    if document is None:
+        if path is None:
+            raise FileNotFoundError(f"No conversion artifact for {file_hash} {profile} {page_range}")
+        kwargs = {"page_range": page_range} if page_range else {}
+        document = _get_converter(profile).convert(path, **kwargs).document
+        if file_hash:
+            artifacts.save(document, cached_path)
+    return [
+        {
+            "content": chunk.text,
+            "metadata": {
+                "headings": chunk.meta.headings,
+                "captions": chunk.meta.captions,
+                "pages": _chunk_pages(chunk),
+            },
+        }
+        for chunk in _get_chunker(max_tokens).chunk(dl_doc=document)
+    ]
+
+
+def page_count(path: str) -> Optional[int]:
+    if Path(path).suffix.lower() != ".pdf":
+        return None
+    pdf = pypdfium2.PdfDocument(path)
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+def split_pages(total: int, pages_per_task: int) -> List[PageRange]:
+    return [(start, min(start + pages_per_task - 1, total)) for start in range(1, total + 1, pages_per_task)]
+
+
+class ConversionPool:
+    """Runs convert_and_chunk off the event loop, across worker processes when workers > 0"""
+
+    def __init__(self, workers: int = CONVERSION_WORKERS, pages_per_task: int = CONVERSION_PAGES_PER_TASK,
+                 threads_per_worker: int = CONVERSION_THREADS_PER_WORKER):
+        self.workers = workers
+        self.pages_per_task = pages_per_task
+        self.executor = None
+        if workers > 0:
+            # spawn, not fork: torch state doesn't survive fork
+            self.executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(threads_per_worker,),
+            )
+
+    def warm_up(self) -> int:
+        """Start every worker and load its models now instead of on the first upload"""
+        if self.executor is None:
+            if not _initialized:
+                _init_worker(threads=0)
+            return 1
+        # Blocking tasks keep early workers busy so the executor spawns all of them
+        pids = set(self.executor.map(_warm_up_task, range(self.workers)))
+        return len(pids)
+
+    def plan(self, path: str) -> List[Optional[PageRange]]:
+        pages = page_count(path)
+        if self.executor is None or not pages or pages <= self.pages_per_task:
+            return [None]
+        return split_pages(pages, self.pages_per_task)
+
+    async def iter_convert_path(self, path: Optional[str], profile: str = INGEST_PROFILE,
+                                file_hash: Optional[str] = None,
+                                max_tokens: int = CHUNK_MAX_TOKENS) -> AsyncIterator[Dict]:
+        """Yield chunks in page order, with at most one page range in flight per worker.
+
+        Files converted before (same hash, profile and converter version) are
+        planned from the artifact manifest and only re-chunked; path may then be None.
+        Artifacts hold the converted document, so they serve any max_tokens.
+        """
+        # Both open the PDF with pdfium; off the event loop, like the hashing below
+        if path is not None:
+            profile = await asyncio.to_thread(resolve_profile, path, profile)
+        ranges = None
+        if artifacts.CONVERSION_ARTIFACTS:
+            if file_hash is None:
+                file_hash = await asyncio.to_thread(artifacts.file_sha256, path)
+            ranges = artifacts.read_manifest(file_hash, profile)
+        else:
+            file_hash = None
+        cached = ranges is not None
+        if not cached:
+            if path is None:
+                raise FileNotFoundError(f"No conversion artifacts for {file_hash} ({profile}) and no source file")
+            ranges = await asyncio.to_thread(self.plan, path)
+        async for chunk in self._iter_ranges(path, ranges, profile, file_hash, max_tokens):
+            yield chunk
+        if file_hash and not cached:
+            # Only once every range is stored; a crash part-way leaves no manifest
+            artifacts.write_manifest(file_hash, profile, ranges)
+
+    async def _iter_ranges(self, path: Optional[str], ranges: List[Optional[PageRange]], profile: str,
+                           file_hash: Optional[str], max_tokens: int = CHUNK_MAX_TOKENS) -> AsyncIterator[Dict]:
+        if self.executor is None:
+            for page_range in ranges:
+                chunks = await asyncio.to_thread(convert_and_chunk, path, page_range, profile, file_hash, max_tokens)
+                for chunk in chunks:
+                    yield chunk
+            return
+
+        loop = asyncio.get_running_loop()
+        pending = deque()
+        try:
+            for page_range in ranges:
+                pending.append(loop.run_in_executor(
+                    self.executor, convert_and_chunk, path, page_range, profile, file_hash, max_tokens
+                ))
+                if len(pending) >= self.workers:
+                    for chunk in await pending.popleft():
+                        yield chunk
+            while pending:
+                for chunk in await pending.popleft():
+                    yield chunk
+        finally:
+            for future in pending:
+                future.cancel()
+
+    async def iter_convert(self, source: Union[bytes, str, None], filename: str, profile: str = INGEST_PROFILE,
+                           file_hash: Optional[str] = None,
+                           max_tokens: int = CHUNK_MAX_TOKENS) -> AsyncIterator[Dict]:
+        if source is None or isinstance(source, str):
+            async for chunk in self.iter_convert_path(source, profile, file_hash, max_tokens):
+                yield chunk
+            return
+        # Workers read from disk rather than receiving a pickled copy of the bytes per page range
+        with tempfile.NamedTemporaryFile(suffix=Path(filename).suffix, delete=False) as tmp:
+            tmp.write(source)
+        try:
+            async for chunk in self.iter_convert_path(tmp.name, profile, max_tokens=max_tokens):
+                yield chunk
+        finally:
+            os.unlink(tmp.name)
+
+    async def convert(self, source: Union[bytes, str], filename: str, profile: str = INGEST_PROFILE,
+                      max_tokens: int = CHUNK_MAX_TOKENS) -> List[Dict]:
+        return [chunk async for chunk in self.iter_convert(source, filename, profile, max_tokens=max_tokens)]
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
@@ -1,43 +1,79 @@
-from docling.document_converter import DocumentConverter
-from docling.chunking import HybridChunker
-from docling.datamodel.pipeline_options import PdfPipelineOptions
-from openai import OpenAI
-import os
-from typing import List, Dict
+from typing import AsyncIterator, Callable, List, Dict, Optional, Tuple, Union
+from .conversion import CHUNK_MAX_TOKENS, INGEST_PROFILE, ConversionPool
+from .embeddings import BatchEmbedder, EmbeddingStats
+from .embedding_cache import content_hash, embedding_cache
+from .pipeline import INGEST_BATCH_SIZE, PIPELINE_QUEUE_SIZE, batched, staged
 
 class DocumentProcessor:
-    def __init__(self):
-        self.converter = DocumentConverter()
-        self.chunker = HybridChunker(max_tokens=500)  # Adjust token size as needed
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-    async def process_document(self, file_content: bytes, filename: str) -> List[Dict]:
-        # Convert document using Docling
-        conv_result = self.converter.convert(file_content, filename=filename)
-        document = conv_result.document
-
-        # Generate chunks
-        chunks = list(self.chunker.chunk(dl_doc=document))
-        
-        processed_chunks = []
-        for chunk in chunks:
-            # Get embeddings from OpenAI
-            embedding = await self.get_embedding(chunk.text)
-            
-            processed_chunks.append({
-                "content": chunk.text,
-                "metadata": {
-                    "headings": chunk.meta.headings,
-                    "captions": chunk.meta.captions
-                },
-                "embedding": embedding
-            })
-        
-        return processed_chunks
+    def __init__(self, embedder=None, cache=embedding_cache, conversion_pool: Optional[ConversionPool] = None):
+        # Docling conversion and chunking run in worker processes (see CONVERSION_* env vars)
+        self.conversion = conversion_pool or ConversionPool()
+        # Batches chunks and sends several embedding requests at once (see EMBEDDING_* env vars)
+        self.embedder = BatchEmbedder(embedder)
+        # Unchanged chunk text is looked up by content hash instead of re-embedded
+        self.cache = cache
+
+    def warm_up(self) -> int:
+        return self.conversion.warm_up()
+
+    async def stream_document(
+        self,
+        source: Union[str, bytes],
+        filename: str,
+        batch_size: int = INGEST_BATCH_SIZE,
+        queue_size: int = PIPELINE_QUEUE_SIZE,
+        reuse: Optional[Callable[[Dict], Optional[int]]] = None,
+        profile: str = INGEST_PROFILE,
+        file_hash: Optional[str] = None,
+        max_tokens: int = CHUNK_MAX_TOKENS,
+    ) -> AsyncIterator[Tuple[List[Dict], EmbeddingStats]]:
+        """Yield embedded chunks in fixed-size batches, in document order.
+
+        Conversion, embedding and the caller's writes overlap, with bounded
+        queues in between, so memory depends on batch_size and not document size.
+        Chunks for which reuse() returns a stored chunk_id are passed through
+        without an embedding. A known file_hash lets conversion reuse cached artifacts.
+        max_tokens is the chunker's limit per chunk.
+        """
+        chunks = staged(self.conversion.iter_convert(source, filename, profile, file_hash, max_tokens),
+                        maxsize=batch_size)
+        embedded = staged(self._embed_batches(batched(chunks, batch_size), reuse), maxsize=queue_size)
+        async for batch in embedded:
+            yield batch
+
+    async def _embed_batches(self, batches: AsyncIterator[List[Dict]], reuse=None) -> AsyncIterator[Tuple[List[Dict], EmbeddingStats]]:
+        chunk_index = 0
+        async for chunks in batches:
+            for chunk in chunks:
+                chunk["chunk_index"] = chunk_index
+                chunk["content_hash"] = content_hash(chunk["content"])
+                chunk["chunk_id"] = reuse(chunk) if reuse else None
+                chunk_index += 1
+
+            fresh = [chunk for chunk in chunks if chunk["chunk_id"] is None]
+            stats = EmbeddingStats()
+            if fresh:
+                embeddings, stats = await self.embed_texts([chunk["content"] for chunk in fresh])
+                for chunk, embedding in zip(fresh, embeddings):
+                    chunk["embedding"] = embedding
+            yield chunks, stats
+
+    async def process_document(self, source: Union[str, bytes], filename: str) -> Tuple[List[Dict], EmbeddingStats]:
+        """Collect stream_document into one list, for small documents and scripts"""
+        processed_chunks, total = [], EmbeddingStats()
+        async for batch, stats in self.stream_document(source, filename):
+            processed_chunks.extend(batch)
+            total.add(stats)
+        return processed_chunks, total
+
+    async def embed_texts(self, texts: List[str]) -> Tuple[List[List[float]], EmbeddingStats]:
+        if self.cache is None:
+            return await self.embedder.embed(texts)
+        return await self.cache.embed(texts, self.embedder)
 
     async def get_embedding(self, text: str) -> List[float]:
-        response = await self.client.embeddings.create(
-            input=text,
-            model="text-embedding-3-small"
-        )
-        return response.data[0].embedding 
\ No newline at end of file
+        embeddings = await self.embedder.embedder.embed([text])
+        return embeddings[0]
+
+    def close(self):
+        self.conversion.shutdown()
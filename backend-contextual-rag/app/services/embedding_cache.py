@@ -0,0 +1,136 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy.dialects.postgresql import insert
+
+from ..database import SessionLocal
+from ..models import models
+from .embeddings import BatchEmbedder, EmbeddingStats, estimate_tokens
+
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "10000"))  # ~6KB per 1536-d vector
+EMBEDDING_CACHE_PERSIST = os.getenv("EMBEDDING_CACHE_PERSIST", "true").lower() == "true"
+_DB_BATCH = 1000
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Content-addressed embedding cache: in-process LRU in front of the embedding_cache table"""
+
+    def __init__(self, max_entries: int = EMBEDDING_CACHE_SIZE, session_factory=SessionLocal,
+                 persist: bool = EMBEDDING_CACHE_PERSIST):
+        self.max_entries = max_entries
+        self.session_factory = session_factory
+        self.persist = persist
+        self._lru: "OrderedDict[Tuple[str, str, int], np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+
+    def _remember(self, key: Tuple[str, str, int], vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._lru[key] = vector
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+        return vector
+
+    def get_many(self, hashes: Sequence[str], model: str, dimension: int) -> Dict[str, np.ndarray]:
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            for h in hashes:
+                vector = self._lru.get((h, model, dimension))
+                if vector is not None:
+                    self._lru.move_to_end((h, model, dimension))
+                    found[h] = vector
+            self.memory_hits += len(found)
+
+        missing = [h for h in hashes if h not in found]
+        if missing and self.persist:
+            Entry = models.EmbeddingCacheEntry
+            with self.session_factory() as db:
+                for start in range(0, len(missing), _DB_BATCH):
+                    rows = db.query(Entry.content_hash, Entry.vector).filter(
+                        Entry.model == model,
+                        Entry.dimension == dimension,
+                        Entry.content_hash.in_(missing[start:start + _DB_BATCH]),
+                    ).all()
+                    for h, vector in rows:
+                        found[h] = self._remember((h, model, dimension), vector)
+                        self.db_hits += 1
+
+        self.misses += len(hashes) - len(found)
+        return found
+
+    def put_many(self, items: Dict[str, Sequence[float]], model: str, dimension: int):
+        for h, vector in items.items():
+            self._remember((h, model, dimension), vector)
+        if not items or not self.persist:
+            return
+        rows = [
+            {"content_hash": h, "model": model, "dimension": dimension, "vector": vector}
+            for h, vector in items.items()
+        ]
+        with self.session_factory() as db:
+            for start in range(0, len(rows), _DB_BATCH):
+                stmt = insert(models.EmbeddingCacheEntry).values(rows[start:start + _DB_BATCH])
+                db.execute(stmt.on_conflict_do_nothing())
+            db.commit()
+
+    async def embed(self, texts: Sequence[str], embedder: BatchEmbedder) -> Tuple[List[np.ndarray], EmbeddingStats]:
+        """Return vectors for texts, only sending cache misses to the embedder"""
+        start = time.perf_counter()
+        model, dimension = embedder.model, embedder.dimension
+        hashes = [content_hash(text) for text in texts]
+        unique = list(dict.fromkeys(hashes))
+
+        cached = await asyncio.to_thread(self.get_many, unique, model, dimension)
+
+        # Embed each missing text once, even if it repeats inside the document
+        to_embed: Dict[str, str] = {}
+        for h, text in zip(hashes, texts):
+            if h not in cached and h not in to_embed:
+                to_embed[h] = text
+        stats = EmbeddingStats()
+        if to_embed:
+            vectors, stats = await embedder.embed(list(to_embed.values()))
+            fresh = {h: np.asarray(vector, dtype=np.float32) for h, vector in zip(to_embed.keys(), vectors)}
+            await asyncio.to_thread(self.put_many, fresh, model, dimension)
+            cached.update(fresh)
+
+        stats.cache_hits = len(texts) - len(to_embed)
+        stats.chunks = len(texts)
+        stats.tokens = sum(estimate_tokens(text) for text in texts)
+        stats.seconds = time.perf_counter() - start
+        return [cached[h] for h in hashes], stats
+
+    def stats(self) -> Dict:
+        hits = self.memory_hits + self.db_hits
+        lookups = hits + self.misses
+        return {
+            "entries_in_memory": len(self._lru),
+            "max_entries": self.max_entries,
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "miss_rate": round(self.misses / lookups, 4) if lookups else 0.0,
+        }
+
+
+embedding_cache = EmbeddingCache()
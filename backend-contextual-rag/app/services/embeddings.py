@@ -0,0 +1,181 @@
+import asyncio
+import hashlib
+import math
+import os
+import re
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+from openai import AsyncOpenAI
+
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "openai")  # "openai" or "stub"
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", "1536"))
+EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", "8000"))
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))  # API allows up to 2048 inputs
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly 4 characters per token for cl100k_base on English text
+    return max(1, len(text) // 4)
+
+
+class OpenAIEmbedder:
+    def __init__(self, model: str = EMBEDDING_MODEL, dimension: int = EMBEDDING_DIMENSION):
+        self.model = model
+        self.dimension = dimension
+        self.client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        response = await self.client.embeddings.create(input=texts, model=self.model)
+        # Items carry their input index, don't rely on response ordering
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+class StubEmbedder:
+    """Deterministic offline embedder (hashed bag of words) for tests and benchmarks"""
+
+    def __init__(
+        self,
+        model: str = "stub-hashing",
+        dimension: int = EMBEDDING_DIMENSION,
+        latency: float = 0.0,
+        per_token_latency: float = 0.0,
+    ):
+        self.model = model
+        self.dimension = dimension
+        self.latency = latency
+        self.per_token_latency = per_token_latency
+        self.calls = 0
+
+    def embed_text(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimension
+        for word in _WORD_RE.findall(text.lower()):
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dimension
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        delay = self.latency + self.per_token_latency * sum(estimate_tokens(text) for text in texts)
+        if delay:
+            await asyncio.sleep(delay)
+        return [self.embed_text(text) for text in texts]
+
+
+def get_embedder(provider: str = EMBEDDING_PROVIDER):
+    if provider == "stub":
+        return StubEmbedder()
+    if provider == "openai":
+        return OpenAIEmbedder()
+    raise ValueError(f"Unknown embedding provider: {provider}")
+
+
+@dataclass
+class EmbeddingStats:
+    chunks: int = 0
+    tokens: int = 0
+    batches: int = 0
+    seconds: float = 0.0
+    cache_hits: int = 0
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.seconds if self.seconds else 0.0
+
+    @property
+    def tokens_per_second(self) -> float:
+        return self.tokens / self.seconds if self.seconds else 0.0
+
+    def add(self, other: "EmbeddingStats"):
+        self.chunks += other.chunks
+        self.tokens += other.tokens
+        self.batches += other.batches
+        self.seconds += other.seconds
+        self.cache_hits += other.cache_hits
+
+    def as_dict(self) -> dict:
+        return {
+            "chunks": self.chunks,
+            "tokens": self.tokens,
+            "batches": self.batches,
+            "cache_hits": self.cache_hits,
+            "seconds": round(self.seconds, 3),
+            "chunks_per_second": round(self.chunks_per_second, 1),
+            "tokens_per_second": round(self.tokens_per_second, 1),
+        }
+
+
+def make_batches(
+    texts: Sequence[str],
+    max_tokens: int = EMBEDDING_BATCH_TOKENS,
+    max_size: int = EMBEDDING_BATCH_SIZE,
+) -> List[List[int]]:
+    """Pack text indices into batches bounded by estimated tokens and item count"""
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+    for index, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if current and (current_tokens + tokens > max_tokens or len(current) >= max_size):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(index)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+class BatchEmbedder:
+    """Embeds many texts with token-bounded batches sent concurrently"""
+
+    def __init__(
+        self,
+        embedder=None,
+        max_batch_tokens: int = EMBEDDING_BATCH_TOKENS,
+        max_batch_size: int = EMBEDDING_BATCH_SIZE,
+        concurrency: int = EMBEDDING_CONCURRENCY,
+    ):
+        self.embedder = embedder or get_embedder()
+        self.max_batch_tokens = max_batch_tokens
+        self.max_batch_size = max_batch_size
+        self.concurrency = max(1, concurrency)
+
+    @property
+    def model(self) -> str:
+        return self.embedder.model
+
+    @property
+    def dimension(self) -> int:
+        return self.embedder.dimension
+
+    async def embed(self, texts: Sequence[str]) -> Tuple[List[List[float]], EmbeddingStats]:
+        start = time.perf_counter()
+        batches = make_batches(texts, self.max_batch_tokens, self.max_batch_size)
+        vectors: List[Optional[List[float]]] = [None] * len(texts)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run(batch: List[int]):
+            async with semaphore:
+                result = await self.embedder.embed([texts[i] for i in batch])
+            if len(result) != len(batch):
+                raise ValueError(f"Embedder returned {len(result)} vectors for {len(batch)} inputs")
+            for index, vector in zip(batch, result):
+                vectors[index] = vector
+
+        await asyncio.gather(*(run(batch) for batch in batches))
+
+        stats = EmbeddingStats(
+            chunks=len(texts),
+            tokens=sum(estimate_tokens(text) for text in texts),
+            batches=len(batches),
+            seconds=time.perf_counter() - start,
+        )
+        return vectors, stats
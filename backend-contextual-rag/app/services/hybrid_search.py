@@ -0,0 +1,142 @@
+"""Lexical and hybrid (lexical + vector) retrieval over document_chunks.
+
+The lexical leg matches websearch_to_tsquery against the generated
+content_tsv column (GIN indexed) and ranks with ts_rank_cd, Postgres' cover
+density ranking; it is not BM25 but rewards the same things (term frequency,
+proximity, rare terms through the query). Hybrid search runs both legs as
+CTEs of a single statement and merges them with weighted reciprocal rank
+fusion, score = sum(weight / (rrf_k + rank)), so it costs one round trip.
+"""
+import os
+import re
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import cast, func, literal, select
+from sqlalchemy.dialects.postgresql import REGCONFIG
+from sqlalchemy.orm import Session
+
+from ..models import models
+from .vector_index import cosine_distance, covering_ef_search, filter_chunks, tune
+
+# Must match the configuration of the generated content_tsv column
+TEXT_SEARCH_CONFIG = "english"
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "50"))  # per leg, before fusion
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+
+# websearch_to_tsquery terms: an optionally negated "quoted phrase" or bare word
+_WEBSEARCH_TERM = re.compile(r'(-?"[^"]*"?)|(\S+)')
+
+
+def _tsquery(query: str, match_all: bool = False):
+    """websearch syntax (quotes, -exclusions); terms are OR-ed unless match_all, as in BM25"""
+    config = cast(literal(TEXT_SEARCH_CONFIG), REGCONFIG)
+    if match_all:
+        return func.websearch_to_tsquery(config, query)
+    # Natural-language questions rarely contain every term of the answer, so the
+    # positive terms and phrases are joined with websearch's own "or", and the
+    # -exclusions are parsed apart and AND-ed back on. Exclusions alone keep
+    # websearch's reading of the query.
+    positive, negative = [], []
+    for match in _WEBSEARCH_TERM.finditer(query):
+        term = match.group(0)
+        if term.lower() != "or":
+            (negative if term.startswith("-") and len(term) > 1 else positive).append(term)
+    tsquery = func.websearch_to_tsquery(config, " or ".join(positive) if positive else query)
+    if positive and negative:
+        tsquery = tsquery.op("&&")(func.websearch_to_tsquery(config, " ".join(negative)))
+    # The regconfig cast is only stable, so Postgres won't fold the expression; as a
+    # scalar subquery it runs once per query (an InitPlan) rather than once per row
+    return select(tsquery).scalar_subquery()
+
+
+def _row(row, score: float) -> Dict:
+    return {
+        "chunk_id": row.chunk_id,
+        "document_id": row.document_id,
+        "chunk_index": row.chunk_index,
+        "chunk_content": row.chunk_content,
+        "metadata": row.meta_data or {},
+        "distance": float(row.distance) if getattr(row, "distance", None) is not None else None,
+        "score": score,
+        "vector_rank": getattr(row, "vector_rank", None),
+        "lexical_rank": getattr(row, "lexical_rank", None),
+    }
+
+
+def lexical_search(db: Session, query: str, k: int = 10, user_id: Optional[int] = None,
+                   document_ids: Optional[List[int]] = None, match_all: bool = False) -> List[Dict]:
+    """Top-k chunks by full-text rank"""
+    Chunk = models.DocumentChunk
+    tsquery = _tsquery(query, match_all)
+    rank = func.ts_rank_cd(Chunk.content_tsv, tsquery).label("rank")
+    statement = filter_chunks(
+        select(Chunk.chunk_id, Chunk.document_id, Chunk.chunk_content, Chunk.meta_data, Chunk.chunk_index, rank)
+        .where(Chunk.content_tsv.op("@@")(tsquery)),
+        user_id, document_ids,
+    ).order_by(rank.desc()).limit(k)
+    try:
+        rows = db.execute(statement).all()
+    finally:
+        db.rollback()
+    return [{**_row(row, float(row.rank)), "lexical_rank": position} for position, row in enumerate(rows, 1)]
+
+
+def hybrid_search(db: Session, query: str, query_vector: Sequence[float], k: int = 10,
+                  user_id: Optional[int] = None, document_ids: Optional[List[int]] = None,
+                  vector_weight: float = 1.0, lexical_weight: float = 1.0, rrf_k: int = RRF_K,
+                  candidates: int = HYBRID_CANDIDATES, ef_search: Optional[int] = None,
+                  probes: Optional[int] = None, match_all: bool = False) -> List[Dict]:
+    """Fuse the top candidates of vector and lexical search with weighted RRF, in one query"""
+    Chunk = models.DocumentChunk
+    candidates = max(candidates, k)
+
+    # Each leg orders and limits on its own so it can use its index (HNSW/IVFFlat, GIN)
+    distance = cosine_distance(query_vector).label("distance")
+    vector_top = filter_chunks(
+        select(Chunk.chunk_id, distance).where(Chunk.vector.isnot(None)), user_id, document_ids
+    ).order_by(distance).limit(candidates).subquery()
+    vector_leg = select(
+        vector_top.c.chunk_id,
+        vector_top.c.distance,
+        func.row_number().over(order_by=vector_top.c.distance).label("rank"),
+    ).cte("vector_leg")
+
+    tsquery = _tsquery(query, match_all)
+    text_rank = func.ts_rank_cd(Chunk.content_tsv, tsquery).label("text_rank")
+    lexical_top = filter_chunks(
+        select(Chunk.chunk_id, text_rank).where(Chunk.content_tsv.op("@@")(tsquery)), user_id, document_ids
+    ).order_by(text_rank.desc()).limit(candidates).subquery()
+    lexical_leg = select(
+        lexical_top.c.chunk_id,
+        func.row_number().over(order_by=lexical_top.c.text_rank.desc()).label("rank"),
+    ).cte("lexical_leg")
+
+    fused = select(
+        func.coalesce(vector_leg.c.chunk_id, lexical_leg.c.chunk_id).label("chunk_id"),
+        vector_leg.c.distance,
+        vector_leg.c.rank.label("vector_rank"),
+        lexical_leg.c.rank.label("lexical_rank"),
+        (
+            func.coalesce(literal(float(vector_weight)) / (rrf_k + vector_leg.c.rank), 0.0)
+            + func.coalesce(literal(float(lexical_weight)) / (rrf_k + lexical_leg.c.rank), 0.0)
+        ).label("score"),
+    ).join(lexical_leg, vector_leg.c.chunk_id == lexical_leg.c.chunk_id, full=True).subquery()
+
+    # Filtered again so the join back to the rows only probes the tenant's partition
+    statement = filter_chunks(
+        select(
+            Chunk.chunk_id, Chunk.document_id, Chunk.chunk_content, Chunk.meta_data, Chunk.chunk_index,
+            # Only known for vector-leg hits, lexical-only hits come back without a distance
+            fused.c.distance, fused.c.vector_rank, fused.c.lexical_rank, fused.c.score,
+        )
+        .join(fused, fused.c.chunk_id == Chunk.chunk_id),
+        user_id,
+    ).order_by(fused.c.score.desc(), Chunk.chunk_id).limit(k)
+    try:
+        # The vector leg's HNSW scan has to return all of its candidates
+        tune(db, covering_ef_search(candidates, ef_search), probes)
+        rows = db.execute(statement).all()
+    finally:
+        db.rollback()  # Ends the read-only transaction and with it the SET LOCALs
+    return [_row(row, float(row.score)) for row in rows]
@@ -0,0 +1,127 @@
+"""Vector index builds in the background, tracked in the index_builds table.
+
+A build takes minutes on a large table, so POST /api/search/index records a
+queued build and returns; a thread of the API process runs build_index() on
+the worker engine and records the outcome. One build runs at a time across
+all processes: the thread holds a session advisory lock for the whole build
+and stores its backend pid on the row. A running row whose pid no longer
+holds the lock belongs to a process that died, and is reported as failed.
+"""
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from ..database import WorkerSessionLocal, worker_engine
+from ..models import models
+from . import vector_index
+
+BUILD_LOCK = "hashtext('index_builds')"
+QUEUED_GRACE = timedelta(minutes=1)
+
+
+class BuildRunning(Exception):
+    def __init__(self, build: models.IndexBuild):
+        super().__init__(f"Index build {build.build_id} is still running")
+        self.build = build
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _lock_held(db: Session, pid: Optional[int]) -> bool:
+    # A bigint advisory key shows in pg_locks split into classid (high) and objid (low 32 bits)
+    return pid is not None and db.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_locks WHERE locktype = 'advisory' AND granted AND pid = :pid "
+        f"AND objsubid = 1 AND ((classid::bigint << 32) | objid::bigint) = {BUILD_LOCK}::bigint)"
+    ), {"pid": pid}).scalar()
+
+
+def _reap(db: Session, build: models.IndexBuild) -> models.IndexBuild:
+    """Fail a build whose process went away without recording an outcome"""
+    # A queued build's thread starts right after the row is committed
+    lost = not _lock_held(db, build.pid) if build.status == "running" else (
+        build.status == "queued" and utcnow() - build.created_at > QUEUED_GRACE
+    )
+    if lost:
+        build.status = "failed"
+        build.error = "interrupted: the building process exited"
+        build.finished_at = utcnow()
+        db.commit()
+    return build
+
+
+def active_build(db: Session) -> Optional[models.IndexBuild]:
+    Build = models.IndexBuild
+    for build in db.query(Build).filter(Build.status.in_(("queued", "running"))).order_by(Build.build_id):
+        if _reap(db, build).status != "failed":
+            return build
+    return None
+
+
+def start_build(db: Session, method: str, lists: Optional[int] = None, m: int = vector_index.HNSW_M,
+                ef_construction: int = vector_index.HNSW_EF_CONSTRUCTION) -> models.IndexBuild:
+    """Record a build and run it in a background thread; raises BuildRunning if one is in progress"""
+    active = active_build(db)
+    if active is not None:
+        raise BuildRunning(active)
+    build = models.IndexBuild(
+        status="queued", method=method, params={"lists": lists, "m": m, "ef_construction": ef_construction}
+    )
+    db.add(build)
+    db.commit()
+    db.refresh(build)
+    threading.Thread(target=_run, args=(build.build_id,), name=f"index-build-{build.build_id}", daemon=True).start()
+    return build
+
+
+def _finish(build_id: int, **values):
+    with WorkerSessionLocal() as db:
+        db.query(models.IndexBuild).filter(models.IndexBuild.build_id == build_id).update(
+            {**values, "finished_at": utcnow()}, synchronize_session=False
+        )
+        db.commit()
+
+
+def _run(build_id: int):
+    # The session lock lives on a connection of its own, held until the build ends
+    with worker_engine.connect().execution_options(isolation_level="AUTOCOMMIT") as lock:
+        if not lock.execute(text(f"SELECT pg_try_advisory_lock({BUILD_LOCK})")).scalar():
+            _finish(build_id, status="failed", error="another index build is running")
+            return
+        try:
+            with WorkerSessionLocal() as db:
+                build = db.get(models.IndexBuild, build_id)
+                build.status = "running"
+                build.pid = lock.execute(text("SELECT pg_backend_pid()")).scalar()
+                build.started_at = utcnow()
+                method, params = build.method, build.params or {}
+                db.commit()
+            try:
+                result = vector_index.build_index(worker_engine, method=method, **params)
+            except Exception as e:
+                _finish(build_id, status="failed", error=f"{type(e).__name__}: {e}")
+            else:
+                _finish(build_id, status="succeeded", result=result)
+        finally:
+            # Pooled connections outlive the checkout, so the session lock is released explicitly
+            lock.execute(text(f"SELECT pg_advisory_unlock({BUILD_LOCK})"))
+
+
+def build_status(db: Session, build_id: int) -> Optional[Dict]:
+    build = db.get(models.IndexBuild, build_id)
+    if build is None:
+        return None
+    _reap(db, build)
+    progress = []
+    if build.status == "running":
+        progress = [dict(row) for row in db.execute(text(
+            "SELECT relid::regclass::text AS relation, index_relid::regclass::text AS index, phase, "
+            "blocks_done, blocks_total, tuples_done, tuples_total, partitions_done, partitions_total "
+            "FROM pg_stat_progress_create_index WHERE relid::regclass::text LIKE 'document_chunks%'"
+        )).mappings()]
+        db.rollback()
+    return {**{column.name: getattr(build, column.name) for column in build.__table__.columns}, "progress": progress}
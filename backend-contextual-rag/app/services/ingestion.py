@@ -0,0 +1,129 @@
+import asyncio
+from typing import Callable, Dict, List, Optional
+from sqlalchemy.orm import Session
+from ..models import models
+from . import partitions
+from .answer_cache import answer_cache
+from .chunk_diff import ChunkDiff
+from .chunk_writer import update_chunk_positions, write_chunks
+from .conversion import CHUNK_MAX_TOKENS, INGEST_PROFILE, resolve_profile
+from .document_processor import DocumentProcessor
+from .embeddings import EmbeddingStats
+
+def _save_batch(db: Session, document: models.Document, document_id: int, batch: List[Dict], saved: int,
+                diff: Optional[ChunkDiff] = None, check_lease: Callable[[], None] = lambda: None):
+    check_lease()
+    write_chunks(db, (
+        {
+            "document_id": document_id,
+            "user_id": document.user_id or 0,
+            "visibility": document.visibility or "private",
+            "chunk_content": chunk_data["content"],
+            "metadata": chunk_data["metadata"],
+            "vector": chunk_data["embedding"],
+            "content_hash": chunk_data["content_hash"],
+            "chunk_index": chunk_data["chunk_index"],
+        }
+        for chunk_data in batch if chunk_data["chunk_id"] is None
+    ))
+    if diff is not None:
+        # Kept chunks keep their row and vector, only their position may have moved
+        update_chunk_positions(db, [
+            chunk_data for chunk_data in batch
+            if chunk_data["chunk_id"] is not None and diff.needs_update(chunk_data)
+        ], document.user_id or 0)
+    # Progress is committed with the rows, so readers see chunks as they land
+    document.meta_data = {**(document.meta_data or {}), "progress": {"chunks_saved": saved}}
+    db.commit()
+
+def _start(db: Session, document: models.Document, profile: str, max_tokens: int, incremental: bool,
+           check_lease: Callable[[], None] = lambda: None) -> Optional[ChunkDiff]:
+    check_lease()
+    # Before the diff reads the chunks: the partition is created in a transaction of its own
+    partitions.ensure_tenant(db, document.user_id or 0)
+    document.meta_data = {**(document.meta_data or {}), "profile": profile, "chunking": {"max_tokens": max_tokens}}
+
+    # Answers cited this document's old chunks; lookups would also reject them once it changes
+    answer_cache.invalidate_documents(db, [document.document_id])
+
+    if incremental:
+        diff = ChunkDiff.load(db, document.document_id)
+        # Kept chunks follow the document if its owner or visibility changed since they were written
+        partitions.sync_document(db, document)
+        return diff
+    # A retried job may follow a run that died part-way, start from a clean slate
+    db.query(models.DocumentChunk).filter(
+        models.DocumentChunk.document_id == document.document_id
+    ).delete(synchronize_session=False)
+    db.commit()
+    return None
+
+def _finish(db: Session, document: models.Document, diff: Optional[ChunkDiff], embedding_stats: EmbeddingStats,
+            check_lease: Callable[[], None] = lambda: None):
+    check_lease()
+    if diff is not None:
+        removed = diff.removed_ids()
+        if removed:
+            # _start moved the kept chunks to the owner's partition, user_id prunes to it
+            db.query(models.DocumentChunk).filter(
+                models.DocumentChunk.user_id == (document.user_id or 0),
+                models.DocumentChunk.chunk_id.in_(removed)
+            ).delete(synchronize_session=False)
+        document.meta_data = {**(document.meta_data or {}), "revision": diff.summary()}
+
+    # Update document status
+    document.status = "processed"
+    document.meta_data = {**(document.meta_data or {}), "embedding_stats": embedding_stats.as_dict()}
+    db.commit()
+
+async def ingest_document(
+    db: Session,
+    processor: DocumentProcessor,
+    document_id: int,
+    source: str,
+    filename: str,
+    on_stage: Optional[Callable[[str], None]] = None,
+    incremental: bool = False,
+    profile: str = INGEST_PROFILE,
+    check_lease: Optional[Callable[[], None]] = None,
+    max_tokens: Optional[int] = None,
+):
+    """Process document and stream chunks with embeddings into the database.
+
+    With incremental=True the new version is diffed against the stored chunks:
+    only added or changed text is embedded and inserted, removed chunks are
+    deleted at the end and unchanged chunks keep their rows and vectors.
+    Re-chunk jobs use the same path: conversion comes from the artifact cache
+    and only chunks whose text changed under the new settings are embedded.
+
+    check_lease runs at the start of every write transaction and raises to
+    abort the run, e.g. when a queue worker's job lease was lost. max_tokens
+    is the chunk size limit, CHUNK_MAX_TOKENS when not given.
+    """
+    on_stage = on_stage or (lambda stage: None)
+    max_tokens = max_tokens or CHUNK_MAX_TOKENS
+    check_lease = check_lease or (lambda: None)
+    # Every blocking session call runs in a thread, the loop keeps conversion and embedding moving
+    document = await asyncio.to_thread(
+        lambda: db.query(models.Document).filter(models.Document.document_id == document_id).first()
+    )
+    if not document:
+        return
+    file_hash = document.file_hash  # Read before _start commits and expires the document
+
+    # Decided up front (auto checks for a text layer) so the choice is recorded on the document
+    profile = await asyncio.to_thread(resolve_profile, source, profile)
+    diff = await asyncio.to_thread(_start, db, document, profile, max_tokens, incremental, check_lease)
+
+    saved, embedding_stats = 0, EmbeddingStats()
+    reuse = diff.match if diff else None
+    async for batch, batch_stats in processor.stream_document(source, filename, reuse=reuse, profile=profile,
+                                                              file_hash=file_hash, max_tokens=max_tokens):
+        saved += len(batch)
+        embedding_stats.add(batch_stats)
+        await asyncio.to_thread(_save_batch, db, document, document_id, batch, saved, diff, check_lease)
+        if saved == len(batch):
+            on_stage("first_batch_saved")
+
+    await asyncio.to_thread(_finish, db, document, diff, embedding_stats, check_lease)
+    on_stage("saved")
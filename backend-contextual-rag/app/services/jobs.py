@@ -0,0 +1,199 @@
+import os
+import random
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import Session
+
+from ..models import models
+
+JOB_VISIBILITY_TIMEOUT = int(os.getenv("JOB_VISIBILITY_TIMEOUT", "300"))  # seconds
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_BACKOFF_BASE = float(os.getenv("JOB_BACKOFF_BASE", "10"))  # seconds, doubled per attempt
+JOB_BACKOFF_MAX = float(os.getenv("JOB_BACKOFF_MAX", "900"))
+
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def db_now_plus(seconds: float):
+    """The database clock plus seconds. Leases and run_after are set and compared on the
+    database's clock only, so a worker whose clock runs ahead can't take over a live lease."""
+    return func.now() + timedelta(seconds=seconds)
+
+
+def enqueue_job(db: Session, document_id: int, file_name: str, file_url: str,
+                mode: str = "create", profile: str = "auto",
+                chunk_max_tokens: Optional[int] = None) -> models.IngestionJob:
+    """Add a job to the session, committed together with the caller's document"""
+    job = models.IngestionJob(
+        document_id=document_id,
+        status="queued",
+        mode=mode,
+        profile=profile,
+        chunk_max_tokens=chunk_max_tokens,
+        file_name=file_name,
+        file_url=file_url,
+        max_attempts=JOB_MAX_ATTEMPTS,
+        stages={"queued": utcnow().isoformat()},
+    )
+    db.add(job)
+    return job
+
+
+def has_active_job(db: Session, document_id: int) -> bool:
+    Job = models.IngestionJob
+    return db.query(Job.job_id).filter(
+        Job.document_id == document_id,
+        Job.status.in_(("queued", "running")),
+    ).first() is not None
+
+
+def claim_job(db: Session, worker_id: str, visibility_timeout: int = JOB_VISIBILITY_TIMEOUT) -> Optional[models.IngestionJob]:
+    """Claim the next runnable job; SKIP LOCKED lets many workers poll the same table"""
+    Job = models.IngestionJob
+    while True:
+        now = utcnow()  # Only for timestamps shown to people
+        job = (
+            db.query(Job)
+            .filter(or_(
+                and_(Job.status == "queued", Job.run_after <= func.now()),
+                # A running job whose lease expired belongs to a crashed worker
+                and_(Job.status == "running", Job.locked_until < func.now()),
+            ))
+            .order_by(Job.run_after, Job.job_id)
+            .with_for_update(skip_locked=True)
+            .limit(1)
+            .first()
+        )
+        if job is None:
+            db.commit()
+            return None
+
+        if job.attempts >= job.max_attempts:
+            _mark_failed(job, job.last_error or "worker lease expired", now)
+            db.commit()
+            continue
+
+        job.status = "running"
+        job.attempts += 1
+        job.locked_by = worker_id
+        job.locked_until = db_now_plus(visibility_timeout)
+        job.started_at = job.started_at or now
+        job.stages = {**(job.stages or {}), f"claimed_{job.attempts}": now.isoformat()}
+        db.commit()
+        return job
+
+
+def heartbeat(db: Session, job_id: int, worker_id: str, visibility_timeout: int = JOB_VISIBILITY_TIMEOUT) -> bool:
+    """Extend the lease; returns False if another worker has taken the job over"""
+    Job = models.IngestionJob
+    updated = db.query(Job).filter(
+        Job.job_id == job_id,
+        Job.locked_by == worker_id,
+        Job.status == "running",
+    ).update(
+        {Job.locked_until: db_now_plus(visibility_timeout)},
+        synchronize_session=False,
+    )
+    db.commit()
+    return updated == 1
+
+
+class LeaseLost(Exception):
+    """The job's lease expired or another worker claimed it; the run must stop writing"""
+
+
+def _update_owned(db: Session, job_id: int, worker_id: str, values: Dict):
+    """Update the job only while worker_id still holds it; rolls back and raises LeaseLost otherwise"""
+    Job = models.IngestionJob
+    updated = db.query(Job).filter(
+        Job.job_id == job_id,
+        Job.locked_by == worker_id,
+        Job.status == "running",
+    ).update(values, synchronize_session=False)
+    if updated != 1:
+        db.rollback()
+        raise LeaseLost(f"job {job_id} is no longer held by {worker_id}")
+
+
+def hold_lease(db: Session, job_id: int, worker_id: str):
+    """Share-lock the job row in the caller's transaction while the lease is valid.
+
+    Writes committed in that transaction can't race a takeover: claim_job skips
+    the locked row, and a lease that already expired raises LeaseLost instead.
+    """
+    Job = models.IngestionJob
+    held = db.query(Job.job_id).filter(
+        Job.job_id == job_id,
+        Job.locked_by == worker_id,
+        Job.status == "running",
+        Job.locked_until > func.now(),
+    ).with_for_update(read=True).first()
+    if held is None:
+        db.rollback()
+        raise LeaseLost(f"job {job_id} is no longer held by {worker_id}")
+
+
+def record_stage(db: Session, job: models.IngestionJob, worker_id: str, stage: str):
+    _update_owned(db, job.job_id, worker_id, {
+        models.IngestionJob.stages: {**(job.stages or {}), stage: utcnow().isoformat()},
+    })
+    db.commit()
+
+
+def complete_job(db: Session, job: models.IngestionJob, worker_id: str):
+    now = utcnow()
+    _update_owned(db, job.job_id, worker_id, {
+        models.IngestionJob.status: "succeeded",
+        models.IngestionJob.locked_by: None,
+        models.IngestionJob.locked_until: None,
+        models.IngestionJob.finished_at: now,
+        models.IngestionJob.stages: {**(job.stages or {}), "finished": now.isoformat()},
+    })
+    db.commit()
+
+
+def retry_delay(attempts: int) -> float:
+    delay = min(JOB_BACKOFF_MAX, JOB_BACKOFF_BASE * 2 ** max(0, attempts - 1))
+    return delay * random.uniform(0.8, 1.2)  # Jitter so failed jobs don't retry in lockstep
+
+
+def fail_job(db: Session, job: models.IngestionJob, worker_id: str, error: str) -> bool:
+    """Reschedule with backoff, or fail permanently; returns True if the job will retry"""
+    Job = models.IngestionJob
+    now = utcnow()
+    values = {Job.last_error: error, Job.locked_by: None, Job.locked_until: None}
+    retrying = job.attempts < job.max_attempts
+    if retrying:
+        values.update({
+            Job.status: "queued",
+            Job.run_after: db_now_plus(retry_delay(job.attempts)),
+            Job.stages: {**(job.stages or {}), f"retry_{job.attempts}": now.isoformat()},
+        })
+    else:
+        values.update({
+            Job.status: "failed",
+            Job.finished_at: now,
+            Job.stages: {**(job.stages or {}), "failed": now.isoformat()},
+        })
+    _update_owned(db, job.job_id, worker_id, values)
+    if not retrying and job.document is not None:
+        job.document.status = "failed"
+        job.document.meta_data = {**(job.document.meta_data or {}), "error": error}
+    db.commit()
+    return retrying
+
+
+def _mark_failed(job: models.IngestionJob, error: str, now: datetime):
+    job.status = "failed"
+    job.last_error = error
+    job.locked_by = None
+    job.locked_until = None
+    job.finished_at = now
+    job.stages = {**(job.stages or {}), "failed": now.isoformat()}
+    if job.document is not None:
+        job.document.status = "failed"
+        job.document.meta_data = {**(job.document.meta_data or {}), "error": error}
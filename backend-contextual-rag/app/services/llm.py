@@ -0,0 +1,65 @@
+"""Chat models that stream answers token by token.
+
+LLM_PROVIDER picks OpenAI chat completions or a local fake that needs no
+network: it answers with the start of the first context passage, word by
+word, after LLM_FAKE_LATENCY seconds and LLM_FAKE_TOKEN_DELAY per word, so
+streaming and latency tracking can be exercised offline.
+"""
+import asyncio
+import os
+import re
+from typing import AsyncIterator, Dict, List
+
+from openai import AsyncOpenAI
+
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "openai")  # "openai" or "fake"
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.2"))
+LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "800"))
+LLM_FAKE_LATENCY = float(os.getenv("LLM_FAKE_LATENCY", "0.2"))  # seconds before the first token
+LLM_FAKE_TOKEN_DELAY = float(os.getenv("LLM_FAKE_TOKEN_DELAY", "0.02"))
+
+_CONTEXT_RE = re.compile(r"^\[1\][^\n]*\n(.+?)(?:\n\n\[\d+\]|\Z)", re.MULTILINE | re.DOTALL)
+
+
+class OpenAIChat:
+    def __init__(self, model: str = LLM_MODEL):
+        self.model = model
+        self.client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+    async def stream(self, messages: List[Dict]) -> AsyncIterator[str]:
+        response = await self.client.chat.completions.create(
+            model=self.model, messages=messages, stream=True,
+            temperature=LLM_TEMPERATURE, max_tokens=LLM_MAX_TOKENS,
+        )
+        async for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+
+class FakeChat:
+    """Deterministic offline model for tests and benchmarks"""
+
+    def __init__(self, model: str = "fake-chat", latency: float = LLM_FAKE_LATENCY,
+                 token_delay: float = LLM_FAKE_TOKEN_DELAY, max_words: int = 60):
+        self.model = model
+        self.latency = latency
+        self.token_delay = token_delay
+        self.max_words = max_words
+
+    async def stream(self, messages: List[Dict]) -> AsyncIterator[str]:
+        match = _CONTEXT_RE.search(messages[-1]["content"])
+        words = match.group(1).split()[:self.max_words] if match else ["I", "could", "not", "find", "that."]
+        await asyncio.sleep(self.latency)
+        for i, word in enumerate(words + ["[1]"] if match else words):
+            if i:
+                await asyncio.sleep(self.token_delay)
+            yield word if i == 0 else " " + word
+
+
+def get_llm(provider: str = LLM_PROVIDER):
+    if provider == "fake":
+        return FakeChat()
+    if provider == "openai":
+        return OpenAIChat()
+    raise ValueError(f"Unknown LLM provider: {provider}")
@@ -0,0 +1,54 @@
+"""Keyset pagination for list endpoints.
+
+A page is ordered on a unique key, e.g. (created_at, id), and the next page
+starts after the last key seen instead of at an offset, so every page costs
+one index range scan however deep it is. The cursor handed to clients is the
+last key, base64-encoded; routes return it in the X-Next-Cursor header, which
+is absent on the last page.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Select, tuple_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    raw = json.dumps([value.isoformat() if isinstance(value, datetime) else value for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, columns: Sequence) -> Tuple:
+    """Key values of the cursor, typed like the columns; ValueError when malformed"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError
+        return tuple(
+            datetime.fromisoformat(value) if column.type.python_type is datetime else column.type.python_type(value)
+            for column, value in zip(columns, values)
+        )
+    except (ValueError, TypeError, NotImplementedError):
+        raise ValueError("Invalid cursor") from None
+
+
+def keyset(statement: Select, columns: Sequence, cursor: Optional[str], limit: Optional[int],
+           descending: bool = False) -> Select:
+    """Order by the key columns and start after the cursor; fetches one extra row to detect a next page"""
+    if cursor:
+        key, after = tuple_(*columns), tuple_(*decode_cursor(cursor, columns))
+        statement = statement.where(key < after if descending else key > after)
+    statement = statement.order_by(*(column.desc() if descending else column.asc() for column in columns))
+    return statement.limit(limit + 1) if limit is not None else statement
+
+
+def page(rows: List, limit: int, key: Callable[[Any], Sequence]) -> Tuple[List, Optional[str]]:
+    """Trim the extra row of keyset() and return (rows, cursor of the next page or None)"""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(key(rows[-1]))
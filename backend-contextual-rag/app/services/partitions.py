@@ -0,0 +1,215 @@
+"""Tenant partitions of document_chunks.
+
+Chunks carry their document's user_id and visibility, and the table is
+partitioned on user_id (CHUNK_PARTITIONING, declared on the model):
+
+- list (default): one partition per tenant, created on its first write, plus
+  a default partition for unowned chunks. A tenant's searches only touch its
+  own rows and index, however large the others are.
+- hash: CHUNK_PARTITIONS partitions created with the table, each holding
+  a fixed share of the tenants. A small tenant still shares a graph with
+  1/CHUNK_PARTITIONS of the others, so filtered ANN search keeps losing
+  recall, only CHUNK_PARTITIONS times less. For more tenants than list
+  partitions can plan quickly (thousands).
+- none: a single table, as before partitioning.
+
+Indexes declared on the model exist on every partition, so each partition
+has its own HNSW graph, and a search filtered on user_id = X is pruned to one
+partition by the planner. Statements that address chunks by chunk_id also
+filter on user_id for the same reason; chunk_id alone probes every partition.
+migrate() converts an existing flat table.
+"""
+import os
+import threading
+from typing import Dict, List, Optional, Set
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from ..models import models
+from ..models.models import CHUNK_PARTITIONING
+
+_known: Set[int] = set()  # Tenants whose list partition exists
+_known_lock = threading.Lock()
+_layout: Optional[str] = None  # How the existing table is partitioned, read once per process
+# Creating a partition waits this long for document_chunks behind running queries before failing
+PARTITION_LOCK_TIMEOUT_MS = int(os.getenv("PARTITION_LOCK_TIMEOUT_MS", "5000"))
+
+
+def partition_name(user_id: int) -> str:
+    """A tenant's own partition in list mode"""
+    return f"document_chunks_u{int(user_id)}"
+
+
+def is_partitioned(db) -> bool:
+    return bool(db.execute(text(
+        "SELECT relkind = 'p' FROM pg_class WHERE oid = 'document_chunks'::regclass"
+    )).scalar())
+
+
+def table_layout(db) -> str:
+    """list, hash or none, as the existing document_chunks was created"""
+    global _layout
+    if _layout is None:
+        strategy = db.execute(text(
+            "SELECT partstrat FROM pg_partitioned_table WHERE partrelid = to_regclass('document_chunks')"
+        )).scalar()
+        _layout = {"l": "list", "h": "hash"}.get(strategy, "none")
+    return _layout
+
+
+def _holds_partition_locks(db: Session) -> bool:
+    """Whether the session's transaction holds a lock that creating a partition would wait for.
+
+    That is any lock on document_chunks or a partition, or a write lock on documents,
+    which the partition's foreign key needs to share-lock. Reads the catalogs only,
+    so the check takes no table locks itself.
+    """
+    return bool(db.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_locks WHERE pid = pg_backend_pid() AND locktype = 'relation' AND ("
+        "relation = 'document_chunks'::regclass "
+        "OR relation IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = 'document_chunks'::regclass) "
+        "OR (relation = 'documents'::regclass AND mode NOT IN ('AccessShareLock', 'RowShareLock'))))"
+    )).scalar())
+
+
+def ensure_tenant(db: Session, user_id: int):
+    """Create the tenant's list partition if missing, in a short transaction of its own.
+
+    CREATE TABLE ... PARTITION OF locks document_chunks exclusively until it
+    commits, so riding along with the caller's write would block every search
+    until that commits. Call it before the caller's transaction writes documents
+    or reads document_chunks; the DDL can't wait for locks its own caller holds.
+    """
+    if CHUNK_PARTITIONING != "list" or not user_id or user_id in _known:
+        return
+    # A table created under another CHUNK_PARTITIONING keeps its layout until migrated
+    if table_layout(db) != "list":
+        return
+    name = partition_name(user_id)
+    if not db.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name}).scalar():
+        if _holds_partition_locks(db):
+            raise RuntimeError(
+                f"Partition {name} has to be created before the transaction writes documents or reads chunks"
+            )
+        with db.get_bind().engine.begin() as conn:
+            conn.execute(text(f"SET LOCAL lock_timeout = {PARTITION_LOCK_TIMEOUT_MS}"))
+            # Serializes creators of the same partition across workers
+            conn.execute(text("SELECT pg_advisory_xact_lock(hashtext('document_chunks'), :user_id)"),
+                         {"user_id": user_id})
+            if not conn.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name}).scalar():
+                # Fails if the default partition already holds rows of this tenant, rather than hiding them
+                conn.execute(text(
+                    f"CREATE TABLE {name} PARTITION OF document_chunks FOR VALUES IN ({int(user_id)})"
+                ))
+    with _known_lock:
+        _known.add(user_id)
+
+
+def tenant_partition(db: Session, user_id: int) -> str:
+    """Name of the partition that holds (or would hold) the tenant's chunks"""
+    plan = db.execute(text(
+        "EXPLAIN (COSTS OFF) SELECT 1 FROM document_chunks WHERE user_id = :user_id"
+    ), {"user_id": user_id}).scalars().all()
+    db.rollback()
+    for line in plan:
+        if " on " in line:
+            return line.split(" on ", 1)[1].split()[0]
+    return "document_chunks"
+
+
+def sync_document(db: Session, document: models.Document) -> int:
+    """Copy the document's owner and visibility onto its chunks if they changed; the caller commits"""
+    user_id = document.user_id or 0
+    visibility = document.visibility or "private"
+    ensure_tenant(db, user_id)
+    # Changing user_id moves the rows to the new owner's partition
+    return db.execute(text(
+        "UPDATE document_chunks SET user_id = :user_id, visibility = :visibility "
+        "WHERE document_id = :document_id AND (user_id, visibility) IS DISTINCT FROM (:user_id, :visibility)"
+    ), {"user_id": user_id, "visibility": visibility, "document_id": document.document_id}).rowcount
+
+
+def partitions(db: Session) -> List[Dict]:
+    """Rows, tenants and bytes of each partition, with its indexes"""
+    rows = db.execute(text(
+        "SELECT c.relname AS name, pg_get_expr(c.relpartbound, c.oid) AS bound, "
+        "pg_relation_size(c.oid) AS table_bytes, pg_indexes_size(c.oid) AS index_bytes "
+        "FROM pg_partition_tree('document_chunks') t JOIN pg_class c ON c.oid = t.relid "
+        "WHERE t.isleaf ORDER BY c.relname"
+    )).mappings().all()
+    counts = {
+        row.partition: row for row in db.execute(text(
+            "SELECT tableoid::regclass::text AS partition, count(*) AS rows, count(DISTINCT user_id) AS tenants "
+            "FROM document_chunks GROUP BY 1"
+        ))
+    }
+    db.rollback()
+    return [
+        {
+            **row,
+            "rows": counts[row["name"]].rows if row["name"] in counts else 0,
+            "tenants": counts[row["name"]].tenants if row["name"] in counts else 0,
+        }
+        for row in rows
+    ]
+
+
+def migrate(engine: Engine) -> Dict:
+    """Rebuild a flat document_chunks as the configured partitioned table, keeping chunk ids.
+
+    Runs in one transaction and holds the table locked while rows are copied
+    and the indexes of every partition are built; plan it for a quiet window.
+    """
+    table = models.DocumentChunk.__table__
+    with engine.begin() as conn:
+        if is_partitioned(conn):
+            return {"migrated": False, "partitioning": CHUNK_PARTITIONING}
+        if CHUNK_PARTITIONING == "none":
+            # Stays flat, only gains the denormalized columns
+            conn.execute(text(
+                "ALTER TABLE document_chunks ADD COLUMN IF NOT EXISTS user_id integer NOT NULL DEFAULT 0, "
+                "ADD COLUMN IF NOT EXISTS visibility varchar(20) NOT NULL DEFAULT 'private'"
+            ))
+            updated = conn.execute(text(
+                "UPDATE document_chunks c SET user_id = coalesce(d.user_id, 0), "
+                "visibility = coalesce(d.visibility, 'private') FROM documents d WHERE d.document_id = c.document_id"
+            )).rowcount
+            return {"migrated": True, "partitioning": CHUNK_PARTITIONING, "rows": updated}
+        conn.execute(text("LOCK TABLE document_chunks IN ACCESS EXCLUSIVE MODE"))
+        conn.execute(text("ALTER TABLE document_chunks RENAME TO document_chunks_flat"))
+        # The new table reuses the index, constraint and sequence names
+        for index in table.indexes:
+            conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+        conn.execute(text("ALTER TABLE document_chunks_flat RENAME CONSTRAINT document_chunks_pkey TO document_chunks_flat_pkey"))
+        conn.execute(text("ALTER SEQUENCE document_chunks_chunk_id_seq RENAME TO document_chunks_flat_chunk_id_seq"))
+        table.create(conn)
+        if CHUNK_PARTITIONING == "list":
+            for (user_id,) in conn.execute(text(
+                "SELECT DISTINCT d.user_id FROM document_chunks_flat c JOIN documents d ON d.document_id = c.document_id "
+                "WHERE d.user_id IS NOT NULL"
+            )):
+                conn.execute(text(
+                    f"CREATE TABLE {partition_name(user_id)} PARTITION OF document_chunks FOR VALUES IN ({int(user_id)})"
+                ))
+        columns = "chunk_id, document_id, chunk_content, vector, vector_short, vector_bits, metadata, " \
+                  "content_hash, chunk_index, created_at"
+        copied = conn.execute(text(
+            f"INSERT INTO document_chunks ({columns}, user_id, visibility) "
+            f"SELECT {', '.join('c.' + column.strip() for column in columns.split(','))}, "
+            "coalesce(d.user_id, 0), coalesce(d.visibility, 'private') "
+            "FROM document_chunks_flat c JOIN documents d ON d.document_id = c.document_id"
+        )).rowcount
+        conn.execute(text(
+            "SELECT setval(pg_get_serial_sequence('document_chunks', 'chunk_id'), "
+            "coalesce((SELECT max(chunk_id) FROM document_chunks), 0) + 1, false)"
+        ))
+        conn.execute(text("DROP TABLE document_chunks_flat"))
+    return {"migrated": True, "partitioning": CHUNK_PARTITIONING, "rows": copied}
+
+
+if __name__ == "__main__":
+    from ..database import worker_engine
+
+    print(migrate(worker_engine))
@@ -0,0 +1,60 @@
+"""Small async-iterator helpers for the convert -> embed -> insert pipeline"""
+import asyncio
+import os
+from contextlib import suppress
+from typing import AsyncIterator, List, TypeVar
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))  # chunks per embed/insert batch
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "2"))  # batches buffered between stages
+
+T = TypeVar("T")
+
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+async def staged(source: AsyncIterator[T], maxsize: int) -> AsyncIterator[T]:
+    """Run source in its own task, at most maxsize items ahead of the consumer.
+
+    The bounded queue is the backpressure: a slow consumer stalls the producer
+    instead of letting items pile up in memory. Producer errors are re-raised here.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, maxsize))
+
+    async def pump():
+        try:
+            async for item in source:
+                await queue.put(item)
+        except Exception as e:
+            await queue.put(_Failure(e))
+            return
+        await queue.put(_DONE)
+
+    task = asyncio.create_task(pump())
+    try:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+
+
+async def batched(source: AsyncIterator[T], size: int) -> AsyncIterator[List[T]]:
+    batch: List[T] = []
+    async for item in source:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,193 @@
+"""Embedding cache for search queries.
+
+Questions repeat far more than chunks do, but unlike chunk vectors (see
+embedding_cache.py) query vectors are cheap to lose and users rephrase, so the
+key is looser and entries expire: the query is NFKC-normalized, case-folded and
+whitespace-collapsed, and lives QUERY_CACHE_TTL seconds. An in-process LRU
+answers repeats on the same worker; the optional query_embedding_cache table
+shares vectors between API processes.
+"""
+import asyncio
+import hashlib
+import os
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy.dialects.postgresql import insert
+
+from ..database import SessionLocal
+from ..models import models
+from .embeddings import BatchEmbedder, EmbeddingStats
+
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "5000"))
+QUERY_CACHE_TTL = int(os.getenv("QUERY_CACHE_TTL", "86400"))  # seconds
+QUERY_CACHE_SHARED = os.getenv("QUERY_CACHE_SHARED", "true").lower() == "true"
+QUERY_CACHE_PURGE_INTERVAL = 3600  # seconds between deletes of expired shared rows
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(unicodedata.normalize("NFKC", query).casefold().split())
+
+
+def query_hash(query: str) -> str:
+    return hashlib.sha256(normalize_query(query).encode("utf-8")).hexdigest()
+
+
+class QueryEmbeddingCache:
+    """TTL'd LRU of query vectors, optionally backed by the query_embedding_cache table"""
+
+    def __init__(self, max_entries: int = QUERY_CACHE_SIZE, ttl: int = QUERY_CACHE_TTL,
+                 session_factory=SessionLocal, shared: bool = QUERY_CACHE_SHARED):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.session_factory = session_factory
+        self.shared = shared
+        self._lru: "OrderedDict[Tuple[str, str, int], Tuple[np.ndarray, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.expired = 0
+        # Latency of calls answered entirely from the cache vs calls that had to embed
+        self.hit_calls = 0
+        self.hit_seconds = 0.0
+        self.miss_calls = 0
+        self.miss_seconds = 0.0
+        self._last_purge = time.monotonic()
+
+    def _remember(self, key: Tuple[str, str, int], vector, expires_at: float) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._lru[key] = (vector, expires_at)
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+        return vector
+
+    def _memory_get(self, key: Tuple[str, str, int]):
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._lru[key]
+                self.expired += 1
+                return None
+            self._lru.move_to_end(key)
+            return entry[0]
+
+    def _db_get(self, hashes: Sequence[str], model: str, dimension: int) -> Dict[str, np.ndarray]:
+        Entry = models.QueryEmbeddingEntry
+        found = {}
+        with self.session_factory() as db:
+            rows = db.query(Entry.query_hash, Entry.vector, Entry.created_at).filter(
+                Entry.model == model,
+                Entry.dimension == dimension,
+                Entry.query_hash.in_(hashes),
+                Entry.created_at > datetime.now(timezone.utc) - timedelta(seconds=self.ttl),
+            ).all()
+        for h, vector, created_at in rows:
+            # Keep the shared entry's deadline rather than starting a fresh TTL
+            remaining = self.ttl - (datetime.now(timezone.utc) - created_at).total_seconds()
+            found[h] = self._remember((h, model, dimension), vector, time.monotonic() + remaining)
+        return found
+
+    def _db_put(self, items: Dict[str, np.ndarray], model: str, dimension: int):
+        Entry = models.QueryEmbeddingEntry
+        rows = [{"query_hash": h, "model": model, "dimension": dimension, "vector": vector}
+                for h, vector in items.items()]
+        stmt = insert(Entry).values(rows)
+        with self.session_factory() as db:
+            # An expired row is replaced, which restarts its TTL
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=[Entry.query_hash, Entry.model, Entry.dimension],
+                set_={"vector": stmt.excluded.vector, "created_at": stmt.excluded.created_at},
+            ))
+            db.commit()
+        if time.monotonic() - self._last_purge > QUERY_CACHE_PURGE_INTERVAL:
+            self._last_purge = time.monotonic()
+            self.purge()
+
+    def purge(self) -> int:
+        """Delete expired shared entries"""
+        Entry = models.QueryEmbeddingEntry
+        with self.session_factory() as db:
+            deleted = db.query(Entry).filter(
+                Entry.created_at <= datetime.now(timezone.utc) - timedelta(seconds=self.ttl)
+            ).delete(synchronize_session=False)
+            db.commit()
+        return deleted
+
+    async def embed(self, queries: Sequence[str], embedder: BatchEmbedder) -> Tuple[List[np.ndarray], EmbeddingStats]:
+        """Vectors for the queries, sending only uncached ones to the embedder"""
+        start = time.perf_counter()
+        model, dimension = embedder.model, embedder.dimension
+        hashes = [query_hash(query) for query in queries]
+        found: Dict[str, np.ndarray] = {}
+        for h in dict.fromkeys(hashes):
+            vector = self._memory_get((h, model, dimension))
+            if vector is not None:
+                found[h] = vector
+        memory_hits = len(found)
+
+        missing = [h for h in dict.fromkeys(hashes) if h not in found]
+        if missing and self.shared:
+            found.update(await asyncio.to_thread(self._db_get, missing, model, dimension))
+        db_hits = len(found) - memory_hits
+        hit_seconds = time.perf_counter() - start
+
+        to_embed = {h: query for h, query in zip(hashes, queries) if h not in found}
+        stats = EmbeddingStats()
+        if to_embed:
+            vectors, stats = await embedder.embed(list(to_embed.values()))
+            fresh = {
+                h: self._remember((h, model, dimension), vector, time.monotonic() + self.ttl)
+                for h, vector in zip(to_embed.keys(), vectors)
+            }
+            if self.shared:
+                await asyncio.to_thread(self._db_put, fresh, model, dimension)
+            found.update(fresh)
+
+        with self._lock:
+            self.memory_hits += memory_hits
+            self.db_hits += db_hits
+            self.misses += len(to_embed)
+            if to_embed:
+                self.miss_calls += 1
+                self.miss_seconds += time.perf_counter() - start
+            else:
+                self.hit_calls += 1
+                self.hit_seconds += hit_seconds
+        stats.cache_hits = len(queries) - len(to_embed)
+        stats.chunks = len(queries)
+        stats.seconds = time.perf_counter() - start
+        return [found[h] for h in hashes], stats
+
+    def stats(self) -> Dict:
+        hits = self.memory_hits + self.db_hits
+        lookups = hits + self.misses
+        hit_ms = self.hit_seconds * 1000 / self.hit_calls if self.hit_calls else 0.0
+        miss_ms = self.miss_seconds * 1000 / self.miss_calls if self.miss_calls else 0.0
+        return {
+            "entries_in_memory": len(self._lru),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "shared": self.shared,
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "hit_ms_avg": round(hit_ms, 3),
+            "miss_ms_avg": round(miss_ms, 3),
+            # What the fully cached calls would have cost at the average miss latency
+            "saved_ms_total": round(self.hit_calls * max(0.0, miss_ms - hit_ms), 1),
+        }
+
+
+query_cache = QueryEmbeddingCache()
@@ -0,0 +1,136 @@
+"""Cross-encoder reranking of first-stage search results on CPU with ONNX Runtime.
+
+A cross-encoder reads query and chunk together, which ranks far better than
+comparing two independently made embeddings but costs a transformer pass per
+pair. Pairs are tokenized and scored in batches of up to RERANK_BATCH_SIZE on a
+small thread pool (ONNX Runtime releases the GIL), best first-stage rank first.
+A batch is only submitted when a thread is free and the budget is not spent,
+and near the end it shrinks to what the measured time per pair says still
+fits. Whatever is not scored when the latency budget runs out keeps its
+first-stage order below the reranked head.
+
+The model directory needs model.onnx and tokenizer.json, e.g. an ONNX export of
+cross-encoder/ms-marco-MiniLM-L-6-v2; without RERANK_MODEL_DIR they are fetched
+from RERANK_MODEL on the Hugging Face hub. onnxruntime and tokenizers are only
+imported when a reranker is first used.
+"""
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_MODEL_DIR = os.getenv("RERANK_MODEL_DIR")  # Local model.onnx + tokenizer.json, skips the hub
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "50"))  # First-stage pool size
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+RERANK_THREADS = int(os.getenv("RERANK_THREADS", "2"))  # Batches scored concurrently
+RERANK_INTRA_OP_THREADS = int(os.getenv("RERANK_INTRA_OP_THREADS", "2"))  # ONNX threads per batch
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", "256"))  # Tokens per (query, chunk) pair
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "200"))
+
+
+def _model_files(model: str, model_dir: Optional[str]) -> Tuple[str, str]:
+    if model_dir:
+        return os.path.join(model_dir, "model.onnx"), os.path.join(model_dir, "tokenizer.json")
+    from huggingface_hub import hf_hub_download
+
+    return hf_hub_download(model, "onnx/model.onnx"), hf_hub_download(model, "tokenizer.json")
+
+
+class CrossEncoder:
+    def __init__(self, model: str = RERANK_MODEL, model_dir: Optional[str] = RERANK_MODEL_DIR,
+                 max_length: int = RERANK_MAX_LENGTH, intra_op_threads: int = RERANK_INTRA_OP_THREADS):
+        import onnxruntime
+        from tokenizers import Tokenizer
+
+        model_path, tokenizer_path = _model_files(model, model_dir)
+        self.model = model_dir or model
+        self.tokenizer = Tokenizer.from_file(tokenizer_path)
+        self.tokenizer.enable_truncation(max_length)
+        self.tokenizer.enable_padding()  # To the longest pair of each batch
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = 1
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {item.name for item in self.session.get_inputs()}
+
+    def score(self, query: str, texts: Sequence[str]) -> np.ndarray:
+        """Relevance logit per text; higher is more relevant"""
+        encodings = self.tokenizer.encode_batch([(query, text) for text in texts])
+        inputs = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        logits = self.session.run(None, {name: value for name, value in inputs.items() if name in self.input_names})[0]
+        # One logit for relevance models, otherwise take the "relevant" class
+        return logits[:, 0] if logits.shape[1] == 1 else logits[:, -1]
+
+
+class Reranker:
+    def __init__(self, encoder: Optional[CrossEncoder] = None, batch_size: int = RERANK_BATCH_SIZE,
+                 threads: int = RERANK_THREADS):
+        self._encoder = encoder
+        self._encoder_lock = threading.Lock()
+        self.batch_size = batch_size
+        self.threads = max(1, threads)
+        self.pool = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="rerank")
+
+    @property
+    def encoder(self) -> CrossEncoder:
+        with self._encoder_lock:
+            if self._encoder is None:
+                self._encoder = CrossEncoder()
+            return self._encoder
+
+    def rerank(self, query: str, results: List[Dict], k: Optional[int] = None,
+               budget_ms: float = RERANK_BUDGET_MS) -> Tuple[List[Dict], Dict]:
+        """Reorder results (best first-stage first) by cross-encoder score within the budget"""
+        encoder = self.encoder  # Loaded on first use, outside the budget
+        start = time.perf_counter()
+        deadline = start + budget_ms / 1000
+        scores: Dict[int, float] = {}
+        pending: Dict = {}  # Future -> (indexes, submitted at)
+        submitted = 0
+        pair_seconds = None  # Wall time per pair of the last finished batch
+        while submitted < len(results) or pending:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            while submitted < len(results) and len(pending) < self.threads:
+                size = self.batch_size
+                if pair_seconds:
+                    size = min(size, int(remaining / pair_seconds))
+                    if size < 1:
+                        break  # Not even one more pair fits in the budget
+                batch = list(range(submitted, min(submitted + size, len(results))))
+                future = self.pool.submit(encoder.score, query, [results[i]["chunk_content"] for i in batch])
+                pending[future] = (batch, time.perf_counter())
+                submitted += len(batch)
+            if not pending:
+                break
+            done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                batch, started = pending.pop(future)
+                scores.update(zip(batch, future.result().tolist()))
+                pair_seconds = (time.perf_counter() - started) / len(batch)
+        for future in pending:
+            future.cancel()  # At most one batch per thread, sized to the budget, still runs and is dropped
+
+        scored = sorted(scores, key=lambda i: -scores[i])
+        unscored = [i for i in range(len(results)) if i not in scores]
+        reranked = [{**results[i], "rerank_score": scores[i]} for i in scored] + [results[i] for i in unscored]
+        stats = {
+            "model": encoder.model,
+            "candidates": len(results),
+            "scored": len(scores),
+            "timed_out": bool(unscored),
+            "ms": round((time.perf_counter() - start) * 1000, 2),
+        }
+        return reranked[:k] if k else reranked, stats
+
+
+reranker = Reranker()
@@ -0,0 +1,68 @@
+"""Content-addressed upload storage, a local stand-in for S3.
+
+Uploads are streamed to disk in fixed-size pieces while their SHA-256 is
+computed, then moved to objects/<sha[:2]>/<sha><ext>. Documents keep a
+local://objects/... URL in s3_url. Workers on other nodes need UPLOAD_DIR on
+shared storage, or an S3 implementation of resolve().
+"""
+import asyncio
+import hashlib
+import os
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+
+from fastapi import UploadFile
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+LOCAL_SCHEME = "local://"
+
+
+@dataclass
+class StoredFile:
+    url: str
+    path: str
+    sha256: str
+    size: int
+
+
+async def save_upload(file: UploadFile) -> StoredFile:
+    """Spool an upload to storage without ever holding all of it in memory"""
+    tmp_dir = os.path.join(UPLOAD_DIR, "tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    hasher = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while data := await file.read(UPLOAD_CHUNK_SIZE):
+                hasher.update(data)
+                size += len(data)
+                await asyncio.to_thread(out.write, data)
+
+        digest = hasher.hexdigest()
+        # The extension stays on the key, Docling picks its backend from it
+        key = f"objects/{digest[:2]}/{digest}{Path(file.filename or '').suffix.lower()}"
+        path = os.path.join(UPLOAD_DIR, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            os.unlink(tmp_path)  # Same bytes already stored
+        else:
+            os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return StoredFile(url=LOCAL_SCHEME + key, path=path, sha256=digest, size=size)
+
+
+def resolve(url: str) -> str:
+    """Local path for a stored file URL"""
+    if not url.startswith(LOCAL_SCHEME):
+        raise ValueError(f"Unsupported storage URL: {url}")
+    key = url[len(LOCAL_SCHEME):]
+    path = os.path.normpath(os.path.join(UPLOAD_DIR, key))
+    if not path.startswith(os.path.normpath(UPLOAD_DIR) + os.sep):
+        raise ValueError(f"Storage URL escapes UPLOAD_DIR: {url}")
+    return path
@@ -0,0 +1,71 @@
+"""Bulk export of chunk vectors as a .npy file, for offline index builds and analysis.
+
+The file holds one structured array, a record per chunk:
+    chunk_id int32, document_id int32, vector float16/float32 (dim,)
+so np.load(path)["vector"] is the matrix and ["chunk_id"] its row ids.
+Vectors are read in pgvector's binary form through a server-side cursor and
+written batch by batch, never as JSON floats and never all in memory. The row
+count in the .npy header and the rows come from one REPEATABLE READ snapshot.
+"""
+import struct
+import weakref
+from typing import AsyncIterator, Optional
+
+import numpy as np
+from pgvector.psycopg import register_vector_async
+
+from ..database import AsyncSessionLocal
+from ..models import models
+
+EXPORT_DTYPES = {"float16": "<f2", "float32": "<f4"}
+EXPORT_BATCH_SIZE = 2000
+
+_registered = weakref.WeakSet()  # Async psycopg connections with the pgvector loaders
+
+
+def record_dtype(dtype: str, dimension: int) -> np.dtype:
+    return np.dtype([("chunk_id", "<i4"), ("document_id", "<i4"), ("vector", EXPORT_DTYPES[dtype], (dimension,))])
+
+
+def npy_header(dtype: np.dtype, count: int) -> bytes:
+    """Version 1.0 .npy header for a 1-d array of count records"""
+    header = repr({"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": (count,)})
+    # Magic, version and length take 10 bytes; the data starts 64-byte aligned after the newline
+    header += " " * (-(len(header) + 11) % 64) + "\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1")
+
+
+async def export_npy(document_id: Optional[int] = None, user_id: Optional[int] = None,
+                     dtype: str = "float32") -> AsyncIterator[bytes]:
+    """Chunks with a vector, of one document or one tenant, in chunk_id order"""
+    where, params = ["vector IS NOT NULL"], {}
+    if document_id is not None:
+        where.append("document_id = %(document_id)s")
+        params["document_id"] = document_id
+    if user_id is not None:
+        where.append("user_id = %(user_id)s")  # Prunes to the tenant's partition
+        params["user_id"] = user_id
+    where = " AND ".join(where)
+    records = record_dtype(dtype, models.DocumentChunk.vector.type.dim)
+
+    async with AsyncSessionLocal() as db:
+        conn = await db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+        driver = (await conn.get_raw_connection()).driver_connection
+        if driver not in _registered:
+            await register_vector_async(driver)
+            _registered.add(driver)
+        async with driver.cursor() as cur:
+            await cur.execute(f"SELECT count(*) FROM document_chunks WHERE {where}", params)
+            (count,) = await cur.fetchone()
+        yield npy_header(records, count)
+
+        async with driver.cursor(name="vector_export", binary=True) as cur:
+            await cur.execute(
+                f"SELECT chunk_id, document_id, vector FROM document_chunks WHERE {where} ORDER BY chunk_id", params
+            )
+            while rows := await cur.fetchmany(EXPORT_BATCH_SIZE):
+                batch = np.empty(len(rows), dtype=records)
+                batch["chunk_id"] = [row[0] for row in rows]
+                batch["document_id"] = [row[1] for row in rows]
+                batch["vector"] = np.stack([row[2] for row in rows])
+                yield batch.tobytes()
@@ -0,0 +1,348 @@
+"""Approximate nearest neighbour search over document_chunks.vector with pgvector.
+
+One cosine index, idx_document_chunks_vector, is managed here. It is either HNSW
+(the default, declared on the model so create_all builds it) or IVFFlat, and
+can be rebuilt with other parameters without a window in which searches fall
+back to a sequential scan. The recall/latency trade-off is tuned per query with
+hnsw.ef_search / ivfflat.probes, and recall() measures it against exact search.
+two_stage_search() shortlists on a compact copy (the 256-d vector_short with
+its own HNSW index, or the vector_bits sign bits) and rescores the shortlist
+with the full vector. On a partitioned document_chunks (services/partitions.py)
+every partition has its own copy of each index, attached to the parent index.
+"""
+import math
+import os
+import time
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import cast, func, literal, select, text
+from sqlalchemy.dialects.postgresql import BIT
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from ..models import models
+from .chunk_writer import driver_connection
+from .compact_vectors import binarize, shorten
+
+VECTOR_INDEX_NAME = "idx_document_chunks_vector"
+SHORT_INDEX_NAME = "idx_document_chunks_vector_short"
+VECTOR_INDEX_METHOD = os.getenv("VECTOR_INDEX_METHOD", "hnsw")  # hnsw or ivfflat
+HNSW_M = int(os.getenv("HNSW_M", "16"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "64"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "40"))
+HNSW_EF_SEARCH_MAX = 1000  # pgvector rejects larger hnsw.ef_search values
+IVFFLAT_PROBES = int(os.getenv("IVFFLAT_PROBES", "10"))
+# Memory for index builds; HNSW builds are much faster when the graph fits
+VECTOR_INDEX_BUILD_MEMORY = os.getenv("VECTOR_INDEX_BUILD_MEMORY", "1GB")
+
+TWO_STAGE_OVERSAMPLE = int(os.getenv("TWO_STAGE_OVERSAMPLE", "10"))  # shortlist = k * oversample
+COMPACT_BACKFILL_BATCH = int(os.getenv("COMPACT_BACKFILL_BATCH", "1000"))
+
+METHODS = ("hnsw", "ivfflat")
+COARSE = ("short", "binary")
+
+
+def default_lists(rows: int) -> int:
+    """pgvector's guidance: rows / 1000 up to 1M rows, sqrt(rows) beyond"""
+    if rows <= 1_000_000:
+        return max(1, rows // 1000)
+    return int(math.sqrt(rows))
+
+
+# Bytes of an index, summed over its partitions' indexes when partitioned (the tree is empty otherwise)
+_INDEX_BYTES = "coalesce((SELECT sum(pg_relation_size(relid))::bigint FROM pg_partition_tree(c.oid)), pg_relation_size(c.oid))"
+
+
+def _leaf_partitions(conn) -> List[str]:
+    """document_chunks' partitions; the table itself when it isn't partitioned"""
+    return conn.execute(text(
+        "SELECT relid::regclass::text FROM pg_partition_tree('document_chunks') WHERE isleaf ORDER BY 1"
+    )).scalars().all() or ["document_chunks"]
+
+
+def index_info(db: Session) -> Dict:
+    row = db.execute(text(
+        f"SELECT am.amname AS method, c.reloptions AS options, {_INDEX_BYTES} AS size_bytes, "
+        "i.indisvalid AS valid, pg_get_indexdef(c.oid) AS definition "
+        "FROM pg_class c JOIN pg_am am ON am.oid = c.relam JOIN pg_index i ON i.indexrelid = c.oid "
+        "WHERE c.relname = :name"
+    ), {"name": VECTOR_INDEX_NAME}).mappings().first()
+    partitions = [name for name in _leaf_partitions(db) if name != "document_chunks"]
+    rows = db.execute(text("SELECT count(*) FROM document_chunks WHERE vector IS NOT NULL")).scalar()
+    if row is None:
+        return {"name": VECTOR_INDEX_NAME, "exists": False, "rows": rows, "partitions": len(partitions)}
+    options = dict(option.split("=", 1) for option in row["options"] or [])
+    return {
+        "name": VECTOR_INDEX_NAME,
+        "exists": True,
+        "method": row["method"],
+        "options": {key: int(value) for key, value in options.items()},
+        "valid": row["valid"],
+        "size_bytes": row["size_bytes"],
+        "rows": rows,
+        "partitions": len(partitions),
+        "definition": row["definition"],
+    }
+
+
+def _index_ddl(name: str, method: str, lists: int, m: int, ef_construction: int,
+               table: str = "document_chunks", concurrently: bool = True) -> str:
+    if method == "hnsw":
+        params = f"m = {int(m)}, ef_construction = {int(ef_construction)}"
+    elif method == "ivfflat":
+        params = f"lists = {int(lists)}"
+    else:
+        raise ValueError(f"Unknown vector index method: {method}")
+    return f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}{name} ON {table} " \
+           f"USING {method} (vector vector_cosine_ops) WITH ({params})"
+
+
+def _build_partitioned(conn, building: str, partitions: List[str], method: str, lists: int, m: int,
+                       ef_construction: int):
+    """Postgres can't build an index on a partitioned table concurrently, so each
+    partition's index is built concurrently and attached to an index created ON ONLY
+    the parent, which becomes valid once every partition's index is attached."""
+    conn.execute(text(f"DROP INDEX IF EXISTS {building}"))
+    for partition in partitions:
+        conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {partition}_{building}"))
+    conn.execute(text(_index_ddl(building, method, lists, m, ef_construction, "ONLY document_chunks", False)))
+    for partition in partitions:
+        # IVFFlat lists are per partition here, sized for the whole table they are an upper bound
+        conn.execute(text(_index_ddl(f"{partition}_{building}", method, lists, m, ef_construction, partition)))
+        conn.execute(text(f"ALTER INDEX {building} ATTACH PARTITION {partition}_{building}"))
+    # Briefly locks the table; a partitioned index can't be dropped concurrently
+    conn.execute(text(f"DROP INDEX IF EXISTS {VECTOR_INDEX_NAME}"))
+    conn.execute(text(f"ALTER INDEX {building} RENAME TO {VECTOR_INDEX_NAME}"))
+    for partition in partitions:
+        # The names Postgres gives the indexes of partitions created later
+        conn.execute(text(f"ALTER INDEX {partition}_{building} RENAME TO {partition}_vector_idx"))
+
+
+def build_index(engine: Engine, method: str = VECTOR_INDEX_METHOD, lists: Optional[int] = None,
+                m: int = HNSW_M, ef_construction: int = HNSW_EF_CONSTRUCTION) -> Dict:
+    """Build (or rebuild) the vector index without blocking writes.
+
+    The new index is built CONCURRENTLY under a temporary name and swapped in,
+    so searches keep using the old one until the new one is ready. IVFFlat
+    centroids come from the rows present at build time; rebuild it after large loads.
+    """
+    building = f"{VECTOR_INDEX_NAME}_new"
+    start = time.perf_counter()
+    # CREATE/DROP INDEX CONCURRENTLY can't run inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if method == "ivfflat" and lists is None:
+            rows = conn.execute(text("SELECT count(*) FROM document_chunks WHERE vector IS NOT NULL")).scalar()
+            lists = default_lists(rows)
+        conn.execute(text(f"SET maintenance_work_mem = '{VECTOR_INDEX_BUILD_MEMORY}'"))
+        partitions = _leaf_partitions(conn)
+        if partitions != ["document_chunks"]:
+            _build_partitioned(conn, building, partitions, method, lists, m, ef_construction)
+        else:
+            # Left behind (invalid) if an earlier build was interrupted
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {building}"))
+            conn.execute(text(_index_ddl(building, method, lists, m, ef_construction)))
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {VECTOR_INDEX_NAME}"))
+            conn.execute(text(f"ALTER INDEX {building} RENAME TO {VECTOR_INDEX_NAME}"))
+    return {
+        "method": method,
+        "lists": lists if method == "ivfflat" else None,
+        "m": m if method == "hnsw" else None,
+        "ef_construction": ef_construction if method == "hnsw" else None,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def tune(db: Session, ef_search: Optional[int] = None, probes: Optional[int] = None, exact: bool = False):
+    # SET LOCAL only lasts until the end of the transaction, so pooled connections stay clean
+    if exact:
+        db.execute(text("SET LOCAL enable_indexscan = off"))
+        return
+    db.execute(text(f"SET LOCAL hnsw.ef_search = {int(ef_search or HNSW_EF_SEARCH)}"))
+    db.execute(text(f"SET LOCAL ivfflat.probes = {int(probes or IVFFLAT_PROBES)}"))
+
+
+def covering_ef_search(rows: int, ef_search: Optional[int] = None) -> int:
+    """ef_search for a scan that must return rows results; HNSW stops after ef_search rows"""
+    return min(max(ef_search or HNSW_EF_SEARCH, rows), HNSW_EF_SEARCH_MAX)
+
+
+def filter_chunks(query, user_id: Optional[int] = None, document_ids: Optional[List[int]] = None):
+    """Restrict a Query or select() over document_chunks to a user's or some documents' chunks"""
+    Chunk = models.DocumentChunk
+    if user_id is not None:
+        # On the chunk's own copy of user_id, so the planner only scans that tenant's partition
+        query = query.where(Chunk.user_id == user_id)
+    if document_ids:
+        query = query.where(Chunk.document_id.in_(document_ids))
+    return query
+
+
+def cosine_distance(query_vector: Sequence[float]):
+    return models.DocumentChunk.vector.cosine_distance(np.asarray(query_vector, dtype=np.float32))
+
+
+def _search_query(db: Session, query_vector: Sequence[float], k: int, user_id: Optional[int],
+                  document_ids: Optional[List[int]]):
+    Chunk = models.DocumentChunk
+    distance = cosine_distance(query_vector).label("distance")
+    query = db.query(
+        Chunk.chunk_id, Chunk.document_id, Chunk.chunk_content, Chunk.meta_data, Chunk.chunk_index, distance
+    ).filter(Chunk.vector.isnot(None))
+    return filter_chunks(query, user_id, document_ids).order_by(distance).limit(k)
+
+
+def search(db: Session, query_vector: Sequence[float], k: int = 10, user_id: Optional[int] = None,
+           document_ids: Optional[List[int]] = None, ef_search: Optional[int] = None,
+           probes: Optional[int] = None, exact: bool = False) -> List[Dict]:
+    """Top-k chunks by cosine distance; exact=True scans every vector for ground truth"""
+    try:
+        tune(db, covering_ef_search(k, ef_search), probes, exact)
+        rows = _search_query(db, query_vector, k, user_id, document_ids).all()
+    finally:
+        db.rollback()  # Ends the read-only transaction and with it the SET LOCALs
+    return [_result(row) for row in rows]
+
+
+def _result(row) -> Dict:
+    return {
+        "chunk_id": row.chunk_id,
+        "document_id": row.document_id,
+        "chunk_index": row.chunk_index,
+        "chunk_content": row.chunk_content,
+        "metadata": row.meta_data or {},
+        "distance": float(row.distance),
+        "score": 1.0 - float(row.distance),
+    }
+
+
+def _coarse_distance(coarse: str, query_vector: Sequence[float]):
+    Chunk = models.DocumentChunk
+    if coarse == "short":
+        return Chunk.vector_short.cosine_distance(shorten(query_vector))
+    if coarse == "binary":
+        bits = binarize(query_vector)
+        # Hamming distance with core Postgres (bit_count is 14+); pgvector < 0.7 can't index bit columns
+        return func.bit_count(Chunk.vector_bits.op("#")(cast(literal(str(bits)), BIT(len(bits)))))
+    raise ValueError(f"Unknown coarse representation: {coarse}")
+
+
+def two_stage_search(db: Session, query_vector: Sequence[float], k: int = 10, coarse: str = "short",
+                     candidates: Optional[int] = None, user_id: Optional[int] = None,
+                     document_ids: Optional[List[int]] = None, ef_search: Optional[int] = None) -> List[Dict]:
+    """Top-k by full-vector cosine distance among the nearest candidates on a compact copy"""
+    Chunk = models.DocumentChunk
+    # The shortlist comes from one HNSW scan, so it can't outgrow the largest ef_search
+    candidates = min(max(candidates or k * TWO_STAGE_OVERSAMPLE, k), HNSW_EF_SEARCH_MAX)
+    coarse_distance = _coarse_distance(coarse, query_vector).label("coarse_distance")
+    column = Chunk.vector_short if coarse == "short" else Chunk.vector_bits
+    shortlist = filter_chunks(
+        select(Chunk.chunk_id, coarse_distance).where(column.isnot(None)), user_id, document_ids
+    ).order_by(coarse_distance).limit(candidates).subquery()
+    distance = cosine_distance(query_vector).label("distance")
+    # Filtered again so the join back to the rows only probes the tenant's partition
+    statement = filter_chunks(
+        select(Chunk.chunk_id, Chunk.document_id, Chunk.chunk_content, Chunk.meta_data, Chunk.chunk_index, distance)
+        .join(shortlist, shortlist.c.chunk_id == Chunk.chunk_id),
+        user_id,
+    ).order_by(distance).limit(k)
+    try:
+        tune(db, ef_search=covering_ef_search(candidates, ef_search))
+        rows = db.execute(statement).all()
+    finally:
+        db.rollback()
+    return [_result(row) for row in rows]
+
+
+def backfill_compact(db: Session, batch: int = COMPACT_BACKFILL_BATCH) -> int:
+    """Derive vector_short/vector_bits for chunks stored before those columns existed; commits per batch"""
+    Chunk = models.DocumentChunk
+    total = 0
+    while True:
+        rows = db.query(Chunk.chunk_id, Chunk.user_id, Chunk.vector).filter(
+            Chunk.vector.isnot(None), Chunk.vector_short.is_(None)
+        ).order_by(Chunk.chunk_id).limit(batch).all()
+        if not rows:
+            return total
+        params = [[shorten(row.vector), binarize(row.vector), row.chunk_id, row.user_id] for row in rows]
+        with driver_connection(db).cursor() as cur:
+            cur.executemany(
+                "UPDATE document_chunks SET vector_short = %s, vector_bits = %s WHERE chunk_id = %s AND user_id = %s",
+                params,
+            )
+        db.commit()
+        total += len(rows)
+
+
+def storage(db: Session) -> Dict:
+    """Bytes held by each representation: column values and the ANN index over them"""
+    columns = db.execute(text(
+        "SELECT count(vector) AS rows, coalesce(sum(pg_column_size(vector)), 0) AS vector, "
+        "coalesce(sum(pg_column_size(vector_short)), 0) AS short, "
+        "coalesce(sum(pg_column_size(vector_bits)), 0) AS binary FROM document_chunks"
+    )).mappings().one()
+    indexes = dict(db.execute(text(
+        f"SELECT relname, {_INDEX_BYTES} FROM pg_class c WHERE relname IN (:full, :short)"
+    ), {"full": VECTOR_INDEX_NAME, "short": SHORT_INDEX_NAME}).all())
+    db.rollback()
+    return {
+        "rows": columns["rows"],
+        "full": {"column_bytes": columns["vector"], "index_bytes": indexes.get(VECTOR_INDEX_NAME, 0)},
+        "short": {"column_bytes": columns["short"], "index_bytes": indexes.get(SHORT_INDEX_NAME, 0)},
+        "binary": {"column_bytes": columns["binary"], "index_bytes": 0},
+    }
+
+
+def uses_index(db: Session, query_vector: Sequence[float], k: int = 10, ef_search: Optional[int] = None,
+               probes: Optional[int] = None) -> bool:
+    """Whether the planner picks the vector index; small tables are often scanned instead"""
+    statement = _search_query(db, query_vector, k, None, None).statement.compile(
+        dialect=db.get_bind().dialect, compile_kwargs={"render_postcompile": True}
+    )
+    try:
+        tune(db, covering_ef_search(k, ef_search), probes, exact=False)
+        driver_connection(db)  # Raw parameters need pgvector's numpy adapter
+        plan = db.connection().exec_driver_sql(f"EXPLAIN {statement}", statement.params).scalars().all()
+        # The index of every partition when partitioned
+        names = db.execute(text(
+            "SELECT relid::regclass::text FROM pg_partition_tree(to_regclass(:name))"
+        ), {"name": VECTOR_INDEX_NAME}).scalars().all() or [VECTOR_INDEX_NAME]
+    finally:
+        db.rollback()
+    return any(name in line for line in plan for name in names)
+
+
+def sample_queries(db: Session, count: int) -> List[np.ndarray]:
+    """Stored chunk vectors used as queries, so recall can be measured without a labelled set"""
+    Chunk = models.DocumentChunk
+    rows = db.query(Chunk.vector).filter(Chunk.vector.isnot(None)).order_by(func.random()).limit(count).all()
+    return [np.asarray(row.vector, dtype=np.float32) for row in rows]
+
+
+def recall(db: Session, queries: Optional[List[np.ndarray]] = None, k: int = 10, sample: int = 50,
+           ef_search: Optional[int] = None, probes: Optional[int] = None) -> Dict:
+    """recall@k of the index against exact search, with the latency of both"""
+    queries = sample_queries(db, sample) if queries is None else queries
+    if not queries:
+        return {"queries": 0, "k": k}
+    found, ann_ms, exact_ms = [], [], []
+    for query_vector in queries:
+        start = time.perf_counter()
+        truth = {row["chunk_id"] for row in search(db, query_vector, k, exact=True)}
+        exact_ms.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        approx = {row["chunk_id"] for row in search(db, query_vector, k, ef_search=ef_search, probes=probes)}
+        ann_ms.append((time.perf_counter() - start) * 1000)
+        found.append(len(truth & approx) / max(1, len(truth)))
+    return {
+        "queries": len(queries),
+        "k": k,
+        "index_scan": uses_index(db, queries[0], k, ef_search, probes),
+        "ef_search": covering_ef_search(k, ef_search),
+        "probes": probes or IVFFLAT_PROBES,
+        "recall": round(float(np.mean(found)), 4),
+        "ann_ms_p50": round(float(np.percentile(ann_ms, 50)), 2),
+        "ann_ms_p95": round(float(np.percentile(ann_ms, 95)), 2),
+        "exact_ms_p50": round(float(np.percentile(exact_ms, 50)), 2),
+        "exact_ms_p95": round(float(np.percentile(exact_ms, 95)), 2),
+    }
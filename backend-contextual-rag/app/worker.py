@@ -0,0 +1,127 @@
+"""Standalone ingestion worker.
+
+Run one or more of these per node, from backend-contextual-rag/:
+    python -m app.worker
+Workers coordinate only through the ingestion_jobs table, so throughput scales
+by starting more processes on any machine that can reach the database.
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import threading
+import traceback
+
+from .database import WorkerSessionLocal
+from .services import jobs, local_index, storage
+from .services.document_processor import DocumentProcessor
+from .services.ingestion import ingest_document
+
+WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", "2"))
+
+
+class Heartbeat(threading.Thread):
+    """Extends the job lease from a thread, so it keeps beating while conversion hogs the loop"""
+
+    def __init__(self, job, interval: float):
+        super().__init__(daemon=True)
+        self.job_id = job.job_id
+        self.worker_id = job.locked_by
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self.lost = False
+
+    def run(self):
+        with WorkerSessionLocal() as db:
+            while not self._stop_event.wait(self.interval):
+                try:
+                    if not jobs.heartbeat(db, self.job_id, self.worker_id):
+                        self.lost = True
+                        print(f"Lost lease on job {self.job_id}")
+                        return
+                except Exception as e:
+                    db.rollback()
+                    print(f"Heartbeat error for job {self.job_id}: {e}")
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+async def run_job(db, processor: DocumentProcessor, job):
+    # Read once: after a rollback the row may already name the worker that took the job over
+    job_id, worker_id = job.job_id, job.locked_by
+    heartbeat = Heartbeat(job, interval=max(1.0, jobs.JOB_VISIBILITY_TIMEOUT / 3))
+    heartbeat.start()
+
+    def check_lease():
+        if heartbeat.lost:
+            db.rollback()
+            raise jobs.LeaseLost(f"job {job_id} lost its lease")
+        jobs.hold_lease(db, job_id, worker_id)
+
+    try:
+        await ingest_document(
+            db,
+            processor,
+            job.document_id,
+            storage.resolve(job.file_url),
+            job.file_name,
+            on_stage=lambda stage: jobs.record_stage(db, job, worker_id, stage),
+            incremental=job.mode in ("update", "rechunk"),
+            profile=job.profile,
+            check_lease=check_lease,
+            max_tokens=job.chunk_max_tokens,
+        )
+        jobs.complete_job(db, job, worker_id)
+        print(f"Job {job_id} (document {job.document_id}) succeeded")
+        if local_index.LOCAL_INDEX_SYNC_ON_INGEST and job.document.user_id is not None:
+            print(f"Synced local index: {local_index.sync_user(db, job.document.user_id)}")
+    except jobs.LeaseLost as e:
+        db.rollback()
+        print(f"Abandoned job {job_id}: {e}")
+    except Exception as e:
+        traceback.print_exc()
+        db.rollback()
+        try:
+            retrying = jobs.fail_job(db, job, worker_id, f"{type(e).__name__}: {e}")
+            print(f"Job {job_id} failed on attempt {job.attempts}, {'will retry' if retrying else 'giving up'}")
+        except jobs.LeaseLost as lost:
+            print(f"Abandoned job {job_id}: {lost}")
+    finally:
+        heartbeat.stop()
+
+
+async def main(worker_id: str, once: bool = False):
+    processor = DocumentProcessor()
+    # Start the conversion processes and load their Docling models before taking jobs
+    print(f"Warmed up {processor.warm_up()} conversion workers")
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    print(f"Worker {worker_id} started")
+    while not stop.is_set():
+        with WorkerSessionLocal() as db:
+            job = jobs.claim_job(db, worker_id)
+            if job is not None:
+                await run_job(db, processor, job)
+                continue
+        if once:
+            break
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=WORKER_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+    processor.close()
+    print(f"Worker {worker_id} stopped")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the document ingestion worker")
+    parser.add_argument("--worker-id", default=f"{socket.gethostname()}:{os.getpid()}")
+    parser.add_argument("--once", action="store_true", help="exit when the queue is empty")
+    args = parser.parse_args()
+    asyncio.run(main(args.worker_id, once=args.once))
@@ -0,0 +1,177 @@
+"""Requests per second of GET /api/documents/ under many concurrent clients.
+
+Seeds a throwaway user with --documents documents, then --clients concurrent
+clients list them (--limit per page) as fast as they can for --duration
+seconds after a short warm-up. Reports requests/s, latency percentiles and
+errors; pool timeouts and statement timeouts show up as 500s. Without --url
+it starts uvicorn on a free port with the current environment (DB_MAX_CONNECTIONS
+and friends apply to it). To compare before and after a change, run one server
+per checkout and point --url at each, e.g. from backend-contextual-rag/:
+    python -m benchmarks.bench_api_load --clients 200 --compare benchmarks/results/api-load-<commit>.json
+The client runs in one process, so at high rates it measures itself; keep the
+server on fewer cores (--server-workers) than the machine has.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+import numpy as np
+
+from app import database
+from app.database import WorkerSessionLocal
+from app.models import models
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port: int, workers: int) -> subprocess.Popen:
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--workers", str(workers),
+         "--log-level", "warning", "--no-access-log"],
+        env=os.environ.copy(),
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/", timeout=1).status_code == 200:
+                return server
+        except httpx.HTTPError:
+            pass
+        if server.poll() is not None:
+            break
+        time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("uvicorn did not come up")
+
+
+async def client(http: httpx.AsyncClient, url: str, params: Dict, until: float, samples: List):
+    while time.perf_counter() < until:
+        start = time.perf_counter()
+        try:
+            response = await http.get(url, params=params)
+            error = None if response.status_code == 200 else str(response.status_code)
+        except httpx.HTTPError as e:
+            error = type(e).__name__
+        samples.append((time.perf_counter(), time.perf_counter() - start, error))
+
+
+async def load(base_url: str, params: Dict, clients: int, duration: float, warm_up: float) -> Dict:
+    samples: List = []  # (finished, latency, error) per request
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as http:
+        # Responses finishing during the warm-up (connections, plans, pools filling up) are not counted
+        measure_from = time.perf_counter() + warm_up
+        until = measure_from + duration
+        await asyncio.gather(*(client(http, "/api/documents/", params, until, samples) for _ in range(clients)))
+    window = [(latency, error) for finished, latency, error in samples if measure_from <= finished < until]
+    latencies = [latency for latency, error in window if error is None]
+    errors: Dict[str, int] = {}
+    for _, error in window:
+        if error is not None:
+            errors[error] = errors.get(error, 0) + 1
+    return {
+        "clients": clients,
+        "duration_s": duration,
+        "requests": len(window),
+        "requests_per_s": round(len(latencies) / duration, 1),
+        "errors": errors,
+        **{f"p{p}_ms": round(float(np.percentile(latencies, p)) * 1000, 2) if latencies else None
+           for p in (50, 95, 99)},
+    }
+
+
+def compare(old: Dict, new: Dict):
+    print(f"\nchanges since {old.get('commit')} ({old.get('created_at')})")
+    for key in ("requests_per_s", "p50_ms", "p95_ms", "p99_ms"):
+        before, after = old["results"].get(key), new["results"].get(key)
+        if before and after is not None:
+            print(f"{key:<15} {before:>10} -> {after:<10} ({(after - before) / before:+.1%})")
+    print(f"{'errors':<15} {sum(old['results']['errors'].values()):>10} -> {sum(new['results']['errors'].values())}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", help="running server, e.g. http://127.0.0.1:8000; default starts uvicorn")
+    parser.add_argument("--server-workers", type=int, default=1, help="uvicorn workers when starting the server")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=20, help="measured seconds")
+    parser.add_argument("--warm-up", type=float, default=3)
+    parser.add_argument("--documents", type=int, default=200, help="documents of the throwaway user")
+    parser.add_argument("--limit", type=int, default=20, help="page size of each request")
+    parser.add_argument("--out", help="JSON results file, default benchmarks/results/api-load-<commit>.json")
+    parser.add_argument("--compare", help="earlier JSON results file to diff against")
+    args = parser.parse_args()
+
+    with WorkerSessionLocal() as db:
+        user = models.User(email=f"bench-{uuid.uuid4().hex}@example.com", password_hash="-", name="bench")
+        db.add(user)
+        db.flush()
+        db.add_all(models.Document(user_id=user.id, file_name=f"bench-{i}.pdf", s3_url=f"local://bench-{i}.pdf",
+                                   status="processed", meta_data={}) for i in range(args.documents))
+        db.commit()
+        user_id = user.id
+
+    server = None
+    try:
+        if args.url:
+            base_url = args.url.rstrip("/")
+        else:
+            port = free_port()
+            server = start_server(port, args.server_workers)
+            base_url = f"http://127.0.0.1:{port}"
+        print(f"{args.clients} clients for {args.duration:.0f}s against {base_url}/api/documents/ "
+              f"(limit {args.limit}, {args.documents} documents)")
+        results = asyncio.run(load(base_url, {"user_id": user_id, "limit": args.limit}, args.clients,
+                                   args.duration, args.warm_up))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        with WorkerSessionLocal() as db:
+            db.query(models.Document).filter(models.Document.user_id == user_id).delete()
+            db.query(models.User).filter(models.User.id == user_id).delete()
+            db.commit()
+
+    print(f"{results['requests_per_s']} req/s  p50 {results['p50_ms']}ms  p95 {results['p95_ms']}ms  "
+          f"p99 {results['p99_ms']}ms  errors {results['errors'] or 0}")
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "url": base_url,
+        # Pool settings of this environment; they describe the server only when it was started here
+        "pool": {"size": database.pool_sizes("async")[0], "max_overflow": database.pool_sizes("async")[1],
+                 "max_connections": database.DB_MAX_CONNECTIONS,
+                 "statement_timeout_ms": database.DB_STATEMENT_TIMEOUT_MS},
+        "results": results,
+    }
+    out = Path(args.out) if args.out else RESULTS_DIR / f"api-load-{commit or 'local'}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2))
+    print(f"wrote {out}")
+    if args.compare:
+        compare(json.loads(Path(args.compare).read_text()), report)
@@ -0,0 +1,111 @@
+"""Latency of the streaming chat pipeline, and the citations it sends.
+
+Indexes the fixture passages (benchmarks/corpus.py) into a throwaway user the
+way ingestion writes chunks, with the source page in metadata["pages"], and
+answers --questions labelled questions through chat.answer_events with the
+stub embedder and the fake LLM (--latency before the first token, --token-delay
+per word). Reports p50/p95 of time to citations, first token and full answer.
+Every citation of a chunk with pages must carry a page; the run fails
+otherwise. Needs DATABASE_URL with pgvector. Run from backend-contextual-rag/:
+    python -m benchmarks.bench_chat --questions 100
+"""
+import argparse
+import asyncio
+import time
+import uuid
+from typing import Dict, List
+
+import numpy as np
+
+from app.database import WorkerSessionLocal
+from app.models import models
+from app.services import chat, partitions
+from app.services.chunk_writer import write_chunks
+from app.services.embeddings import BatchEmbedder, get_embedder
+from app.services.llm import FakeChat
+from benchmarks import corpus
+
+
+def load(db, user_id: int, passages, vectors) -> None:
+    partitions.ensure_tenant(db, user_id)  # Before the document row, see partitions.ensure_tenant
+    document = models.Document(user_id=user_id, file_name="bench.pdf", s3_url="local://bench.pdf",
+                               status="processed", meta_data={})
+    db.add(document)
+    db.flush()
+    write_chunks(db, (
+        {"document_id": document.document_id, "chunk_content": passage.text, "vector": vector,
+         "metadata": {"passage_id": passage.passage_id, "pages": [passage.page] if passage.page else []},
+         "content_hash": None, "chunk_index": i}
+        for i, (passage, vector) in enumerate(zip(passages, vectors))
+    ))
+    db.commit()
+
+
+async def ask(question: str, user_id: int, llm, embedder: BatchEmbedder, k: int) -> Dict:
+    start = time.perf_counter()
+    timings: Dict = {}
+    cited: List[Dict] = []
+    async for event, data in chat.answer_events(question, llm, embedder, user_id=user_id, k=k, use_cache=False):
+        if event == "citations":
+            timings["citations_ms"] = (time.perf_counter() - start) * 1000
+            cited = data["citations"]
+        elif event == "token" and "first_token_ms" not in timings:
+            timings["first_token_ms"] = (time.perf_counter() - start) * 1000
+    timings["total_ms"] = (time.perf_counter() - start) * 1000
+    return {"timings": timings, "citations": cited}
+
+
+async def run(questions: List[str], user_id: int, llm, embedder: BatchEmbedder, k: int, paged: Dict[int, bool]):
+    samples, citations, missing = [], 0, []
+    for question in questions:
+        answer = await ask(question, user_id, llm, embedder, k)
+        samples.append(answer["timings"])
+        for citation in answer["citations"]:
+            citations += 1
+            if paged.get(citation["chunk_id"]) and citation["page"] is None:
+                missing.append(citation["chunk_id"])
+    return samples, citations, missing
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", type=int, default=100)
+    parser.add_argument("--k", type=int, default=chat.CHAT_CONTEXT_CHUNKS)
+    parser.add_argument("--latency", type=float, default=0.2, help="fake LLM seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="fake LLM seconds per word")
+    args = parser.parse_args()
+
+    labelled, passages = corpus.load(corpus.CSV_FILES)
+    passages = list(passages.values())
+    questions = list(dict.fromkeys(item.question for item in labelled))[:args.questions]
+    embedder = BatchEmbedder(get_embedder("stub"))
+    passage_vectors, _ = asyncio.run(embedder.embed([passage.text for passage in passages]))
+    llm = FakeChat(latency=args.latency, token_delay=args.token_delay)
+
+    with WorkerSessionLocal() as db:
+        user = models.User(email=f"bench-{uuid.uuid4().hex}@example.com", password_hash="-", name="bench")
+        db.add(user)
+        db.flush()
+        try:
+            load(db, user.id, passages, passage_vectors)
+            Chunk = models.DocumentChunk
+            paged = {
+                row.chunk_id: bool((row.meta_data or {}).get("pages"))
+                for row in db.query(Chunk.chunk_id, Chunk.meta_data).filter(Chunk.user_id == user.id)
+            }
+            db.rollback()
+            samples, citations, missing = asyncio.run(run(questions, user.id, llm, embedder, args.k, paged))
+        finally:
+            db.rollback()
+            db.query(models.Document).filter(models.Document.user_id == user.id).delete()
+            db.query(models.User).filter(models.User.id == user.id).delete()
+            db.commit()
+
+    print(f"{len(questions)} questions over {len(passages)} passages, k {args.k}, "
+          f"fake LLM {args.latency * 1000:.0f}ms + {args.token_delay * 1000:.0f}ms/word")
+    for field in ("citations_ms", "first_token_ms", "total_ms"):
+        values = [sample[field] for sample in samples if field in sample]
+        print(f"  {field:<15} p50 {np.percentile(values, 50):8.2f}ms  p95 {np.percentile(values, 95):8.2f}ms")
+    print(f"  {citations} citations, {sum(paged.values())} of {len(paged)} chunks have pages")
+    if missing:
+        raise SystemExit(f"{len(missing)} citations of chunks with pages had no page, e.g. chunk {missing[0]}")
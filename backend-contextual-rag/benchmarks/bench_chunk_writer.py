@@ -0,0 +1,67 @@
+"""document_chunks insert throughput: ORM add() vs executemany vs binary COPY.
+
+Needs DATABASE_URL with the pgvector extension. Everything runs in a
+transaction that is rolled back, so the database is left untouched.
+Run from backend-contextual-rag/:
+    python -m benchmarks.bench_chunk_writer --rows 10000 100000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.database import WorkerSessionLocal
+from app.models import models
+from app.services.chunk_writer import write_chunks
+
+
+def make_rows(document_id: int, count: int, dimension: int):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((count, dimension), dtype=np.float32)
+    return [
+        {
+            "document_id": document_id,
+            "chunk_content": f"chunk {i} " + "lorem ipsum dolor sit amet " * 60,
+            "metadata": {"headings": ["Section"], "captions": [], "pages": [i // 4 + 1]},
+            "vector": vectors[i],
+        }
+        for i in range(count)
+    ]
+
+
+def orm_write(db, rows):
+    for row in rows:
+        db.add(models.DocumentChunk(
+            document_id=row["document_id"],
+            chunk_content=row["chunk_content"],
+            meta_data=row["metadata"],
+            vector=row["vector"],
+        ))
+    db.flush()
+
+
+def timed(label: str, rows, write):
+    with WorkerSessionLocal() as db:
+        document = models.Document(file_name="bench.pdf", s3_url="local://bench.pdf", status="processing", meta_data={})
+        db.add(document)
+        db.flush()
+        for row in rows:
+            row["document_id"] = document.document_id
+        start = time.perf_counter()
+        write(db, rows)
+        elapsed = time.perf_counter() - start
+        db.rollback()
+    print(f"{label:<14} {len(rows):>7} rows {elapsed:8.2f}s {len(rows) / elapsed:10.0f} rows/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--dimension", type=int, default=1536)
+    args = parser.parse_args()
+
+    for count in args.rows:
+        rows = make_rows(0, count, args.dimension)
+        timed("orm", rows, orm_write)
+        timed("executemany", rows, lambda db, rows: write_chunks(db, rows, method="executemany"))
+        timed("copy binary", rows, lambda db, rows: write_chunks(db, rows, method="copy"))
@@ -0,0 +1,50 @@
+"""Docling conversion throughput: in-process path vs the process pool.
+
+Run from backend-contextual-rag/ with one or more PDFs:
+    python -m benchmarks.bench_conversion docs/*.pdf --workers 1 2 4 8
+
+"inline" is the old path: one converter in the calling process, whole file at once.
+Pool timings exclude worker start-up, which happens once per ingestion worker.
+"""
+import argparse
+import asyncio
+import time
+
+from app.services.conversion import ConversionPool, page_count
+
+
+async def convert_all(pool: ConversionPool, paths):
+    chunks = 0
+    for path in paths:
+        chunks += len(await pool.convert(path, path))
+    return chunks
+
+
+def run(label: str, pool: ConversionPool, paths, pages: int):
+    start = time.perf_counter()
+    pool.warm_up()
+    warm_up = time.perf_counter() - start
+
+    start = time.perf_counter()
+    chunks = asyncio.run(convert_all(pool, paths))
+    elapsed = time.perf_counter() - start
+    pool.shutdown()
+    print(f"{label:<12} warm-up {warm_up:7.1f}s  convert {elapsed:8.1f}s  "
+          f"{pages / elapsed:7.2f} pages/s  {chunks} chunks")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--pages-per-task", type=int, default=20)
+    parser.add_argument("--threads-per-worker", type=int, default=2)
+    args = parser.parse_args()
+
+    pages = sum(page_count(path) or 1 for path in args.paths)
+    print(f"{len(args.paths)} files, {pages} pages")
+    run("inline", ConversionPool(workers=0), args.paths, pages)
+    for workers in args.workers:
+        pool = ConversionPool(workers=workers, pages_per_task=args.pages_per_task,
+                              threads_per_worker=args.threads_per_worker)
+        run(f"{workers} workers", pool, args.paths, pages)
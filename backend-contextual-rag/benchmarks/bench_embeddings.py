@@ -0,0 +1,45 @@
+"""Offline benchmark: sequential per-chunk embedding vs batched, concurrent embedding.
+
+Run from backend-contextual-rag/:
+    python -m benchmarks.bench_embeddings --chunks 600 --latency 0.05
+"""
+import argparse
+import asyncio
+import random
+
+from app.services.embeddings import BatchEmbedder, StubEmbedder
+
+
+def make_chunks(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    words = ["multiple", "sclerosis", "axonal", "relapse", "lesion", "therapy", "mri", "disability",
+             "benign", "progression", "clinical", "diagnosis", "patients", "inflammation", "cortex"]
+    # ~500 token chunks like HybridChunker(max_tokens=500) produces
+    return [" ".join(rng.choice(words) for _ in range(rng.randint(250, 450))) for _ in range(count)]
+
+
+async def run(label: str, texts, **kwargs):
+    stub = StubEmbedder(latency=args.latency, per_token_latency=args.per_token_latency)
+    embedder = BatchEmbedder(stub, **kwargs)
+    vectors, stats = await embedder.embed(texts)
+    assert len(vectors) == len(texts)
+    print(f"{label:<28} batches={stats.batches:<5} calls={stub.calls:<5} "
+          f"{stats.seconds:8.2f}s {stats.chunks_per_second:9.1f} chunks/s {stats.tokens_per_second:11.1f} tokens/s")
+
+
+async def main():
+    texts = make_chunks(args.chunks)
+    await run("sequential (1 per call)", texts, max_batch_size=1, concurrency=1)
+    for concurrency in (1, 2, 4, 8):
+        await run(f"batched, concurrency={concurrency}", texts,
+                  max_batch_tokens=args.batch_tokens, concurrency=concurrency)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=600)
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated seconds per API call")
+    parser.add_argument("--per-token-latency", type=float, default=0.000002)
+    parser.add_argument("--batch-tokens", type=int, default=8000)
+    args = parser.parse_args()
+    asyncio.run(main())
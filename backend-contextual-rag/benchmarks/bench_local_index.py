@@ -0,0 +1,101 @@
+"""Per-query latency and recall: pgvector (ANN and exact) vs the local memory-mapped index.
+
+Needs DATABASE_URL with the pgvector extension. Creates a throwaway user with
+--rows clustered random chunks, syncs the local index for it (float16 and
+int8), runs --queries searches on each engine and deletes everything again.
+Recall is measured against exact float32 search in NumPy.
+Run from backend-contextual-rag/:
+    python -m benchmarks.bench_local_index --rows 100000 --queries 200
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+from app.database import WorkerSessionLocal
+from app.models import models
+from app.services import local_index, partitions, vector_index
+from app.services.chunk_writer import write_chunks
+
+
+def make_vectors(count: int, dimension: int, rng):
+    # Clustered, like embeddings of related passages, so ANN recall isn't trivially perfect
+    centers = rng.standard_normal((max(1, count // 500), dimension), dtype=np.float32)
+    vectors = centers[rng.integers(0, len(centers), count)] + rng.standard_normal((count, dimension), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def load(db, user_id: int, vectors: np.ndarray):
+    partitions.ensure_tenant(db, user_id)  # Before the document row, see partitions.ensure_tenant
+    document = models.Document(user_id=user_id, file_name="bench.pdf", s3_url="local://bench.pdf",
+                               status="processed", meta_data={})
+    db.add(document)
+    db.flush()
+    write_chunks(db, (
+        {"document_id": document.document_id, "chunk_content": f"chunk {i}", "vector": vector,
+         "metadata": {}, "content_hash": None, "chunk_index": i}
+        for i, vector in enumerate(vectors)
+    ))
+    db.commit()
+    ids = [row.chunk_id for row in db.query(models.DocumentChunk.chunk_id).filter(
+        models.DocumentChunk.document_id == document.document_id
+    ).order_by(models.DocumentChunk.chunk_index)]
+    return np.asarray(ids)
+
+
+def run(label: str, search, queries, truth, k: int):
+    latencies, recalls = [], []
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        found = {row["chunk_id"] for row in search(query)}
+        latencies.append((time.perf_counter() - start) * 1000)
+        recalls.append(len(found & expected) / k)
+    print(f"{label:<18} p50 {np.percentile(latencies, 50):7.2f}ms  p95 {np.percentile(latencies, 95):7.2f}ms  "
+          f"recall@{k} {np.mean(recalls):.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dimension", type=int, default=1536)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = make_vectors(args.rows, args.dimension, rng)
+    queries = make_vectors(args.queries, args.dimension, rng)
+    local_index.LOCAL_INDEX_DIR = tempfile.mkdtemp(prefix="local-index-")
+
+    with WorkerSessionLocal() as db:
+        user = models.User(email=f"bench-{uuid.uuid4().hex}@example.com", password_hash="-", name="bench")
+        db.add(user)
+        db.flush()
+        try:
+            start = time.perf_counter()
+            ids = load(db, user.id, vectors)
+            print(f"{args.rows} rows loaded in {time.perf_counter() - start:.1f}s")
+            exact = np.argsort(-(queries @ vectors.T), axis=1)[:, :args.k]
+            truth = [set(ids[row]) for row in exact]
+
+            run("pgvector ann", lambda q: vector_index.search(db, q, args.k, user_id=user.id), queries, truth, args.k)
+            run("pgvector exact", lambda q: vector_index.search(db, q, args.k, user_id=user.id, exact=True),
+                queries, truth, args.k)
+            for dtype in ("float16", "int8"):
+                start = time.perf_counter()
+                print(f"sync {dtype}: {local_index.sync_user(db, user.id, dtype=dtype)}")
+                index = local_index.LocalIndex(local_index.user_dir(user.id))
+                index.refresh()
+                size = sum(os.path.getsize(os.path.join(index.directory, name)) for name in os.listdir(index.directory))
+                print(f"{dtype} index {size / 2 ** 20:.0f} MiB")
+                run(f"local {dtype}", lambda q: index.search(q, args.k), queries, truth, args.k)
+        finally:
+            db.rollback()
+            db.query(models.Document).filter(models.Document.user_id == user.id).delete()
+            db.query(models.User).filter(models.User.id == user.id).delete()
+            db.commit()
+            shutil.rmtree(local_index.LOCAL_INDEX_DIR)
@@ -0,0 +1,98 @@
+"""Search latency and recall for small and large tenants under the chunk partitioning.
+
+Loads one large tenant (--big random vectors) and --tenants small ones
+(--small vectors each) into throwaway users, then runs --queries vector
+searches scoped to each tenant through the HNSW index and exactly. Without
+partitioning a small tenant's search walks the shared graph and filters, so it
+is slow or returns fewer than k rows; with list partitioning it only touches
+its own partition. Run it once per CHUNK_PARTITIONING (none, hash, list)
+against a scratch database, e.g. from backend-contextual-rag/:
+    CHUNK_PARTITIONING=list python -m benchmarks.bench_partitions --big 50000
+Everything is deleted again, including list partitions it created.
+"""
+import argparse
+import time
+import uuid
+
+import numpy as np
+from sqlalchemy import text
+
+from app.database import WorkerSessionLocal
+from app.models import models
+from app.services import partitions, vector_index
+from app.services.chunk_writer import write_chunks
+
+
+def random_vectors(rng, count: int, dimension: int = 1536) -> np.ndarray:
+    vectors = rng.standard_normal((count, dimension), dtype=np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def load_tenant(db, label: str, vectors: np.ndarray) -> int:
+    user = models.User(email=f"bench-{uuid.uuid4().hex}@example.com", password_hash="-", name=label)
+    db.add(user)
+    db.flush()
+    partitions.ensure_tenant(db, user.id)  # Before the document row, see partitions.ensure_tenant
+    document = models.Document(user_id=user.id, file_name="bench.pdf", s3_url="local://bench.pdf",
+                               status="processed", meta_data={})
+    db.add(document)
+    db.flush()
+    write_chunks(db, (
+        {"document_id": document.document_id, "chunk_content": f"{label} {i}", "vector": vector,
+         "metadata": {}, "content_hash": None, "chunk_index": i}
+        for i, vector in enumerate(vectors)
+    ))
+    db.commit()
+    return user.id
+
+
+def run(db, label: str, user_id: int, queries, k: int):
+    latencies, recalls, returned = [], [], []
+    for vector in queries:
+        truth = {row["chunk_id"] for row in vector_index.search(db, vector, k, user_id=user_id, exact=True)}
+        start = time.perf_counter()
+        found = vector_index.search(db, vector, k, user_id=user_id)
+        latencies.append(time.perf_counter() - start)
+        returned.append(len(found))
+        recalls.append(len(truth & {row["chunk_id"] for row in found}) / max(1, len(truth)))
+    print(f"{label:<8} {partitions.tenant_partition(db, user_id):<24} p50 {np.percentile(latencies, 50) * 1000:7.2f}ms  "
+          f"p95 {np.percentile(latencies, 95) * 1000:7.2f}ms  rows {np.mean(returned):5.1f}/{k}  "
+          f"recall@{k} {np.mean(recalls):.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--big", type=int, default=50000, help="vectors of the large tenant")
+    parser.add_argument("--tenants", type=int, default=4, help="number of small tenants")
+    parser.add_argument("--small", type=int, default=500, help="vectors per small tenant")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"CHUNK_PARTITIONING={partitions.CHUNK_PARTITIONING}: one tenant with {args.big} vectors, "
+          f"{args.tenants} with {args.small}")
+    user_ids = []
+    with WorkerSessionLocal() as db:
+        try:
+            start = time.perf_counter()
+            big = load_tenant(db, "big", random_vectors(rng, args.big))
+            user_ids.append(big)
+            for i in range(args.tenants):
+                user_ids.append(load_tenant(db, f"small{i}", random_vectors(rng, args.small)))
+            db.execute(text("ANALYZE document_chunks"))
+            db.commit()
+            print(f"loaded in {time.perf_counter() - start:.1f}s")
+
+            queries = random_vectors(rng, args.queries)
+            run(db, "big", big, queries, args.k)
+            for i, user_id in enumerate(user_ids[1:]):
+                run(db, f"small{i}", user_id, queries, args.k)
+        finally:
+            db.rollback()
+            db.query(models.Document).filter(models.Document.user_id.in_(user_ids)).delete()
+            db.query(models.User).filter(models.User.id.in_(user_ids)).delete()
+            if partitions.CHUNK_PARTITIONING == "list":
+                for user_id in user_ids:
+                    db.execute(text(f"DROP TABLE IF EXISTS {partitions.partition_name(user_id)}"))
+            db.commit()
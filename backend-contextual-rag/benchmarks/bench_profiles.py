@@ -0,0 +1,87 @@
+"""Conversion speed and retrieval quality per ingestion profile.
+
+Run from backend-contextual-rag/ with the MS corpus PDFs the CSV questions were asked against:
+    python -m benchmarks.bench_profiles corpus/*.pdf --profiles fast balanced full
+
+Each profile converts every file, chunks are embedded with the configured
+EMBEDDING_PROVIDER (use EMBEDDING_PROVIDER=stub for an offline run) and the
+relevant questions from csv/ are searched by exact cosine similarity.
+file@k: a top-k chunk comes from one of the question's labelled source files.
+passage@k: a top-k chunk covers at least --coverage of a labelled passage's words.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import numpy as np
+
+from app.services.conversion import ConversionPool, page_count
+from app.services.embeddings import BatchEmbedder
+from benchmarks import corpus
+
+
+async def convert_all(pool: ConversionPool, paths, profile: str):
+    chunks = []
+    for path in paths:
+        for chunk in await pool.convert(path, path, profile=profile):
+            chunks.append({**chunk, "filename": os.path.basename(path)})
+    return chunks
+
+
+async def embed_all(embedder: BatchEmbedder, texts):
+    vectors, _ = await embedder.embed(texts)
+    matrix = np.asarray(vectors, dtype=np.float32)
+    return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
+def evaluate(chunks, chunk_vectors, questions, question_vectors, passages, k: int, min_coverage: float):
+    file_hits = passage_hits = 0
+    top = np.argsort(-(question_vectors @ chunk_vectors.T), axis=1)[:, :k]
+    for question, ranked in zip(questions, top):
+        found = [chunks[i] for i in ranked]
+        if any(chunk["filename"] in question.source_files for chunk in found):
+            file_hits += 1
+        labelled = [passages[passage_id].text for passage_id in question.passage_ids]
+        if any(corpus.coverage(text, chunk["content"]) >= min_coverage for text in labelled for chunk in found):
+            passage_hits += 1
+    return file_hits / len(questions), passage_hits / len(questions)
+
+
+def run(profile: str, args, questions, question_vectors, passages, embedder, pages: int):
+    pool = ConversionPool(workers=args.workers)
+    pool.warm_up()
+    start = time.perf_counter()
+    chunks = asyncio.run(convert_all(pool, args.paths, profile))
+    elapsed = time.perf_counter() - start
+    pool.shutdown()
+
+    chunk_vectors = asyncio.run(embed_all(embedder, [chunk["content"] for chunk in chunks]))
+    file_hit, passage_hit = evaluate(chunks, chunk_vectors, questions, question_vectors, passages,
+                                     args.k, args.coverage)
+    print(f"{profile:<10} {elapsed:8.1f}s  {pages / elapsed:7.2f} pages/s  {len(chunks):6d} chunks  "
+          f"file@{args.k} {file_hit:.3f}  passage@{args.k} {passage_hit:.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--profiles", nargs="+", default=["fast", "balanced", "full"])
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--coverage", type=float, default=0.6)
+    args = parser.parse_args()
+
+    names = {os.path.basename(path) for path in args.paths}
+    questions, passages = corpus.load()
+    # Only questions whose labelled sources are among the given files can be scored
+    questions = [q for q in questions if q.relevant and q.passage_ids and set(q.source_files) <= names]
+    if not questions:
+        parser.error("none of the labelled questions refer to the given files")
+
+    embedder = BatchEmbedder()
+    question_vectors = asyncio.run(embed_all(embedder, [q.question for q in questions]))
+    pages = sum(page_count(path) or 1 for path in args.paths)
+    print(f"{len(args.paths)} files, {pages} pages, {len(questions)} questions, model {embedder.model}")
+    for profile in args.profiles:
+        run(profile, args, questions, question_vectors, passages, embedder, pages)
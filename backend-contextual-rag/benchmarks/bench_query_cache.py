@@ -0,0 +1,55 @@
+"""Hit rate and latency saved by the query embedding cache on the set1.py questions.
+
+Replays --requests queries drawn from set1.py with Zipf-distributed popularity
+(a few questions asked often, most rarely) against a stub embedder with
+--latency seconds per call, like an embeddings API round trip. By default only
+the in-process tier is used; --shared adds the query_embedding_cache table
+(needs DATABASE_URL). Run from backend-contextual-rag/:
+    python -m benchmarks.bench_query_cache --requests 2000 --latency 0.15
+"""
+import argparse
+import asyncio
+import time
+
+import numpy as np
+
+import set1
+from app.services.embeddings import BatchEmbedder, StubEmbedder
+from app.services.query_cache import QueryEmbeddingCache
+
+
+async def replay(cache: QueryEmbeddingCache, embedder: BatchEmbedder, queries):
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        await cache.embed([query], embedder)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.15)
+    parser.add_argument("--zipf", type=float, default=1.2, help="popularity skew, higher repeats more")
+    parser.add_argument("--shared", action="store_true")
+    args = parser.parse_args()
+
+    questions = set1.question_set_1 + set1.question_set_2 + set1.false_positives
+    rng = np.random.default_rng(0)
+    ranks = np.minimum(rng.zipf(args.zipf, args.requests), len(questions)) - 1
+    # Casing and spacing vary between users asking the same thing
+    queries = [
+        questions[rank].upper() if i % 7 == 0 else f"  {questions[rank]} " if i % 5 == 0 else questions[rank]
+        for i, rank in enumerate(ranks)
+    ]
+    embedder = BatchEmbedder(StubEmbedder(latency=args.latency))
+    cache = QueryEmbeddingCache(shared=args.shared)
+    latencies = asyncio.run(replay(cache, embedder, queries))
+
+    stats = cache.stats()
+    print(f"{args.requests} requests over {len(set(ranks))} distinct questions")
+    for key, value in stats.items():
+        print(f"  {key:<18} {value}")
+    print(f"  p50 {np.percentile(latencies, 50):.2f}ms  p95 {np.percentile(latencies, 95):.2f}ms  "
+          f"without cache ~{args.latency * 1000:.0f}ms each")
@@ -0,0 +1,69 @@
+"""MRR gain and added latency of cross-encoder reranking, per candidate pool size.
+
+The first stage is exact cosine search with the configured embedder over the
+fixture passages of csv/set1.csv and csv/pv2_set2.csv (benchmarks/corpus.py),
+done in NumPy so only the rerank stage is timed. Questions and their relevant
+passages come from corpus.question_sets(), the labels bench_retrieval scores
+against: the passages of CSV rows with relevant context, and none for
+unlabelled or off-topic questions, which are skipped. For each pool
+size the top candidates are reranked and MRR@k is compared per question set.
+Needs a model, see app/services/rerank.py. Run from backend-contextual-rag/:
+    python -m benchmarks.bench_rerank --pools 20 50 100 --budget 1000
+"""
+import argparse
+import asyncio
+
+import numpy as np
+
+from app.services import rerank
+from app.services.embeddings import BatchEmbedder
+from benchmarks import corpus
+
+
+def reciprocal_rank(passage_ids, relevant, k: int) -> float:
+    for rank, passage_id in enumerate(passage_ids[:k], 1):
+        if passage_id in relevant:
+            return 1.0 / rank
+    return 0.0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pools", type=int, nargs="+", default=[20, 50, 100])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--budget", type=float, default=rerank.RERANK_BUDGET_MS, help="rerank budget in ms")
+    args = parser.parse_args()
+
+    _, passages = corpus.load()
+    passages = list(passages.values())
+    sets = {name: [item for item in items if item["passages"]] for name, items in corpus.question_sets().items()}
+    sets = {name: items for name, items in sets.items() if items}
+    questions = list(dict.fromkeys(item["question"] for items in sets.values() for item in items))
+    embedder = BatchEmbedder()
+    passage_vectors, _ = asyncio.run(embedder.embed([p.text for p in passages]))
+    question_vectors, _ = asyncio.run(embedder.embed(questions))
+    similarities = np.asarray(question_vectors, dtype=np.float32) @ np.asarray(passage_vectors, dtype=np.float32).T
+    order = dict(zip(questions, np.argsort(-similarities, axis=1)))
+
+    reranker = rerank.Reranker()
+    reranker.rerank("warm up", [{"chunk_content": passages[0].text}], budget_ms=60000)
+    print(f"{len(questions)} labelled questions, {len(passages)} passages, embedder {embedder.model}, "
+          f"reranker {reranker.encoder.model}, budget {args.budget:.0f}ms")
+    for pool in args.pools:
+        for name, items in sets.items():
+            baseline, reranked, latencies, timed_out = [], [], [], 0
+            for item in items:
+                relevant = set(item["passages"])
+                candidates = [
+                    {"chunk_content": passages[i].text, "passage_id": passages[i].passage_id}
+                    for i in order[item["question"]][:pool]
+                ]
+                baseline.append(reciprocal_rank([c["passage_id"] for c in candidates], relevant, args.k))
+                results, stats = reranker.rerank(item["question"], candidates, args.k, budget_ms=args.budget)
+                reranked.append(reciprocal_rank([r["passage_id"] for r in results], relevant, args.k))
+                latencies.append(stats["ms"])
+                timed_out += stats["timed_out"]
+            print(f"pool {pool:>4}  {name:<28} {len(items):>4}  MRR@{args.k} {np.mean(baseline):.3f} -> "
+                  f"{np.mean(reranked):.3f} ({np.mean(reranked) - np.mean(baseline):+.3f})  "
+                  f"rerank p50 {np.percentile(latencies, 50):7.1f}ms  p95 {np.percentile(latencies, 95):7.1f}ms  "
+                  f"timed out {timed_out}/{len(items)}")
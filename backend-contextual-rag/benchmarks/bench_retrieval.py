@@ -0,0 +1,259 @@
+"""Retrieval quality and latency of every search engine on the labelled question sets.
+
+Indexes the fixture passages (benchmarks/corpus.py) into a throwaway user with
+the deterministic stub embedder (hashed bag of words, no network), so numbers
+only move when retrieval code does. Runs each question set through each engine:
+
+- set1.py question_set_1 / question_set_2, labelled where the question also
+  appears in a CSV with relevant context
+- set1.py false_positives, off-topic questions that should be rejected
+- csv/set1.csv and csv/pv2_set2.csv, the rows with relevant context
+
+Reports recall@k and MRR against the labelled passages, the rejection rate
+and p50/p95/p99 latency, excluding query embedding. A question is rejected when
+nothing comes back, or the best cosine similarity is under --min-similarity
+(the best ts_rank_cd under --min-rank for lexical results). That is wanted for
+false_positives and a miss anywhere else. The stub's bag-of-words vectors
+score any two English questions alike, so off-topic questions are only told
+apart lexically; --embedder openai measures the similarity gate for real. Results are written as JSON per commit, and --compare prints the
+change against an earlier file. Needs DATABASE_URL with pgvector. Run from
+backend-contextual-rag/:
+    python -m benchmarks.bench_retrieval --compare benchmarks/results/retrieval-<commit>.json
+"""
+import argparse
+import asyncio
+import json
+import re
+import shutil
+import subprocess
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import text
+
+from app.database import WorkerSessionLocal
+from app.models import models
+from app.services import hybrid_search, local_index, partitions, vector_index
+from app.services.chunk_writer import write_chunks
+from app.services.embeddings import BatchEmbedder, get_embedder
+from benchmarks import corpus
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+ENGINES = ("exact", "vector", "short", "binary", "lexical", "hybrid", "local", "rerank")
+DEFAULT_ENGINES = ("exact", "vector", "short", "binary", "lexical", "hybrid")
+
+
+def load(db, user_id: int, passages, vectors) -> None:
+    partitions.ensure_tenant(db, user_id)  # Before the document row, see partitions.ensure_tenant
+    document = models.Document(user_id=user_id, file_name="bench.pdf", s3_url="local://bench.pdf",
+                               status="processed", meta_data={})
+    db.add(document)
+    db.flush()
+    write_chunks(db, (
+        {"document_id": document.document_id, "chunk_content": passage.text, "vector": vector,
+         "metadata": {"passage_id": passage.passage_id}, "content_hash": None, "chunk_index": i}
+        for i, (passage, vector) in enumerate(zip(passages, vectors))
+    ))
+    db.commit()
+    db.execute(text("ANALYZE document_chunks"))
+    db.commit()
+
+
+def engines(db, user_id: int, k: int, names) -> Dict[str, Callable[[str, np.ndarray], List[Dict]]]:
+    """Search functions by engine name, each taking (question, question vector)"""
+    available = {
+        "exact": lambda q, v: vector_index.search(db, v, k, user_id=user_id, exact=True),
+        "vector": lambda q, v: vector_index.search(db, v, k, user_id=user_id),
+        "short": lambda q, v: vector_index.two_stage_search(db, v, k, coarse="short", user_id=user_id),
+        "binary": lambda q, v: vector_index.two_stage_search(db, v, k, coarse="binary", user_id=user_id),
+        "lexical": lambda q, v: hybrid_search.lexical_search(db, q, k, user_id=user_id),
+        "hybrid": lambda q, v: hybrid_search.hybrid_search(db, q, v, k, user_id=user_id),
+        "local": lambda q, v: local_index.search(db, user_id, v, k),
+    }
+    if "rerank" in names:
+        from app.services.rerank import reranker
+
+        def rerank(q, v):
+            pool = hybrid_search.hybrid_search(db, q, v, max(k, 50), user_id=user_id)
+            return reranker.rerank(q, pool, k)[0]
+
+        available["rerank"] = rerank
+    return {name: available[name] for name in names}
+
+
+def check_exclusions(db, user_id: int, questions: List[str], k: int) -> int:
+    """Lexical results for "<words> -<word>" must never contain <word>; returns the results checked"""
+    checked = 0
+    for question in questions:
+        words = re.findall(r"[a-z]{5,}", question.lower())
+        if len(words) < 3:
+            continue
+        excluded = words[-1]
+        ids = [row["chunk_id"] for row in
+               hybrid_search.lexical_search(db, f"{' '.join(words[:-1])} -{excluded}", k, user_id=user_id)]
+        leaked = db.execute(text(
+            f"SELECT count(*) FROM document_chunks WHERE chunk_id = ANY(:ids) "
+            f"AND content_tsv @@ websearch_to_tsquery('{hybrid_search.TEXT_SEARCH_CONFIG}', :term)"
+        ), {"ids": ids, "term": excluded}).scalar()
+        db.rollback()
+        if leaked:
+            raise AssertionError(f"-{excluded} did not exclude {leaked} of {len(ids)} results for {question!r}")
+        checked += len(ids)
+    return checked
+
+
+def rejected(results: List[Dict], min_similarity: float, min_rank: float) -> bool:
+    if not results:
+        return True
+    similarities = [1.0 - row["distance"] for row in results if row.get("distance") is not None]
+    if similarities:
+        return max(similarities) < min_similarity
+    return max(row["score"] for row in results) < min_rank  # Lexical only: score is ts_rank_cd
+
+
+def score(results: List[Dict], passages: List[str]) -> Dict:
+    found = [row["metadata"].get("passage_id") for row in results]
+    labels = set(passages)
+    first = next((rank for rank, passage_id in enumerate(found, 1) if passage_id in labels), None)
+    return {"recall": len(labels & set(found)) / len(labels), "rr": 1.0 / first if first else 0.0}
+
+
+def evaluate(search, questions: List[Dict], vectors: Dict[str, np.ndarray], min_similarity: float,
+             min_rank: float) -> Dict:
+    latencies, recalls, reciprocal_ranks, rejections = [], [], [], []
+    for item in questions:
+        start = time.perf_counter()
+        results = search(item["question"], vectors[item["question"]])
+        latencies.append((time.perf_counter() - start) * 1000)
+        rejections.append(rejected(results, min_similarity, min_rank))
+        if item["passages"]:
+            scored = score(results, item["passages"])
+            recalls.append(scored["recall"])
+            reciprocal_ranks.append(scored["rr"])
+    off_topic = all(item["off_topic"] for item in questions)
+    metrics = {
+        "questions": len(questions),
+        "labelled": len(recalls),
+        "recall": round(float(np.mean(recalls)), 4) if recalls else None,
+        "mrr": round(float(np.mean(reciprocal_ranks)), 4) if reciprocal_ranks else None,
+        # Off-topic sets should be rejected; anywhere else a rejection is a miss
+        "rejection_rate" if off_topic else "false_rejection_rate": round(float(np.mean(rejections)), 4),
+    }
+    for percentile in (50, 95, 99):
+        metrics[f"p{percentile}_ms"] = round(float(np.percentile(latencies, percentile)), 3)
+    return metrics
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results: Dict, k: int):
+    print(f"{'engine':<8} {'set':<28} {'n':>4} {'lab':>4} {f'recall@{k}':>9} {'mrr':>6} {'reject':>7} "
+          f"{'p50':>8} {'p95':>8} {'p99':>8}")
+    for engine, sets in results.items():
+        for name, m in sets.items():
+            reject = m.get("rejection_rate", m.get("false_rejection_rate"))
+            print(f"{engine:<8} {name:<28} {m['questions']:>4} {m['labelled']:>4} "
+                  f"{m['recall'] if m['recall'] is not None else '-':>9} {m['mrr'] if m['mrr'] is not None else '-':>6} "
+                  f"{reject:>7} {m['p50_ms']:>7.2f}ms {m['p95_ms']:>6.2f}ms {m['p99_ms']:>6.2f}ms")
+
+
+def compare(old: Dict, new: Dict, quality_tolerance: float = 0.005, latency_tolerance: float = 0.2):
+    """Print metrics that moved beyond the tolerances: absolute for rates, relative for latency"""
+    print(f"\nchanges since {old.get('commit')} ({old.get('created_at')})")
+    for engine, sets in new["results"].items():
+        for name, metrics in sets.items():
+            before = old.get("results", {}).get(engine, {}).get(name)
+            if before is None:
+                print(f"{engine:<8} {name:<28} new")
+                continue
+            changes = []
+            for key, value in metrics.items():
+                previous = before.get(key)
+                if key in ("questions", "labelled") or value is None or previous is None:
+                    continue
+                moved = value - previous
+                latency = key.endswith("_ms")
+                if abs(moved) > (latency_tolerance * previous if latency else quality_tolerance):
+                    changes.append(f"{key} {previous} -> {value} ({moved:+.4g})")
+            if changes:
+                print(f"{engine:<8} {name:<28} " + "; ".join(changes))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--engines", nargs="+", choices=ENGINES, default=list(DEFAULT_ENGINES),
+                        help="local writes a throwaway index under LOCAL_INDEX_DIR; rerank needs the ONNX model")
+    parser.add_argument("--min-similarity", type=float, default=0.2,
+                        help="best cosine similarity under which a question counts as rejected")
+    parser.add_argument("--min-rank", type=float, default=0.5,
+                        help="best ts_rank_cd under which a lexical-only result list counts as rejected")
+    parser.add_argument("--embedder", choices=("stub", "openai"), default="stub",
+                        help="stub is deterministic and offline; openai needs OPENAI_API_KEY")
+    parser.add_argument("--out", help="JSON results file, default benchmarks/results/retrieval-<commit>.json")
+    parser.add_argument("--compare", help="earlier JSON results file to diff against")
+    parser.add_argument("--latency-tolerance", type=float, default=0.2,
+                        help="relative latency change --compare ignores as noise")
+    args = parser.parse_args()
+
+    sets = corpus.question_sets()
+    _, passages = corpus.load(corpus.CSV_FILES)
+    passages = list(passages.values())
+    embedder = BatchEmbedder(get_embedder(args.embedder))
+    questions = sorted({item["question"] for items in sets.values() for item in items})
+    passage_vectors, _ = asyncio.run(embedder.embed([passage.text for passage in passages]))
+    question_vectors, _ = asyncio.run(embedder.embed(questions))
+    vectors = {question: np.asarray(vector, dtype=np.float32) for question, vector in zip(questions, question_vectors)}
+    print(f"{len(passages)} passages, {len(questions)} distinct questions in {len(sets)} sets, "
+          f"model {embedder.model}, engines {', '.join(args.engines)}")
+
+    results: Dict[str, Dict] = {}
+    with WorkerSessionLocal() as db:
+        user = models.User(email=f"bench-{uuid.uuid4().hex}@example.com", password_hash="-", name="bench")
+        db.add(user)
+        db.flush()
+        try:
+            load(db, user.id, passages, passage_vectors)
+            if "local" in args.engines:
+                local_index.sync_user(db, user.id)
+            if {"lexical", "hybrid"} & set(args.engines):
+                print(f"-exclusions held on {check_exclusions(db, user.id, questions, args.k)} lexical results")
+            searches = engines(db, user.id, args.k, args.engines)
+            for engine, search in searches.items():
+                search(questions[0], vectors[questions[0]])  # Warm-up: plans, model load, index open
+                results[engine] = {name: evaluate(search, items, vectors, args.min_similarity, args.min_rank)
+                                   for name, items in sets.items()}
+        finally:
+            db.rollback()
+            db.query(models.Document).filter(models.Document.user_id == user.id).delete()
+            db.query(models.User).filter(models.User.id == user.id).delete()
+            db.commit()
+            shutil.rmtree(local_index.user_dir(user.id), ignore_errors=True)
+
+    print_results(results, args.k)
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "model": embedder.model,
+        "k": args.k,
+        "min_similarity": args.min_similarity,
+        "min_rank": args.min_rank,
+        "passages": len(passages),
+        "results": results,
+    }
+    out = Path(args.out) if args.out else RESULTS_DIR / f"retrieval-{commit or 'local'}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2))
+    print(f"\nwrote {out}")
+    if args.compare:
+        compare(json.loads(Path(args.compare).read_text()), report, latency_tolerance=args.latency_tolerance)
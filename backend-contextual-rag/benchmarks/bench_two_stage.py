@@ -0,0 +1,125 @@
+"""Storage, QPS and recall@10 of two-stage search on the compact vector copies.
+
+Embeds the fixture passages (benchmarks/corpus.py) with the configured embedder
+into a throwaway user, optionally padded with --pad random vectors so sizes and
+latencies are closer to a real table, and runs the csv/set1.csv questions
+through: exact full-vector search (the reference), the full-vector HNSW index,
+and 256-d / binary shortlists rescored with the full vector. Recall@k is
+against the exact reference; passage@k against the CSV labels. Everything is
+deleted again. Needs DATABASE_URL with pgvector. Run from backend-contextual-rag/:
+    python -m benchmarks.bench_two_stage --pad 50000
+"""
+import argparse
+import asyncio
+import time
+import uuid
+
+import numpy as np
+from sqlalchemy import text
+
+from app.database import WorkerSessionLocal
+from app.models import models
+from app.services import partitions, vector_index
+from app.services.chunk_writer import write_chunks
+from app.services.embeddings import BatchEmbedder
+from benchmarks import corpus
+
+
+def load(db, user_id: int, passages, passage_vectors, pad: int, rng):
+    partitions.ensure_tenant(db, user_id)  # Before the document row, see partitions.ensure_tenant
+    document = models.Document(user_id=user_id, file_name="bench.pdf", s3_url="local://bench.pdf",
+                               status="processed", meta_data={})
+    db.add(document)
+    db.flush()
+    rows = [
+        {"document_id": document.document_id, "chunk_content": passage.text, "vector": vector,
+         "metadata": {"passage_id": passage.passage_id}, "content_hash": None, "chunk_index": i}
+        for i, (passage, vector) in enumerate(zip(passages, passage_vectors))
+    ]
+    for i in range(pad):
+        vector = rng.standard_normal(len(passage_vectors[0]), dtype=np.float32)
+        rows.append({"document_id": document.document_id, "chunk_content": f"padding {i}",
+                     "vector": vector / np.linalg.norm(vector), "metadata": {}, "content_hash": None,
+                     "chunk_index": len(passages) + i})
+    write_chunks(db, rows)
+    db.commit()
+    db.execute(text("ANALYZE document_chunks"))
+    db.commit()
+
+
+def run(label: str, search, questions, question_vectors, reference, k: int):
+    latencies, recalls, hits = [], [], []
+    for question, vector, expected in zip(questions, question_vectors, reference):
+        start = time.perf_counter()
+        results = search(vector)
+        latencies.append(time.perf_counter() - start)
+        found = [row["chunk_id"] for row in results]
+        recalls.append(len(set(found) & expected) / max(1, len(expected)))
+        labelled = set(question.passage_ids)
+        hits.append(any(row["metadata"].get("passage_id") in labelled for row in results))
+    qps = len(latencies) / sum(latencies)
+    print(f"{label:<22} qps {qps:8.1f}  p50 {np.percentile(latencies, 50) * 1000:7.2f}ms  "
+          f"recall@{k} {np.mean(recalls):.3f}  passage@{k} {np.mean(hits):.3f}")
+    return qps, float(np.mean(recalls))
+
+
+def report_storage(db):
+    sizes = vector_index.storage(db)
+    full = sizes["full"]["column_bytes"] + sizes["full"]["index_bytes"]
+    print(f"{sizes['rows']} vectors")
+    for name in ("full", "short", "binary"):
+        column, index = sizes[name]["column_bytes"], sizes[name]["index_bytes"]
+        print(f"{name:<8} column {column / 2 ** 20:8.1f} MiB  index {index / 2 ** 20:8.1f} MiB  "
+              f"per row {column / max(1, sizes['rows']):7.0f} B  "
+              f"{1 - (column + index) / max(1, full):6.1%} smaller than full")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", default=str(corpus.CSV_FILES[0]))
+    parser.add_argument("--pad", type=int, default=0, help="extra random vectors to add to the table")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--oversample", type=int, nargs="+", default=[4, 10, 20])
+    args = parser.parse_args()
+
+    questions, passages = corpus.load(corpus.CSV_FILES)
+    questions = [q for q in corpus.load([args.csv])[0] if q.relevant]
+    passages = list(passages.values())
+    embedder = BatchEmbedder()
+    passage_vectors, _ = asyncio.run(embedder.embed([passage.text for passage in passages]))
+    question_vectors, _ = asyncio.run(embedder.embed([q.question for q in questions]))
+    question_vectors = [np.asarray(vector, dtype=np.float32) for vector in question_vectors]
+    print(f"{len(questions)} questions from {args.csv}, {len(passages)} passages + {args.pad} padding, "
+          f"model {embedder.model}")
+
+    with WorkerSessionLocal() as db:
+        user = models.User(email=f"bench-{uuid.uuid4().hex}@example.com", password_hash="-", name="bench")
+        db.add(user)
+        db.flush()
+        try:
+            start = time.perf_counter()
+            load(db, user.id, passages, passage_vectors, args.pad, np.random.default_rng(0))
+            print(f"loaded in {time.perf_counter() - start:.1f}s")
+            report_storage(db)
+
+            k = args.k
+            reference = [
+                {row["chunk_id"] for row in vector_index.search(db, vector, k, exact=True)}
+                for vector in question_vectors
+            ]
+            base_qps, _ = run("full exact", lambda v: vector_index.search(db, v, k, exact=True),
+                              questions, question_vectors, reference, k)
+            run("full hnsw", lambda v: vector_index.search(db, v, k), questions, question_vectors, reference, k)
+            for coarse in vector_index.COARSE:
+                for oversample in args.oversample:
+                    qps, recall = run(
+                        f"{coarse} x{oversample} + rescore",
+                        lambda v: vector_index.two_stage_search(db, v, k, coarse=coarse, candidates=k * oversample),
+                        questions, question_vectors, reference, k,
+                    )
+                    print(f"{'':<22} {qps / base_qps:5.2f}x qps of exact, recall@{k} lost {1 - recall:.3f}")
+        finally:
+            db.rollback()
+            db.query(models.Document).filter(models.Document.user_id == user.id).delete()
+            db.query(models.User).filter(models.User.id == user.id).delete()
+            db.commit()
@@ -0,0 +1,111 @@
+"""Labelled questions and fixture passages from csv/set1.csv and csv/pv2_set2.csv.
+
+Each CSV row holds a question, the generated response, whether the retrieved
+context was relevant, and the full prompt that was sent, which starts with
+"DOCUMENT: <passage>; metadata: {...} <passage>; metadata: {...} ...".
+The passages in that prompt are the retrieval results of the old pipeline, so
+they double as a small fixture corpus and, for relevant rows, as relevance labels.
+"""
+import csv
+import re
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import set1
+
+ROOT = Path(__file__).resolve().parent.parent
+CSV_FILES = [ROOT / "csv" / "set1.csv", ROOT / "csv" / "pv2_set2.csv"]
+
+_META_RE = re.compile(r";\s*metadata:\s*\{([^}]*)\}")
+_FILENAME_RE = re.compile(r"'filename':\s*'([^']*)'")
+_PAGE_RE = re.compile(r"'page_number':\s*(\d+)")
+_CHUNK_RE = re.compile(r"'[^']*/[^']*':\s*'(\d+)'")
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+@dataclass
+class Passage:
+    passage_id: str
+    filename: str
+    page: Optional[int]
+    text: str
+
+
+@dataclass
+class LabelledQuestion:
+    question: str
+    relevant: bool
+    response: str
+    passage_ids: List[str] = field(default_factory=list)
+
+    @property
+    def source_files(self) -> List[str]:
+        return sorted({passage_id.split("#")[0] for passage_id in self.passage_ids})
+
+
+def parse_passages(content: str) -> List[Passage]:
+    text = content[len("DOCUMENT:"):] if content.startswith("DOCUMENT:") else content
+    passages, position = [], 0
+    for match in _META_RE.finditer(text):
+        body = text[position:match.end() - len(match.group(0))].strip()
+        position = match.end()
+        meta = match.group(1)
+        filename = _FILENAME_RE.search(meta)
+        if not body or not filename:
+            continue
+        page = _PAGE_RE.search(meta)
+        chunk = _CHUNK_RE.search(meta)
+        passage_id = f"{filename.group(1)}#{chunk.group(1) if chunk else len(passages)}"
+        passages.append(Passage(passage_id, filename.group(1), int(page.group(1)) if page else None, body))
+    return passages
+
+
+def load(paths=CSV_FILES):
+    """Return (questions, passages by id) for the labelled CSVs"""
+    questions: List[LabelledQuestion] = []
+    passages: Dict[str, Passage] = {}
+    for path in paths:
+        with open(path, encoding="utf-8") as handle:
+            for row in csv.DictReader(handle):
+                found = parse_passages(row["content"])
+                for passage in found:
+                    passages.setdefault(passage.passage_id, passage)
+                questions.append(LabelledQuestion(
+                    question=row["question"],
+                    relevant=row["relevant"].strip().lower() == "true",
+                    response=row["response"],
+                    passage_ids=list(dict.fromkeys(passage.passage_id for passage in found)),
+                ))
+    return questions, passages
+
+
+def question_sets() -> Dict[str, List[Dict]]:
+    """Questions per set, each with the labelled passage ids (empty when unknown) and whether it is off-topic"""
+    labelled: Dict[str, List[str]] = {}
+    sets = {}
+    for path in CSV_FILES:
+        rows = [q for q in load([path])[0] if q.relevant and q.passage_ids]
+        for q in rows:
+            labelled.setdefault(q.question.strip(), q.passage_ids)
+        sets[f"csv/{path.name}"] = [{"question": q.question, "passages": q.passage_ids, "off_topic": False}
+                                    for q in rows]
+    for name in ("question_set_1", "question_set_2", "false_positives"):
+        sets[f"set1.py/{name}"] = [
+            {"question": question, "passages": labelled.get(question.strip(), []),
+             "off_topic": name == "false_positives"}
+            for question in getattr(set1, name)
+        ]
+    return sets
+
+
+def words(text: str) -> List[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+def coverage(passage: str, chunk: str) -> float:
+    """Share of the passage's distinct words found in the chunk, to match re-chunked text to labels"""
+    passage_words = set(words(passage))
+    if not passage_words:
+        return 0.0
+    return len(passage_words & set(words(chunk))) / len(passage_words)
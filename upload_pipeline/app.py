@@ -3,6 +3,7 @@ from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.responses import HTMLResponse
 from dotenv import load_dotenv
 import psycopg
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
 import os
 import asyncio
 import time
@@ -16,11 +17,53 @@ STARTUP_COMPLETE_TIME = None
 # Load environment variables
 load_dotenv()
 
+# Get database URL from environment variables
+DATABASE_URL = os.getenv("DATABASE_URL")
+print(f"Server starting up at: {time.strftime('%Y-%m-%d %H:%M:%S')}")
+# print(f"Using DATABASE_URL: {DATABASE_URL}")
+
+# One pool per process: connections (and their TLS/auth handshakes) are reused across requests
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "240"))  # Seconds before an idle connection above min_size closes
+DB_POOL_CHECK_INTERVAL = float(os.getenv("DB_POOL_CHECK_INTERVAL", "45"))  # Seconds between health checks of idle connections
+DB_POOL_CHECK_ON_ACQUIRE = os.getenv("DB_POOL_CHECK_ON_ACQUIRE", "false").lower() == "true"  # One extra round trip per request
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "20"))  # Cold Neon computes take a few seconds to wake
+DB_ACQUIRE_TIMEOUT = float(os.getenv("DB_ACQUIRE_TIMEOUT", "20"))
+DB_QUERY_TIMEOUT = float(os.getenv("DB_QUERY_TIMEOUT", "20"))
+# /db-schema entries expire after the TTL. With DB_SCHEMA_EVENT_TRIGGER they are instead kept until
+# the schema_change_notify event trigger reports a change, while the LISTEN connection is up. The
+# trigger is database-wide, so it is installed once by a superuser (see schemas.md), never by the app.
+# LISTEN needs a direct connection: point DATABASE_URL at Neon's non-pooled host.
+DB_SCHEMA_EVENT_TRIGGER = os.getenv("DB_SCHEMA_EVENT_TRIGGER", "false").lower() == "true"
+DB_SCHEMA_CACHE_TTL = float(os.getenv("DB_SCHEMA_CACHE_TTL", "300"))
+SCHEMA_CHANNEL = "schema_changed"
+
+db_pool = None
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    global STARTUP_COMPLETE_TIME
+    global STARTUP_COMPLETE_TIME, db_pool
+    background_tasks = []
     try:
+        # Connections are made in the background, startup does not wait for the database
+        db_pool = AsyncConnectionPool(
+            DATABASE_URL,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            max_idle=DB_POOL_MAX_IDLE,
+            timeout=DB_ACQUIRE_TIMEOUT,
+            check=AsyncConnectionPool.check_connection if DB_POOL_CHECK_ON_ACQUIRE else None,
+            kwargs={
+                "connect_timeout": DB_CONNECT_TIMEOUT,
+                # The server gives up on a statement too, not only the waiting handler
+                "options": f"-c statement_timeout={int(DB_QUERY_TIMEOUT * 1000)}",
+            },
+            open=False,
+        )
+        await db_pool.open()
+
         # Startup code
         startup_duration = time.time() - SERVER_START_TIME
         STARTUP_COMPLETE_TIME = time.time()
@@ -29,8 +72,10 @@ async def lifespan(app: FastAPI):
         print(f"Startup time: {time.strftime('%Y-%m-%d %H:%M:%S')}")
         print(f"{'='*50}\n")
         
-        # Start the DB warm-up task
-        warm_up_task = asyncio.create_task(keep_db_warm())
+        # Periodically ping idle connections, replacing broken ones
+        background_tasks.append(asyncio.create_task(check_db_pool()))
+        if DB_SCHEMA_EVENT_TRIGGER:
+            background_tasks.append(asyncio.create_task(listen_for_schema_changes()))
         
         yield  # Server is running
         
@@ -40,11 +85,14 @@ async def lifespan(app: FastAPI):
     finally:
         # Shutdown
         try:
-            warm_up_task.cancel()  # Cancel the warm-up task
-            try:
-                await warm_up_task  # Wait for task to complete cancellation
-            except asyncio.CancelledError:
-                pass  # Expected cancellation
+            for task in background_tasks:
+                task.cancel()
+                try:
+                    await task  # Wait for task to complete cancellation
+                except asyncio.CancelledError:
+                    pass  # Expected cancellation
+            if db_pool is not None:
+                await db_pool.close()
                 
             shutdown_time = time.time()
             total_uptime = shutdown_time - SERVER_START_TIME
@@ -55,24 +103,61 @@ async def lifespan(app: FastAPI):
         except Exception as e:
             print(f"Shutdown error: {e}")
 
-# Define the warm-up function
-async def keep_db_warm():
+# Replaces the old warm-up ping: also keeps the pooled connections (and the Neon compute) alive
+async def check_db_pool():
     while True:
+        await asyncio.sleep(DB_POOL_CHECK_INTERVAL)
         try:
-            print("Keeping database connection warm...")
-            async with timeout_context(20):
-                with psycopg.connect(DATABASE_URL) as conn:
-                    with conn.cursor() as cur:
-                        cur.execute("SELECT 1")
-            await asyncio.sleep(45)
+            # Pings every idle connection; broken ones are discarded and reconnected in the background
+            await asyncio.wait_for(db_pool.check(), timeout=DB_QUERY_TIMEOUT)
         except Exception as e:
-            print(f"Warm-up error: {e}")
-            await asyncio.sleep(5)
+            print(f"Pool health check error: {e}")
 
-# Get database URL from environment variables
-DATABASE_URL = os.getenv("DATABASE_URL")
-print(f"Server starting up at: {time.strftime('%Y-%m-%d %H:%M:%S')}")
-# print(f"Using DATABASE_URL: {DATABASE_URL}")
+# Catalog of the public schema, see get_db_schema
+schema_cache = {"schema": None, "loaded_at": 0.0, "version": 0}
+schema_cache_lock = asyncio.Lock()
+schema_listening = False
+
+def invalidate_schema_cache(reason):
+    schema_cache["version"] += 1
+    schema_cache["schema"] = None
+    print(f"Schema cache invalidated: {reason}")
+
+async def has_schema_trigger():
+    """Whether the schema_change_notify event trigger from schemas.md is installed and enabled"""
+    try:
+        async with db_connection() as conn:
+            cur = await with_timeout(conn.execute(
+                "SELECT 1 FROM pg_event_trigger WHERE evtname = 'schema_change_notify' AND evtenabled <> 'D'"
+            ))
+            if await cur.fetchone() is not None:
+                return True
+        print(f"No schema_change_notify event trigger, /db-schema is cached for {DB_SCHEMA_CACHE_TTL}s instead")
+    except Exception as e:
+        print(f"Event trigger check failed, /db-schema is cached for {DB_SCHEMA_CACHE_TTL}s instead: {e}")
+    return False
+
+async def listen_for_schema_changes():
+    global schema_listening
+    if not await has_schema_trigger():
+        return
+    while True:
+        try:
+            conn = await psycopg.AsyncConnection.connect(
+                DATABASE_URL, autocommit=True, connect_timeout=DB_CONNECT_TIMEOUT
+            )
+            async with conn:
+                await conn.execute(f"LISTEN {SCHEMA_CHANNEL}")
+                # Changes made while nobody was listening went unnoticed
+                invalidate_schema_cache("listener connected")
+                schema_listening = True
+                async for notify in conn.notifies():
+                    invalidate_schema_cache(notify.payload)
+        except Exception as e:
+            print(f"Schema listener error: {e}")
+        finally:
+            schema_listening = False
+        await asyncio.sleep(5)
 
 app = FastAPI(lifespan=lifespan)
 
@@ -86,11 +171,22 @@ app.add_middleware(
 )
 
 @asynccontextmanager
-async def timeout_context(seconds):
+async def db_connection(timeout=DB_ACQUIRE_TIMEOUT):
+    """A pooled connection, or a 504 when none is free within timeout seconds"""
+    if db_pool is None:
+        raise HTTPException(status_code=503, detail="Database pool is not open")
     try:
-        yield await asyncio.wait_for(asyncio.sleep(0), timeout=seconds)
+        async with db_pool.connection(timeout=timeout) as conn:
+            yield conn
+    except PoolTimeout:
+        raise HTTPException(status_code=504, detail=f"No database connection available after {timeout} seconds")
+
+async def with_timeout(awaitable, seconds=DB_QUERY_TIMEOUT):
+    """Cancelling a running query also cancels it on the server; the pool discards that connection"""
+    try:
+        return await asyncio.wait_for(awaitable, timeout=seconds)
     except asyncio.TimeoutError:
-        raise HTTPException(status_code=504, detail=f"Database connection timed out after {seconds} seconds")
+        raise HTTPException(status_code=504, detail=f"Database query timed out after {seconds} seconds")
 
 @app.get("/", response_class=HTMLResponse)
 async def main():
@@ -118,47 +214,44 @@ async def upload_file(file: UploadFile = File(...)):
 async def test_db():
     connection_start_time = time.time()
     print(f"Starting database connection test at: {time.strftime('%Y-%m-%d %H:%M:%S')}")
-    print(f"Testing database connection: {DATABASE_URL}")
     
-    async with timeout_context(20):  # Increased timeout to 20 seconds for cold starts
-        try:
-            # Test the connection by making a simple query
-            conn_params = psycopg.conninfo.conninfo_to_dict(DATABASE_URL)
-            conn_params['connect_timeout'] = 20  # PostgreSQL native timeout
+    try:
+        # Test the connection by making a simple query
+        async with db_connection() as conn:
+            connection_time = time.time() - connection_start_time
+            print(f"Got a pooled connection after {connection_time:.2f} seconds")
             
-            with psycopg.connect(**conn_params) as conn:
-                connection_time = time.time() - connection_start_time
-                print(f"Connected to database after {connection_time:.2f} seconds")
+            query_start_time = time.time()
+            async with conn.cursor() as cur:
+                await with_timeout(cur.execute("SELECT 1"))
+                result = await cur.fetchone()
+                query_time = time.time() - query_start_time
+                
+                print(f"Query result: {result}")
+                print(f"Query executed in {query_time:.2f} seconds")
                 
-                query_start_time = time.time()
-                with conn.cursor() as cur:
-                    cur.execute("SELECT 1")
-                    result = cur.fetchone()
-                    query_time = time.time() - query_start_time
-                    
-                    print(f"Query result: {result}")
-                    print(f"Query executed in {query_time:.2f} seconds")
-                    
-                    total_time = time.time() - connection_start_time
-                    return {
-                        "status": "success",
-                        "message": "Database connection successful!",
-                        "timing": {
-                            "connection_time": f"{connection_time:.2f}s",
-                            "query_time": f"{query_time:.2f}s",
-                            "total_time": f"{total_time:.2f}s"
-                        }
+                total_time = time.time() - connection_start_time
+                return {
+                    "status": "success",
+                    "message": "Database connection successful!",
+                    "timing": {
+                        "connection_time": f"{connection_time:.2f}s",
+                        "query_time": f"{query_time:.2f}s",
+                        "total_time": f"{total_time:.2f}s"
                     }
-        except Exception as e:
-            error_time = time.time() - connection_start_time
-            print(f"Error occurred after {error_time:.2f} seconds: {str(e)}")
-            raise HTTPException(
-                status_code=500, 
-                detail={
-                    "error": f"Database connection failed: {str(e)}",
-                    "time_elapsed": f"{error_time:.2f}s"
                 }
-            )
+    except HTTPException:
+        raise
+    except Exception as e:
+        error_time = time.time() - connection_start_time
+        print(f"Error occurred after {error_time:.2f} seconds: {str(e)}")
+        raise HTTPException(
+            status_code=500, 
+            detail={
+                "error": f"Database connection failed: {str(e)}",
+                "time_elapsed": f"{error_time:.2f}s"
+            }
+        )
 
 @app.get("/server-info")
 async def server_info():
@@ -172,118 +265,123 @@ async def server_info():
             "current_time": time.strftime('%Y-%m-%d %H:%M:%S'),
             "uptime_seconds": f"{current_time - SERVER_START_TIME:.3f}",
             "uptime_since_ready": f"{current_time - STARTUP_COMPLETE_TIME:.3f}" if STARTUP_COMPLETE_TIME else "N/A"
-        }
+        },
+        # pool_size, pool_available, requests_waiting, connections_ms, ... (psycopg_pool counters since start)
+        "db_pool": db_pool.get_stats() if db_pool is not None else None
     }
 
+# Tables, views and partitions of the public schema, with columns, primary and foreign keys, in one round trip
+SCHEMA_QUERY = """
+    SELECT
+        c.relname AS table_name,
+        CASE c.relkind
+            WHEN 'v' THEN 'VIEW'
+            WHEN 'm' THEN 'MATERIALIZED VIEW'
+            WHEN 'f' THEN 'FOREIGN'
+            ELSE 'BASE TABLE'
+        END AS table_type,
+        parent.relname AS partition_of,
+        coalesce(cols.columns, '[]') AS columns,
+        coalesce(pk.columns, '[]') AS primary_keys,
+        coalesce(fk.foreign_keys, '[]') AS foreign_keys
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    LEFT JOIN pg_inherits i ON c.relispartition AND i.inhrelid = c.oid
+    LEFT JOIN pg_class parent ON parent.oid = i.inhparent
+    LEFT JOIN LATERAL (
+        SELECT json_agg(json_build_object(
+            'name', a.attname,
+            'data_type', format_type(a.atttypid, a.atttypmod),
+            'is_nullable', CASE WHEN a.attnotnull THEN 'NO' ELSE 'YES' END,
+            'default', pg_get_expr(d.adbin, d.adrelid)
+        ) ORDER BY a.attnum) AS columns
+        FROM pg_attribute a
+        LEFT JOIN pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+        WHERE a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+    ) cols ON true
+    LEFT JOIN LATERAL (
+        SELECT json_agg(a.attname ORDER BY k.ord) AS columns
+        FROM pg_constraint con
+        CROSS JOIN unnest(con.conkey) WITH ORDINALITY AS k(attnum, ord)
+        JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum
+        WHERE con.conrelid = c.oid AND con.contype = 'p'
+    ) pk ON true
+    LEFT JOIN LATERAL (
+        SELECT json_agg(json_build_object(
+            'column', a.attname,
+            'references_table', ref.relname,
+            'references_column', ra.attname
+        ) ORDER BY con.conname, k.ord) AS foreign_keys
+        FROM pg_constraint con
+        CROSS JOIN unnest(con.conkey, con.confkey) WITH ORDINALITY AS k(attnum, ref_attnum, ord)
+        JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum
+        JOIN pg_class ref ON ref.oid = con.confrelid
+        JOIN pg_attribute ra ON ra.attrelid = con.confrelid AND ra.attnum = k.ref_attnum
+        WHERE con.conrelid = c.oid AND con.contype = 'f'
+    ) fk ON true
+    WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p', 'v', 'm', 'f')
+    ORDER BY c.relname;
+"""
+
+async def load_db_schema():
+    async with db_connection() as conn:
+        cur = await with_timeout(conn.execute(SCHEMA_QUERY))
+        rows = await cur.fetchall()
+    schema_info = {}
+    for table_name, table_type, partition_of, columns, primary_keys, foreign_keys in rows:
+        schema_info[table_name] = {
+            "type": table_type,
+            "partition_of": partition_of,
+            "columns": [{**col, "is_primary_key": col["name"] in primary_keys} for col in columns],
+            "primary_keys": primary_keys,
+            "foreign_keys": foreign_keys,
+        }
+    return schema_info
+
+def cached_db_schema():
+    if schema_cache["schema"] is None:
+        return None
+    if not schema_listening and time.time() - schema_cache["loaded_at"] > DB_SCHEMA_CACHE_TTL:
+        return None
+    return schema_cache["schema"]
+
 @app.get("/db-schema")
-async def get_db_schema():
-    connection_start_time = time.time()
-    print(f"Starting schema inspection at: {time.strftime('%Y-%m-%d %H:%M:%S')}")
+async def get_db_schema(refresh: bool = False):
+    connection_start_time = time.perf_counter()
     
-    async with timeout_context(20):
-        try:
-            conn_params = psycopg.conninfo.conninfo_to_dict(DATABASE_URL)
-            conn_params['connect_timeout'] = 20
-            
-            with psycopg.connect(**conn_params) as conn:
-                with conn.cursor() as cur:
-                    # Get all tables
-                    cur.execute("""
-                        SELECT 
-                            t.table_name,
-                            t.table_type
-                        FROM information_schema.tables t
-                        WHERE t.table_schema = 'public'
-                        ORDER BY t.table_name;
-                    """)
-                    tables = cur.fetchall()
-                    
-                    schema_info = {}
-                    
-                    # For each table, get its columns and constraints
-                    for table_name, table_type in tables:
-                        # Get columns
-                        cur.execute("""
-                            SELECT 
-                                column_name,
-                                data_type,
-                                is_nullable,
-                                column_default
-                            FROM information_schema.columns
-                            WHERE table_schema = 'public'
-                                AND table_name = %s
-                            ORDER BY ordinal_position;
-                        """, (table_name,))
-                        columns = cur.fetchall()
-                        
-                        # Get primary keys
-                        cur.execute("""
-                            SELECT
-                                kcu.column_name
-                            FROM information_schema.table_constraints tc
-                            JOIN information_schema.key_column_usage kcu
-                                ON tc.constraint_name = kcu.constraint_name
-                            WHERE tc.table_schema = 'public'
-                                AND tc.table_name = %s
-                                AND tc.constraint_type = 'PRIMARY KEY';
-                        """, (table_name,))
-                        primary_keys = [pk[0] for pk in cur.fetchall()]
-                        
-                        # Get foreign keys
-                        cur.execute("""
-                            SELECT
-                                kcu.column_name,
-                                ccu.table_name AS foreign_table_name,
-                                ccu.column_name AS foreign_column_name
-                            FROM information_schema.table_constraints tc
-                            JOIN information_schema.key_column_usage kcu
-                                ON tc.constraint_name = kcu.constraint_name
-                            JOIN information_schema.constraint_column_usage ccu
-                                ON ccu.constraint_name = tc.constraint_name
-                            WHERE tc.table_schema = 'public'
-                                AND tc.table_name = %s
-                                AND tc.constraint_type = 'FOREIGN KEY';
-                        """, (table_name,))
-                        foreign_keys = cur.fetchall()
-                        
-                        # Structure the information
-                        schema_info[table_name] = {
-                            "type": table_type,
-                            "columns": [
-                                {
-                                    "name": col[0],
-                                    "data_type": col[1],
-                                    "is_nullable": col[2],
-                                    "default": col[3],
-                                    "is_primary_key": col[0] in primary_keys
-                                }
-                                for col in columns
-                            ],
-                            "primary_keys": primary_keys,
-                            "foreign_keys": [
-                                {
-                                    "column": fk[0],
-                                    "references_table": fk[1],
-                                    "references_column": fk[2]
-                                }
-                                for fk in foreign_keys
-                            ]
-                        }
-                    
-                    total_time = time.time() - connection_start_time
-                    return {
-                        "status": "success",
-                        "execution_time": f"{total_time:.2f}s",
-                        "schema": schema_info
-                    }
-                    
-        except Exception as e:
-            error_time = time.time() - connection_start_time
-            print(f"Schema inspection error after {error_time:.2f} seconds: {str(e)}")
-            raise HTTPException(
-                status_code=500,
-                detail={
-                    "error": f"Schema inspection failed: {str(e)}",
-                    "time_elapsed": f"{error_time:.2f}s"
-                }
-            )
+    try:
+        schema_info = None if refresh else cached_db_schema()
+        cached = schema_info is not None
+        if not cached:
+            print(f"Starting schema inspection at: {time.strftime('%Y-%m-%d %H:%M:%S')}")
+            # Concurrent misses wait for one load instead of each querying the catalog
+            async with schema_cache_lock:
+                schema_info = None if refresh else cached_db_schema()
+                if schema_info is None:
+                    version = schema_cache["version"]
+                    schema_info = await load_db_schema()
+                    # A DDL notification during the load makes this result stale already
+                    if schema_cache["version"] == version:
+                        schema_cache.update(schema=schema_info, loaded_at=time.time())
+        
+        total_time = time.perf_counter() - connection_start_time
+        return {
+            "status": "success",
+            "cached": cached,
+            "execution_time": f"{total_time:.2f}s",
+            "execution_ms": round(total_time * 1000, 3),
+            "schema": schema_info
+        }
+                
+    except HTTPException:
+        raise
+    except Exception as e:
+        error_time = time.perf_counter() - connection_start_time
+        print(f"Schema inspection error after {error_time:.2f} seconds: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail={
+                "error": f"Schema inspection failed: {str(e)}",
+                "time_elapsed": f"{error_time:.2f}s"
+            }
+        )